@@ -0,0 +1,88 @@
+"""Micro-benchmark the blank-frame detector against the old is_black_image().
+
+Usage: python benchmarks/bench_blank_detection.py [--width W] [--height H] [--repeat N]
+
+Synthetic BGRA frames are generated for typical cases: a black screen, a
+near-black screen with noise, a solid colour, a busy desktop and a black
+screen with one small window. No display is needed.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from PIL import Image, ImageChops
+from frames import Frame
+from blank_detection import SampledBlankDetector
+
+
+def legacy_is_black_image(img):
+    """The pre-detector implementation, kept here for comparison."""
+    black = Image.new('RGB', img.size, (0, 0, 0))
+    difference = ImageChops.difference(img, black)
+    return not difference.getbbox()
+
+
+def make_frames(width, height):
+    """Return (name, Frame) pairs for the benchmark cases."""
+    pixels = width * height
+    rng = random.Random(0)
+    black = bytes([0, 0, 0, 255]) * pixels
+
+    near_black = bytearray(black)
+    for offset in range(0, len(near_black), 4 * 7):
+        near_black[offset + rng.randrange(3)] = rng.randrange(12)
+
+    solid = bytes([160, 96, 32, 255]) * pixels
+    busy = bytes(rng.getrandbits(8) for _ in range(width * 4)) * height
+
+    window = bytearray(black)
+    stride = width * 4
+    for y in range(height // 2, height // 2 + 40):
+        start = y * stride + (width // 2) * 4
+        window[start:start + 80 * 4] = bytes([255, 255, 255, 255]) * 80
+
+    cases = [('black', black), ('near-black', near_black), ('solid', solid), ('busy', busy), ('small window', window)]
+    return [(name, Frame(1, width, height, bytearray(data))) for name, data in cases]
+
+
+def timeit(func, repeat):
+    """Return the best time of `repeat` calls in milliseconds and the last result."""
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=3840)
+    parser.add_argument('--height', type=int, default=2160)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    detectors = [
+        ('sampled (default)', SampledBlankDetector()),
+        ('exact black', SampledBlankDetector(black_threshold=0, detect_solid=False, sample_step=1)),
+    ]
+    print(f"{args.width}x{args.height}, best of {args.repeat}")
+    print(f"{'case':<14} {'implementation':<26} {'ms':>9} {'blank':>6}")
+    for name, frame in make_frames(args.width, args.height):
+        image = frame.to_image()
+        ms, blank = timeit(lambda: legacy_is_black_image(image), args.repeat)
+        print(f"{name:<14} {'legacy (decoded image)':<26} {ms:>9.2f} {str(blank):>6}")
+        ms, blank = timeit(lambda: legacy_is_black_image(frame.to_image()), args.repeat)
+        print(f"{name:<14} {'legacy (incl. decode)':<26} {ms:>9.2f} {str(blank):>6}")
+        for label, detector in detectors:
+            ms, blank = timeit(lambda: detector.is_blank(frame), args.repeat)
+            print(f"{name:<14} {label:<26} {ms:>9.2f} {str(blank):>6}")
+
+
+if __name__ == '__main__':
+    main()
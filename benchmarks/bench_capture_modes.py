@@ -0,0 +1,66 @@
+"""Compare per-monitor grabs with a single virtual-screen grab.
+
+Usage: python benchmarks/bench_capture_modes.py [--ticks N]
+
+For every monitor count from 1 to the number of attached monitors, this
+measures the legacy path (a new mss session and one grab per monitor on every
+tick) against MssFrameSource in both capture modes with a long-lived session.
+It needs a real display.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from mss import mss
+from frame_sources import MssFrameSource, CAPTURE_MODE_PER_MONITOR, CAPTURE_MODE_VIRTUAL_SCREEN
+
+
+def legacy_tick(indexes):
+    """Grab the given monitors the way the timer callback used to: one session per tick."""
+    with mss() as sct:
+        for i in indexes:
+            sct.grab(sct.monitors[i])
+
+
+def measure(tick, indexes, ticks):
+    """Return per-tick timings in milliseconds."""
+    tick(indexes)  # warm-up
+    timings = []
+    for _ in range(ticks):
+        start = time.perf_counter()
+        tick(indexes)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ticks', type=int, default=20)
+    args = parser.parse_args()
+
+    with mss() as sct:
+        monitor_count = len(sct.monitors) - 1
+
+    print(f"{'monitors':>8} {'mode':<24} {'median ms':>10} {'p95 ms':>10}")
+    for count in range(1, monitor_count + 1):
+        indexes = list(range(1, count + 1))
+        runs = [('legacy (session per tick)', legacy_tick)]
+        sources = []
+        for mode in (CAPTURE_MODE_PER_MONITOR, CAPTURE_MODE_VIRTUAL_SCREEN):
+            source = MssFrameSource(mode)
+            sources.append(source)
+            runs.append((mode, source.grab))
+        for name, tick in runs:
+            timings = sorted(measure(tick, indexes, args.ticks))
+            p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+            print(f"{count:>8} {name:<24} {statistics.median(timings):>10.2f} {p95:>10.2f}")
+        for source in sources:
+            source.close()
+
+
+if __name__ == '__main__':
+    main()
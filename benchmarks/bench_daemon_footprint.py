@@ -0,0 +1,115 @@
+"""Measure startup time and memory of the headless capture daemon and of the GUI client.
+
+Usage: python benchmarks/bench_daemon_footprint.py [--runs N] [--settle SECONDS] [--offscreen]
+
+Each run starts a daemon on a private control socket and waits until it
+answers a status request, then starts the GUI attached to that daemon and
+waits until its window exists. Resident memory (RSS, and USS where the OS
+reports it) is sampled once both processes have settled. The daemon must not
+load PyQt5 at all; the GUI figures are what capture used to cost before the
+split. Use --offscreen to run the GUI without a display.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src')
+sys.path.insert(0, SRC)
+
+import psutil
+from ipc import ControlClient, ADDRESS_VARIABLE
+
+GUI_SNIPPET = """
+import sys
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+import main
+window = main.WorkTrackerApp()
+window.show()
+print('ready', flush=True)
+app.exec_()
+"""
+
+
+def memory(pid):
+    """Return (RSS, USS or None) of a process in MB."""
+    process = psutil.Process(pid)
+    try:
+        info = process.memory_full_info()
+        return info.rss / 2 ** 20, info.uss / 2 ** 20
+    except (psutil.AccessDenied, AttributeError):
+        return process.memory_info().rss / 2 ** 20, None
+
+
+def start_daemon(folder, env):
+    """Start a daemon and return (process, seconds until it answered)."""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(SRC, 'daemon.py'), 'run',
+                                '--settings', os.path.join(folder, 'app_settings.json')], cwd=folder, env=env)
+    client = ControlClient(env[ADDRESS_VARIABLE])
+    while True:
+        try:
+            client.request('status')
+            break
+        except ConnectionError:
+            if process.poll() is not None:
+                raise RuntimeError("the daemon exited during startup")
+            time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    client.close()
+    return process, elapsed
+
+
+def start_gui(folder, env):
+    """Start the GUI and return (process, seconds until its window was shown)."""
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, '-c', GUI_SNIPPET], cwd=folder, env=env,
+                               stdout=subprocess.PIPE, text=True)
+    if process.stdout.readline().strip() != 'ready':
+        raise RuntimeError("the GUI exited during startup")
+    return process, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--settle', type=float, default=2.0)
+    parser.add_argument('--offscreen', action='store_true', help="run the GUI with QT_QPA_PLATFORM=offscreen")
+    args = parser.parse_args()
+
+    results = {'daemon': [], 'gui': []}
+    for _ in range(args.runs):
+        with tempfile.TemporaryDirectory() as folder:
+            env = dict(os.environ, PYTHONPATH=SRC)
+            env[ADDRESS_VARIABLE] = os.path.join(folder, 'control.sock')
+            if args.offscreen:
+                env['QT_QPA_PLATFORM'] = 'offscreen'
+            daemon, daemon_seconds = start_daemon(folder, env)
+            try:
+                gui, gui_seconds = start_gui(folder, env)
+                try:
+                    time.sleep(args.settle)
+                    results['daemon'].append((daemon_seconds, *memory(daemon.pid)))
+                    results['gui'].append((gui_seconds, *memory(gui.pid)))
+                finally:
+                    gui.terminate()
+                    gui.wait()
+            finally:
+                daemon.terminate()
+                daemon.wait(10)
+
+    print(f"{'process':<8} {'startup s':>10} {'RSS MB':>8} {'USS MB':>8}")
+    for name, samples in results.items():
+        startup = statistics.median(sample[0] for sample in samples)
+        rss = statistics.median(sample[1] for sample in samples)
+        uss = [sample[2] for sample in samples if sample[2] is not None]
+        uss_text = f"{statistics.median(uss):>8.1f}" if uss else f"{'n/a':>8}"
+        print(f"{name:<8} {startup:>10.3f} {rss:>8.1f} {uss_text}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""Compare encoding a capture tick on threads with encoding it in worker processes.
+
+Usage: python benchmarks/bench_encode_backends.py FOLDER [--monitors N] [--ticks N] [--format PNG|JPEG|WEBP|WEBP_LOSSLESS]
+
+Frames recorded in FOLDER stand in for the monitors of one tick. For every
+monitor count from 1 to N, each backend encodes --ticks ticks the way the
+capture engine does (one dispatch thread per frame) and the median tick
+time is reported, together with how busy each worker was. On a machine
+with more cores than monitors the process backend should finish a tick in
+about the time of its slowest frame.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from bench_encoders import recorded_frames
+from encoders import fixed_encoding, FORMAT_PNG
+from encode_pool import build_encode_backend, ENCODE_BACKENDS, DISPATCH_THREADS, CPU_COUNT
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('folder')
+    parser.add_argument('--monitors', type=int, default=4)
+    parser.add_argument('--ticks', type=int, default=10)
+    parser.add_argument('--format', default=FORMAT_PNG)
+    args = parser.parse_args()
+
+    images = [image for _, image in recorded_frames(args.folder, args.monitors)]
+    if not images:
+        sys.exit("no recorded frames")
+    images = (images * args.monitors)[:args.monitors]
+    encoding = fixed_encoding(args.format)
+    print(f"{CPU_COUNT} cores, {encoding.name}, frames of {images[0].width}x{images[0].height}")
+
+    print(f"{'monitors':>8} {'backend':<10} {'workers':>7} {'median ms/tick':>15}  utilization per worker")
+    with ThreadPoolExecutor(max_workers=DISPATCH_THREADS) as dispatch:
+        for count in range(1, args.monitors + 1):
+            for mode in ENCODE_BACKENDS:
+                backend = build_encode_backend(mode, count)
+                try:
+                    list(dispatch.map(lambda image: backend.encode(encoding, image), images[:count]))  # warm-up
+                    timings = []
+                    for _ in range(args.ticks):
+                        start = time.perf_counter()
+                        list(dispatch.map(lambda image: backend.encode(encoding, image), images[:count]))
+                        timings.append((time.perf_counter() - start) * 1000)
+                    stats = backend.stats()
+                finally:
+                    backend.close()
+                usage = ", ".join(f"{usage['utilization']:.0%}" for usage in stats['per_worker'].values())
+                note = f" (fell back: {stats['fallback']})" if stats['fallback'] else ""
+                print(f"{count:>8} {stats['backend']:<10} {stats['workers']:>7} {statistics.median(timings):>15.1f}"
+                      f"  {usage}{note}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Compare encoder policies on recorded screenshots: MB per hour and milliseconds per frame.
+
+Usage: python benchmarks/bench_encoders.py FOLDER [--frames N] [--interval SECONDS]
+                                           [--budget-mb MB] [--encode-budget-ms MS]
+
+FOLDER is an output folder written by Screen Tracker. The most recent N
+frames in its catalog (rebuilt first if it is missing) are decoded once and
+then encoded by every policy: Pillow's defaults as the app used them before,
+each fixed format, and the automatic policy with the given budgets.
+MB/hour is extrapolated from the frames' capture times, or from --interval
+if given (useful when the recording was made at another rate).
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from catalog import Catalog, CATALOG_FILE
+from storage import SAME_AS_PREVIOUS
+from thumbnails import FrameLoader
+from encoders import (Encoding, FixedEncoder, build_encoder, webp_supported, SCREENSHOT_FORMATS,
+                      FORMAT_WEBP, FORMAT_WEBP_LOSSLESS, DEFAULT_BYTE_BUDGET_MB, DEFAULT_ENCODE_BUDGET_MS)
+
+
+def recorded_frames(folder, count):
+    """Return [(timestamp, RGB image)] for the last `count` frames in the folder's catalog."""
+    catalog = Catalog(folder)
+    if not os.path.exists(os.path.join(folder, CATALOG_FILE)):
+        catalog.rebuild()
+    rows = [row for row in catalog.frames() if row['format'] != SAME_AS_PREVIOUS][-count:]
+    loader = FrameLoader()
+    return [(row['timestamp'], loader.load(catalog.absolute_path(row['path']), row['offset'], row['format']))
+            for row in rows]
+
+
+def policies(args):
+    """Return (name, EncoderPolicy) for every policy to compare."""
+    result = [("pillow default PNG", FixedEncoder(Encoding("png-default", 'PNG'))),
+              ("pillow default JPEG", FixedEncoder(Encoding("jpeg-default", 'JPEG')))]
+    for screenshot_format in SCREENSHOT_FORMATS:
+        if screenshot_format in (FORMAT_WEBP, FORMAT_WEBP_LOSSLESS) and not webp_supported():
+            continue
+        settings = {'screenshot_format': screenshot_format, 'byte_budget_mb_per_hour': args.budget_mb,
+                    'encode_budget_ms': args.encode_budget_ms}
+        result.append((screenshot_format.lower(), build_encoder(settings)))
+    return result
+
+
+def run(policy, frames):
+    """Encode every frame; returns (total bytes, per-frame milliseconds)."""
+    total, timings = 0, []
+    for timestamp, image in frames:
+        start = time.perf_counter()
+        data, _, _ = policy.encode(image, timestamp)
+        timings.append((time.perf_counter() - start) * 1000)
+        total += len(data)
+    return total, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('folder')
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=None, help="seconds between frames (default: as recorded)")
+    parser.add_argument('--budget-mb', type=float, default=DEFAULT_BYTE_BUDGET_MB, help="MB per hour for the automatic policy")
+    parser.add_argument('--encode-budget-ms', type=float, default=DEFAULT_ENCODE_BUDGET_MS)
+    args = parser.parse_args()
+
+    frames = recorded_frames(args.folder, args.frames)
+    if len(frames) < 2:
+        sys.exit("need at least two recorded frames")
+    if args.interval:
+        frames = [(n * args.interval, image) for n, (_, image) in enumerate(frames)]
+    span = frames[-1][0] - frames[0][0]
+    if span <= 0:
+        sys.exit("the frames have no usable capture times; pass --interval")
+    frames_per_hour = (len(frames) - 1) * 3600 / span
+    first = datetime.datetime.fromtimestamp(frames[0][0]) if not args.interval else None
+    print(f"{len(frames)} frames, {frames_per_hour:.0f} frames/hour"
+          + (f", recorded from {first:%Y-%m-%d %H:%M:%S}" if first else ""))
+
+    print(f"{'policy':<20} {'MB/hour':>9} {'KB/frame':>9} {'median ms':>10} {'p95 ms':>8}  encodings")
+    for name, policy in policies(args):
+        total, timings = run(policy, frames)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        per_frame = total / len(frames)
+        mix = ", ".join(f"{encoding} {count}" for encoding, count in sorted(policy.stats()['by_encoding'].items()))
+        print(f"{name:<20} {per_frame * frames_per_hour / 2 ** 20:>9.1f} {per_frame / 1024:>9.1f} "
+              f"{statistics.median(timings):>10.1f} {p95:>8.1f}  {mix}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Measure near-duplicate search time in a catalog with millions of perceptual hashes.
+
+Usage: python benchmarks/bench_similarity.py [--frames N] [--screens N] [--searches N]
+
+A temporary catalog is filled with N frames whose hashes are drawn around
+--screens distinct "screens" (a few bits flipped each, like the same
+window captured again and again), which is harder for the band index than
+uniformly random hashes. Searches for known screens and for random hashes
+are then timed at several distances.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from catalog import Catalog, INSERT
+from similarity import SimilarityIndex, to_signed, HASH_BITS, MAX_DISTANCE
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=1000000)
+    parser.add_argument('--screens', type=int, default=5000)
+    parser.add_argument('--searches', type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(1)
+    screens = [random.getrandbits(HASH_BITS) for _ in range(args.screens)]
+
+    def rows():
+        for n in range(args.frames):
+            value = screens[n % len(screens)]
+            for _ in range(random.randint(0, 6)):
+                value ^= 1 << random.randrange(HASH_BITS)
+            yield (1.7e9 + n, '2026-01-01', 1, f"2026-01-01/screen_1_{n}.png", None, 0, 'PNG', 1920, 1080, None,
+                   to_signed(value))
+
+    with tempfile.TemporaryDirectory() as folder:
+        catalog = Catalog(folder)
+        start = time.perf_counter()
+        with catalog.connection() as connection:
+            connection.executemany(INSERT, rows())
+        print(f"{args.frames} frames around {args.screens} screens indexed in {time.perf_counter() - start:.1f}s")
+
+        index = SimilarityIndex(catalog)
+        print(f"{'distance':>8} {'sample':<7} {'matches':>8} {'median ms':>10} {'max ms':>8}")
+        for distance in (4, 8, 10, 12, MAX_DISTANCE):
+            for kind in ('screen', 'random'):
+                timings, found = [], []
+                for _ in range(args.searches):
+                    sample = random.choice(screens) if kind == 'screen' else random.getrandbits(HASH_BITS)
+                    begin = time.perf_counter()
+                    found.append(len(index.search(sample, distance)))
+                    timings.append((time.perf_counter() - begin) * 1000)
+                print(f"{distance:>8} {kind:<7} {statistics.median(found):>8.0f} {statistics.median(timings):>10.1f} "
+                      f"{max(timings):>8.1f}")
+        catalog.close()
+
+
+if __name__ == '__main__':
+    main()
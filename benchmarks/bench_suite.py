@@ -0,0 +1,332 @@
+"""Run the standard benchmarks without a display and write the results as comparable JSON.
+
+Usage: python benchmarks/bench_suite.py [--output FILE] [--compare BASELINE] [--tolerance FRACTION]
+                                        [--only NAME ...] [--quick] [--replay FOLDER] [--cleanup-files N ...]
+
+Frames come from the deterministic synthetic frame source, or with --replay
+from frames recorded by Screen Tracker, so every run sees the same pixels.
+The benchmarks are:
+
+  capture      capture->save throughput through the full engine, per storage
+               mode and format, plus the median time of each stage
+  blank        cost of the blank-frame check, against the old is_black_image()
+  encode       milliseconds and bytes per frame for each screenshot format
+  cleanup      retention over generated day folders of N empty files each
+               (10k and 100k by default; 1M with --cleanup-files 1000000).
+               The pauses between deletion slices are turned off, so the
+               figures measure the deletion work itself.
+  upload       frames bundled and sent to a local reference collector, per
+               second and bytes per frame on the wire
+  startup      cold start of the window (offscreen, with its own daemon):
+               milliseconds until it was shown, attached to the daemon and
+               knew the monitors, and until the process reported it
+
+Every metric says whether lower or higher is better. With --compare, the
+results are checked against an earlier JSON file and the exit status is 1
+if any metric got worse by more than --tolerance.
+"""
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+import platform
+import tempfile
+import functools
+import statistics
+import subprocess
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import PIL
+import retention
+from frame_sources import SyntheticFrameSource, ReplayFrameSource
+from capture_engine import CaptureEngine, CaptureJob, build_storage
+from catalog import CatalogSink
+from storage import STORAGE_FILES, STORAGE_DELTA, STORAGE_SEGMENTS
+from change_detection import DEDUP_OFF, DEDUP_SKIP
+from blank_detection import SampledBlankDetector
+from encoders import build_encoder, webp_supported, SCREENSHOT_FORMATS, FORMAT_PNG, FORMAT_JPEG, FORMAT_AUTO
+from metrics import summarize
+from retention import RetentionEngine, RetentionPolicy
+from bench_blank_detection import legacy_is_black_image, make_frames, timeit
+from bench_encoders import run as encode_frames
+from bench_upload import capture as capture_records, run as upload_records
+
+SUITE_VERSION = 1
+BENCHMARKS = ('capture', 'blank', 'encode', 'cleanup', 'upload', 'startup')
+# name, storage mode, format, change rate, dedup mode
+CAPTURE_CASES = (
+    ('files-png', STORAGE_FILES, FORMAT_PNG, 1.0, DEDUP_OFF),
+    ('files-jpeg', STORAGE_FILES, FORMAT_JPEG, 1.0, DEDUP_OFF),
+    ('delta-png', STORAGE_DELTA, FORMAT_PNG, 1.0, DEDUP_OFF),
+    ('segments-png', STORAGE_SEGMENTS, FORMAT_PNG, 1.0, DEDUP_OFF),
+    ('dedup-mostly-static', STORAGE_FILES, FORMAT_PNG, 0.1, DEDUP_SKIP),
+)
+CAPTURE_STAGES = ('grab', 'blank_check', 'convert', 'encode', 'write')
+IN_FLIGHT_TICKS = 2
+REFUSED_TICK_WAIT = 0.001
+CLEANUP_DAYS = 100
+FIRST_TIMESTAMP = datetime.datetime(2026, 1, 1)
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'main.py')
+STARTUP_TIMEOUT = 60
+UPLOAD_BUNDLE_FRAMES = 10
+UPLOAD_CONCURRENCY = (1, 4)
+
+
+def metric(value, unit, better):
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def frame_source(args, change_rate=1.0):
+    """Return a frame source factory for the run's monitors."""
+    if args.replay:
+        return functools.partial(ReplayFrameSource, folder=args.replay)
+    return functools.partial(SyntheticFrameSource, monitors=args.monitors, change_rate=change_rate,
+                             change_area=args.change_area, seed=args.seed)
+
+
+def bench_capture(args):
+    """Push ticks through the capture engine as fast as it takes them, for every case."""
+    results = {}
+    for name, storage_mode, screenshot_format, change_rate, dedup_mode in CAPTURE_CASES:
+        in_flight = threading.Semaphore(IN_FLIGHT_TICKS)
+        engine = CaptureEngine(storage=build_storage(storage_mode), dedup_mode=dedup_mode, sinks=[CatalogSink()],
+                               frame_source=frame_source(args, change_rate),
+                               on_capture_finished=lambda job: in_flight.release())
+        encoder = build_encoder({'screenshot_format': screenshot_format})
+        with tempfile.TemporaryDirectory() as folder:
+            with engine.frame_source() as source:
+                monitors = list(range(1, len(source.monitors())))
+            refused = 0
+            start = time.perf_counter()
+            for tick in range(args.ticks):
+                in_flight.acquire()
+                timestamp = FIRST_TIMESTAMP + datetime.timedelta(seconds=tick)
+                # A tick is refused (and finished at once) while the previous one is still being grabbed.
+                while not engine.submit(CaptureJob(folder, monitors, encoder, timestamp)):
+                    refused += 1
+                    time.sleep(REFUSED_TICK_WAIT)
+                    in_flight.acquire()
+            engine.shutdown(timeout=None)
+            elapsed = time.perf_counter() - start
+            written = sum(os.path.getsize(os.path.join(path, file)) for path, _, files in os.walk(folder)
+                          for file in files if not file.startswith('catalog'))
+        stats = engine.stats()
+        dropped = stats['dropped'] - refused * len(monitors)
+        stages = summarize(engine.metrics.snapshot())['stages']
+        frames = args.ticks * len(monitors)
+        case = {
+            'ticks_per_second': metric(args.ticks / elapsed, 'ticks/s', 'higher'),
+            'frames_per_second': metric(frames / elapsed, 'frames/s', 'higher'),
+            'kb_per_frame': metric(written / frames / 1024, 'KB', 'lower'),
+            'dropped': metric(dropped, 'frames', 'lower'),
+        }
+        for stage in CAPTURE_STAGES:
+            if stages.get(stage, {}).get('count'):
+                case[f'{stage}_p50_ms'] = metric(stages[stage]['p50'] * 1000, 'ms', 'lower')
+        results[name] = case
+        print(f"  capture {name:<20} {case['frames_per_second']['value']:>8.1f} frames/s "
+              f"{case['kb_per_frame']['value']:>9.1f} KB/frame, dropped {dropped}")
+    return results
+
+
+def synthetic_frames(args, count):
+    """Grab `count` frames of the first monitor, changing between grabs."""
+    with frame_source(args)() as source:
+        return [source.grab([1])[0] for _ in range(count)]
+
+
+def bench_blank(args):
+    """Time the blank check on a black frame and on a desktop frame."""
+    width, height = args.monitors[0]
+    cases = {'black': dict(make_frames(width, height))['black'], 'desktop': synthetic_frames(args, 1)[0]}
+    detector = SampledBlankDetector()
+    results = {}
+    for name, frame in cases.items():
+        ms, _ = timeit(lambda: detector.is_blank(frame), args.repeat)
+        legacy_ms, _ = timeit(lambda: legacy_is_black_image(frame.to_image()), args.repeat)
+        results[name] = {'sampled_ms': metric(ms, 'ms', 'lower'),
+                         'is_black_image_ms': metric(legacy_ms, 'ms', 'lower')}
+        print(f"  blank {name:<10} sampled {ms:>8.3f} ms, is_black_image() {legacy_ms:>8.2f} ms")
+    return results
+
+
+def bench_encode(args):
+    """Encode the same frames with every screenshot format."""
+    frames = [(n, frame.to_image()) for n, frame in enumerate(synthetic_frames(args, args.encode_frames))]
+    results = {}
+    for screenshot_format in SCREENSHOT_FORMATS:
+        if screenshot_format == FORMAT_AUTO or (screenshot_format.startswith('WEBP') and not webp_supported()):
+            continue
+        total, timings = encode_frames(build_encoder({'screenshot_format': screenshot_format}), frames)
+        results[screenshot_format.lower()] = {
+            'median_ms': metric(statistics.median(timings), 'ms', 'lower'),
+            'kb_per_frame': metric(total / len(frames) / 1024, 'KB', 'lower'),
+        }
+        print(f"  encode {screenshot_format:<14} {statistics.median(timings):>8.1f} ms "
+              f"{total / len(frames) / 1024:>9.1f} KB/frame")
+    return results
+
+
+def make_tree(root, files):
+    """Create CLEANUP_DAYS old day folders holding `files` empty screenshot files in total."""
+    first = datetime.date.today() - datetime.timedelta(days=CLEANUP_DAYS + 30)
+    for day in range(CLEANUP_DAYS):
+        folder = os.path.join(root, (first + datetime.timedelta(days=day)).isoformat())
+        os.mkdir(folder)
+        for n in range(day * files // CLEANUP_DAYS, (day + 1) * files // CLEANUP_DAYS):
+            open(os.path.join(folder, f"screen_1_{n:07d}.png"), 'wb').close()
+
+
+def bench_cleanup(args):
+    """Let the retention engine remove generated day folders of every size asked for."""
+    results = {}
+    pause, retention.SLICE_PAUSE = retention.SLICE_PAUSE, 0
+    try:
+        for files in args.cleanup_files:
+            with tempfile.TemporaryDirectory() as root:
+                make_tree(root, files)
+                engine = RetentionEngine(RetentionPolicy(max_age_days=1))
+                engine.configure(root)
+                start, cpu = time.perf_counter(), time.process_time()
+                removed = engine.enforce()
+                elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu
+            results[f"{files}_files"] = {
+                'seconds': metric(elapsed, 's', 'lower'),
+                'cpu_seconds': metric(cpu, 's', 'lower'),
+                'files_per_second': metric(files / elapsed, 'files/s', 'higher'),
+            }
+            print(f"  cleanup {files:>8} files in {len(removed)} days: {elapsed:>7.2f} s ({cpu:.2f} s CPU)")
+    finally:
+        retention.SLICE_PAUSE = pause
+    return results
+
+
+def bench_upload(args):
+    """Upload `--ticks` captures of every monitor over 1 and 4 connections."""
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        records = capture_records(folder, args.ticks * len(args.monitors), args.monitors, seed=args.seed)
+        for concurrency in UPLOAD_CONCURRENCY:
+            elapsed, status = upload_records(records, UPLOAD_BUNDLE_FRAMES, concurrency)
+            results[f"{concurrency}_connections"] = {
+                'frames_per_second': metric(len(records) / elapsed, 'frames/s', 'higher'),
+                'kb_per_frame': metric(status['bytes_per_frame'] / 1024, 'KB', 'lower'),
+            }
+            print(f"  upload {concurrency} connections {len(records) / elapsed:>8.1f} frames/s "
+                  f"{status['bytes_per_frame'] / 1024:>9.1f} KB/frame")
+    return results
+
+
+def bench_startup(args):
+    """Start the window `--repeat` times in a fresh folder and collect the phases it reports."""
+    runs = []
+    for _ in range(args.repeat):
+        with tempfile.TemporaryDirectory() as folder:
+            with open(os.path.join(folder, 'app_settings.json'), 'w') as f:
+                json.dump({'frame_source': {'kind': 'synthetic', 'monitors': args.monitors}}, f)
+            env = dict(os.environ, QT_QPA_PLATFORM='offscreen', SCREENTRACKER_ADDRESS=os.path.join(folder, 'control.sock'))
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, MAIN_SCRIPT, '--startup-report'], cwd=folder, env=env,
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            # The report is printed once every phase was reached; the window then stops its daemon and exits.
+            line = process.stdout.readline()
+            elapsed = (time.perf_counter() - start) * 1000
+            _, errors = process.communicate(timeout=STARTUP_TIMEOUT)
+            if not line:
+                raise RuntimeError(f"the window did not report its startup: {errors.strip()[-500:]}")
+            runs.append({**json.loads(line), 'process': elapsed})
+    phases = {phase: statistics.median(run[phase] for run in runs) for phase in runs[0]}
+    print("  startup " + ", ".join(f"{phase} {value:.0f} ms" for phase, value in phases.items()))
+    return {'window': {f"{phase}_ms": metric(value, 'ms', 'lower') for phase, value in phases.items()}}
+
+
+def environment():
+    """What the results depend on besides the code."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(), 'platform': platform.platform(),
+            'machine': platform.machine(), 'processor': platform.processor(), 'cpu_count': os.cpu_count(),
+            'pillow': PIL.__version__, 'sqlite': sqlite3.sqlite_version}
+
+
+def compare(results, baseline, tolerance):
+    """Print every metric next to the baseline; returns the number of regressions."""
+    regressions = 0
+    print(f"{'metric':<56} {'baseline':>11} {'current':>11} {'change':>8}")
+    for benchmark, cases in results['results'].items():
+        for case, metrics in cases.items():
+            for name, current in metrics.items():
+                before = baseline.get('results', {}).get(benchmark, {}).get(case, {}).get(name)
+                if not before or not before['value']:
+                    continue
+                change = current['value'] / before['value'] - 1
+                worse = change > tolerance if current['better'] == 'lower' else change < -tolerance
+                regressions += worse
+                print(f"{benchmark + '/' + case + '/' + name:<56} {before['value']:>11.3f} {current['value']:>11.3f} "
+                      f"{change:>+7.1%}{'  REGRESSION' if worse else ''}")
+    differences = [key for key, value in results['environment'].items()
+                   if key != 'commit' and baseline.get('environment', {}).get(key) != value]
+    if differences:
+        print(f"note: the baseline ran with a different {', '.join(differences)}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON results of an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed slowdown as a fraction (default 0.15)")
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--quick', action='store_true', help="one small monitor and fewer frames, e.g. for CI")
+    parser.add_argument('--replay', metavar='FOLDER', help="replay frames recorded in an output folder")
+    parser.add_argument('--monitors', type=int, default=None, help="synthetic monitors (default 2, 1 with --quick)")
+    parser.add_argument('--width', type=int, default=None)
+    parser.add_argument('--height', type=int, default=None)
+    parser.add_argument('--ticks', type=int, default=None)
+    parser.add_argument('--change-area', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--encode-frames', type=int, default=None)
+    parser.add_argument('--cleanup-files', type=int, nargs='+', default=None)
+    args = parser.parse_args()
+
+    quick = args.quick
+    size = (args.width or (1280 if quick else 1920), args.height or (720 if quick else 1080))
+    args.monitors = [size] * (args.monitors or (1 if quick else 2))
+    args.ticks = args.ticks or (20 if quick else 60)
+    args.encode_frames = args.encode_frames or (5 if quick else 20)
+    args.cleanup_files = args.cleanup_files or ([10000] if quick else [10000, 100000])
+
+    results = {'suite': SUITE_VERSION, 'created': datetime.datetime.now().isoformat(timespec='seconds'),
+               'environment': environment(),
+               'options': {'monitors': args.monitors, 'ticks': args.ticks, 'change_area': args.change_area,
+                           'seed': args.seed, 'replay': bool(args.replay), 'encode_frames': args.encode_frames,
+                           'cleanup_files': args.cleanup_files},
+               'results': {}}
+    for name in BENCHMARKS:
+        if name in args.only:
+            print(f"{name}:")
+            results['results'][name] = globals()[f"bench_{name}"](args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('options') != json.loads(json.dumps(results['options'])):
+            print("note: the baseline ran with different options; only matching metrics are compared")
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Measure how fast captured frames are bundled and uploaded to a local reference collector.
+
+Usage: python benchmarks/bench_upload.py [--frames N] [--monitors N] [--storage MODE] [--format FORMAT]
+                                         [--bundle-frames N] [--concurrency N ...] [--rate-limit-kbps KBPS]
+
+Frames are first captured from the synthetic frame source into a temporary
+output folder. The timed part journals them in the outbox, a bundle every
+--bundle-frames frames, then bundles them and sends the bundles over
+keep-alive connections to a collector on localhost, until every frame has
+been accepted. Uploaded frames per second and bytes per frame on the wire
+are reported for each --concurrency.
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import tempfile
+import functools
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from frame_sources import SyntheticFrameSource
+from capture_engine import CaptureEngine, CaptureJob, build_storage
+from storage import STORAGE_MODES, STORAGE_FILES
+from encoders import build_encoder, FORMAT_PNG
+from collector import Collector
+from uploader import Uploader, DEFAULT_BUNDLE_FRAMES
+
+FIRST_TIMESTAMP = datetime.datetime(2026, 1, 1)
+UPLOAD_TIMEOUT = 600
+# One tick at a time, so no frame is dropped for want of an encode slot
+IN_FLIGHT_TICKS = 1
+
+
+class RecordingSink:
+    """Capture-engine sink that keeps every (job, record) it is given."""
+
+    def __init__(self):
+        self.records = []
+
+    def add(self, job, record):
+        self.records.append((job, record))
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def capture(folder, frames, monitors, storage_mode=STORAGE_FILES, screenshot_format=FORMAT_PNG, seed=0):
+    """Capture about `frames` frames of changing synthetic monitors into folder; returns the (job, record) pairs."""
+    sink = RecordingSink()
+    in_flight = threading.Semaphore(IN_FLIGHT_TICKS)
+    source = functools.partial(SyntheticFrameSource, monitors=monitors, change_rate=1.0, seed=seed)
+    engine = CaptureEngine(storage=build_storage(storage_mode), sinks=[sink], frame_source=source,
+                           on_capture_finished=lambda job: in_flight.release())
+    encoder = build_encoder({'screenshot_format': screenshot_format})
+    indexes = list(range(1, len(monitors) + 1))
+    for tick in range(-(-frames // len(monitors))):
+        in_flight.acquire()
+        # A tick is refused (and finished at once) while the previous one is still being grabbed.
+        while not engine.submit(CaptureJob(folder, indexes, encoder, FIRST_TIMESTAMP + datetime.timedelta(seconds=tick))):
+            time.sleep(0.001)
+            in_flight.acquire()
+    engine.shutdown(timeout=None)
+    return sink.records
+
+
+def run(records, bundle_frames=DEFAULT_BUNDLE_FRAMES, concurrency=2, rate_limit_kbps=0):
+    """Upload the records to a new local collector; returns (seconds, status of the uploader)."""
+    with tempfile.TemporaryDirectory() as received:
+        collector = Collector(received, port=0)
+        collector.start()
+        uploader = Uploader()
+        uploader.configure({'url': collector.url, 'bundle_frames': bundle_frames, 'concurrency': concurrency,
+                            'rate_limit_kbps': rate_limit_kbps, 'host': 'benchmark'})
+        start = time.perf_counter()
+        for number, (job, record) in enumerate(records, start=1):
+            uploader.add(job, record)
+            if number % bundle_frames == 0:
+                uploader.outbox(job.output_folder).seal()
+        uploader.start()
+        uploader.close()  # bundle the rest now
+        deadline = time.monotonic() + UPLOAD_TIMEOUT
+        while uploader.status()['uploaded_frames'] < len(records) and time.monotonic() < deadline:
+            time.sleep(0.005)
+        elapsed = time.perf_counter() - start
+        status = uploader.status()
+        uploader.stop()
+        collector.close()
+    if status['uploaded_frames'] < len(records):
+        raise RuntimeError(f"only {status['uploaded_frames']} of {len(records)} frames were uploaded: "
+                           f"{status['last_error']}")
+    return elapsed, status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--monitors', type=int, default=2)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--storage', choices=STORAGE_MODES, default=STORAGE_FILES)
+    parser.add_argument('--format', default=FORMAT_PNG)
+    parser.add_argument('--bundle-frames', type=int, default=DEFAULT_BUNDLE_FRAMES)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--rate-limit-kbps', type=float, default=0, help="0 for unlimited")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        start = time.perf_counter()
+        records = capture(folder, args.frames, [(args.width, args.height)] * args.monitors, args.storage, args.format)
+        stored = sum(record.size or 0 for _, record in records)
+        print(f"{len(records)} frames captured in {time.perf_counter() - start:.1f}s, "
+              f"{stored / len(records) / 1024:.1f} KB/frame stored")
+        print(f"{'concurrency':>11} {'seconds':>8} {'frames/s':>9} {'KB/frame':>9} {'MB/s':>7} {'bundles':>8} "
+              f"{'connections':>11}")
+        for concurrency in args.concurrency:
+            elapsed, status = run(records, args.bundle_frames, concurrency, args.rate_limit_kbps)
+            print(f"{concurrency:>11} {elapsed:>8.2f} {len(records) / elapsed:>9.1f} "
+                  f"{status['bytes_per_frame'] / 1024:>9.1f} {status['uploaded_bytes'] / elapsed / 1024 ** 2:>7.1f} "
+                  f"{-(-len(records) // args.bundle_frames):>8} {status['connections_opened']:>11}")
+
+
+if __name__ == '__main__':
+    main()
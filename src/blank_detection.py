@@ -0,0 +1,143 @@
+from PIL import Image
+from frames import Frame, BYTES_PER_PIXEL
+
+# Defaults
+DEFAULT_BLACK_THRESHOLD = 16
+DEFAULT_SOLID_TOLERANCE = 6
+DEFAULT_SAMPLE_STEP = 4
+DEFAULT_LOCK_SCREEN_TOLERANCE = 12
+# Rows scanned per bytes.translate() call when the frame is contiguous in memory
+SCAN_CHUNK_ROWS = 64
+SIGNATURE_GRID = (32, 18)
+
+
+def frame_signature(frame, grid=SIGNATURE_GRID):
+    """Sample a coarse grid of BGR values from a frame, independent of its resolution."""
+    columns, rows = grid
+    samples = bytearray()
+    for j in range(rows):
+        row = frame.row((2 * j + 1) * frame.height // (2 * rows))
+        for i in range(columns):
+            x = (2 * i + 1) * frame.width // (2 * columns) * BYTES_PER_PIXEL
+            samples += row[x:x + 3]
+    return bytes(samples)
+
+
+def image_signature(image, grid=SIGNATURE_GRID):
+    """Return the frame_signature() of a PIL image, e.g. a saved lock-screen capture."""
+    image = image.convert("RGB")
+    data = image.tobytes("raw", "BGRX")
+    return frame_signature(Frame(0, image.width, image.height, data), grid)
+
+
+class BlankFrameDetector:
+    """Interface for deciding that a captured frame has nothing worth saving."""
+
+    def is_blank(self, frame):
+        raise NotImplementedError
+
+
+class NullBlankDetector(BlankFrameDetector):
+    """Keep every frame."""
+
+    def is_blank(self, frame):
+        return False
+
+
+class SampledBlankDetector(BlankFrameDetector):
+    """Reject black, near-black, solid-colour and lock-screen frames from the raw BGRA buffer.
+
+    One pixel in every `sample_step` squared is checked. Each channel of a block
+    of rows is tested in one bytes.translate() call, and the scan stops at the
+    first block holding a pixel outside the accepted range, so frames with real
+    content are usually rejected after the first block.
+    sample_step=1, black_threshold=0 and detect_solid=False reproduce the old
+    exact "completely black" test.
+    """
+
+    def __init__(self, black_threshold=DEFAULT_BLACK_THRESHOLD, solid_tolerance=DEFAULT_SOLID_TOLERANCE,
+                 detect_solid=True, sample_step=DEFAULT_SAMPLE_STEP,
+                 lock_screen_signatures=(), lock_screen_tolerance=DEFAULT_LOCK_SCREEN_TOLERANCE):
+        self.black_threshold = black_threshold
+        self.solid_tolerance = solid_tolerance
+        self.detect_solid = detect_solid
+        self.sample_step = max(1, int(sample_step))
+        self.lock_screen_signatures = list(lock_screen_signatures)
+        self.lock_screen_tolerance = lock_screen_tolerance
+
+    def add_lock_screen(self, image):
+        """Treat frames that look like the given PIL image as blank."""
+        self.lock_screen_signatures.append(image_signature(image))
+
+    def is_blank(self, frame):
+        if frame.width == 0 or frame.height == 0:
+            return True
+        if self.is_uniform(frame):
+            return True
+        return self.matches_lock_screen(frame)
+
+    def is_uniform(self, frame):
+        """Return True if every sampled pixel is near-black or close to the first pixel."""
+        reference = frame.row(0)[:3]
+        near_black = max(reference) <= self.black_threshold
+        if not near_black and not self.detect_solid:
+            return False
+
+        accepted = []
+        for value in reference:
+            low, high = value, value
+            if self.detect_solid:
+                low, high = max(0, value - self.solid_tolerance), min(255, value + self.solid_tolerance)
+            if near_black:
+                low, high = 0, max(high, self.black_threshold)
+            accepted.append(bytes(range(low, high + 1)))
+
+        step = self.sample_step
+        if frame.stride == frame.width * BYTES_PER_PIXEL:
+            # Contiguous pixels: sample a lattice across whole blocks of rows at once.
+            pixel_step = step * step * BYTES_PER_PIXEL
+            end = frame.offset + frame.height * frame.stride
+            chunk = SCAN_CHUNK_ROWS * frame.stride
+            blocks = (frame.buffer[start:min(start + chunk, end)] for start in range(frame.offset, end, chunk))
+        else:
+            # A view into a wider buffer: only this monitor's part of each sampled row may be read.
+            pixel_step = step * BYTES_PER_PIXEL
+            blocks = (frame.row(y) for y in range(0, frame.height, step))
+        for block in blocks:
+            # One contiguous copy per block: strided slicing of bytes is much faster than of a memoryview.
+            data = bytes(block)
+            for channel in range(3):
+                if data[channel::pixel_step].translate(None, accepted[channel]):
+                    return False
+        return True
+
+    def matches_lock_screen(self, frame):
+        """Return True if the frame is close to one of the registered lock-screen signatures."""
+        if not self.lock_screen_signatures:
+            return False
+        signature = frame_signature(frame)
+        limit = self.lock_screen_tolerance * len(signature)
+        for reference in self.lock_screen_signatures:
+            if len(reference) == len(signature) and sum(abs(a - b) for a, b in zip(signature, reference)) <= limit:
+                return True
+        return False
+
+
+def build_blank_detector(settings):
+    """Create a blank-frame detector from the 'blank_detection' settings dict."""
+    settings = settings or {}
+    if not settings.get('enabled', True):
+        return NullBlankDetector()
+    detector = SampledBlankDetector(
+        black_threshold=int(settings.get('black_threshold', DEFAULT_BLACK_THRESHOLD)),
+        solid_tolerance=int(settings.get('solid_tolerance', DEFAULT_SOLID_TOLERANCE)),
+        detect_solid=bool(settings.get('detect_solid', True)),
+        sample_step=int(settings.get('sample_step', DEFAULT_SAMPLE_STEP)),
+        lock_screen_tolerance=int(settings.get('lock_screen_tolerance', DEFAULT_LOCK_SCREEN_TOLERANCE)))
+    for path in settings.get('lock_screen_images', []):
+        try:
+            with Image.open(path) as image:
+                detector.add_lock_screen(image)
+        except OSError:
+            continue
+    return detector
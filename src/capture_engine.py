@@ -0,0 +1,409 @@
+import os
+import json
+import time
+import queue
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from frame_sources import MssFrameSource, CAPTURE_MODE_PER_MONITOR
+from frames import FramePool
+from blank_detection import SampledBlankDetector
+from change_detection import ChangeDetector, DEDUP_OFF, DEDUP_MARK
+from storage import (FileStorage, FrameWriter, SavedFrame, date_folder, STORAGE_DELTA, STORAGE_SEGMENTS,
+                     DUPLICATES_LOG, SAME_AS_PREVIOUS)
+from delta_storage import DeltaStorage, DEFAULT_KEYFRAME_INTERVAL
+from segment_storage import SegmentStorage
+from catalog import content_hash
+from similarity import frame_dhash
+from encoders import FixedEncoder, fixed_encoding, FORMAT_PNG
+from encode_pool import ThreadEncoder
+from metrics import Metrics
+
+# Constants
+DEFAULT_QUEUE_SIZE = 4
+DEFAULT_ENCODE_WORKERS = min(4, os.cpu_count() or 1)
+# How long the writer waits for work before flushing its sinks
+SINK_FLUSH_INTERVAL = 5.0
+
+_STOP = object()
+
+
+def build_storage(mode, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+    """Create the FrameStorage for a storage mode."""
+    if mode == STORAGE_DELTA:
+        return DeltaStorage(keyframe_interval=keyframe_interval)
+    if mode == STORAGE_SEGMENTS:
+        return SegmentStorage()
+    return FileStorage()
+
+
+class CaptureJob:
+    """A single capture tick: which monitors to grab, where to store them and how to encode them."""
+
+    def __init__(self, output_folder, monitors, encoder=None, timestamp=None):
+        self.output_folder = output_folder
+        self.monitors = list(monitors)
+        self.encoder = encoder or FixedEncoder(fixed_encoding(FORMAT_PNG))
+        self.timestamp = timestamp or datetime.datetime.now()
+        self.saved = 0
+        self.blank = 0
+        self.change = None
+        self._remaining = len(self.monitors)
+        self._lock = threading.Lock()
+
+    def note_change(self, fraction):
+        """Record how much of a monitor changed since its last saved frame (convert stage only)."""
+        self.change = fraction if self.change is None else max(self.change, fraction)
+
+    def finish_frame(self, saved):
+        """Record the outcome of one frame and return True once the job is complete."""
+        with self._lock:
+            if saved:
+                self.saved += 1
+            self._remaining -= 1
+            return self._remaining == 0
+
+
+class CaptureEngine:
+    """Pipelined grab -> convert -> encode -> write engine running off the GUI thread.
+
+    Stages are connected by bounded queues. When a stage cannot keep up, the
+    frame is dropped instead of blocking the producer, so a slow disk never
+    stalls the caller of submit(). Callbacks are invoked from worker threads.
+
+    How frames end up on disk is decided by the FrameStorage in `storage`.
+    Encoded frames may finish out of order, so the writer puts them back in
+    capture order before handing them to the storage. Every written frame is
+    then passed to each sink (e.g. the catalog) on the writer thread.
+
+    The image encoders themselves run on `encode_backend`: on the encode
+    threads, or in worker processes that the threads hand frames to.
+    """
+
+    def __init__(self, encode_workers=DEFAULT_ENCODE_WORKERS, queue_size=DEFAULT_QUEUE_SIZE,
+                 capture_mode=CAPTURE_MODE_PER_MONITOR, blank_detector=None,
+                 dedup_mode=DEDUP_OFF, change_detector=None, track_changes=False, storage=None, sinks=(),
+                 encode_backend=None, metrics=None, frame_source=MssFrameSource,
+                 on_frame_saved=None, on_frame_dropped=None, on_capture_finished=None, on_error=None):
+        self.capture_mode = capture_mode
+        # A factory taking the capture mode, e.g. from build_frame_source(); a new one takes effect on the next tick.
+        self.frame_source = frame_source
+        # Number of monitors the grab thread's session last saw; None until its first grab
+        self.monitor_count = None
+        self.blank_detector = blank_detector or SampledBlankDetector()
+        self.dedup_mode = dedup_mode
+        self.change_detector = change_detector or ChangeDetector()
+        # Measure how much each frame changed (CaptureJob.change) even when dedup is off.
+        self.track_changes = track_changes
+        self.storage = storage or FileStorage()
+        self.encode_backend = encode_backend or ThreadEncoder()
+        self.sinks = list(sinks)
+        # Per-stage timings and byte counts; see metrics.py.
+        self.metrics = metrics or Metrics()
+        self.on_frame_saved = on_frame_saved
+        self.on_frame_dropped = on_frame_dropped
+        self.on_capture_finished = on_capture_finished
+        self.on_error = on_error
+
+        self._grab_queue = queue.Queue(maxsize=1)
+        self._convert_queue = queue.Queue(maxsize=queue_size)
+        self._write_queue = queue.Queue(maxsize=queue_size)
+        self._encode_slots = threading.BoundedSemaphore(encode_workers * 2)
+        # One decode target per in-flight encode, plus the frame being converted.
+        self._frame_pool = FramePool(slots=encode_workers * 2 + 1)
+        self._encoder = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="capture-encode")
+        self._writer = FrameWriter()
+        self._next_seq = 0
+        self._dedup_day = None
+        self._last_saved = {}
+        self._stats_lock = threading.Lock()
+        self._stats = {'grabbed': 0, 'saved': 0, 'blank': 0, 'deduplicated': 0, 'dropped': 0, 'errors': 0}
+        self._deduplicated_by_monitor = {}
+
+        self._threads = [
+            threading.Thread(target=self._grab_loop, name="capture-grab", daemon=True),
+            threading.Thread(target=self._convert_loop, name="capture-convert", daemon=True),
+            threading.Thread(target=self._write_loop, name="capture-write", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+        self._running = True
+
+    def submit(self, job):
+        """Queue a capture job. Returns False if the previous tick is still being grabbed."""
+        if not job.monitors:
+            self._finish_job(job)
+            return True
+        try:
+            self._grab_queue.put_nowait(job)
+            return True
+        except queue.Full:
+            for index in job.monitors:
+                self._drop_frame(job, index, 'grab')
+            return False
+
+    def stats(self):
+        """Return a snapshot of the engine counters."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats['deduplicated_by_monitor'] = dict(self._deduplicated_by_monitor)
+            return stats
+
+    def shutdown(self, timeout=5.0):
+        """Drain the pipeline and stop all worker threads."""
+        if not self._running:
+            return
+        self._running = False
+        self._grab_queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _count(self, key, amount=1):
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _count_duplicate(self, index):
+        with self._stats_lock:
+            self._stats['deduplicated'] += 1
+            self._deduplicated_by_monitor[index] = self._deduplicated_by_monitor.get(index, 0) + 1
+
+    def _finish_job(self, job):
+        if self.on_capture_finished:
+            self.on_capture_finished(job)
+
+    def _finish_frame(self, job, saved):
+        if job.finish_frame(saved):
+            self._finish_job(job)
+
+    def _drop_frame(self, job, index, stage):
+        self._count('dropped')
+        if self.on_frame_dropped:
+            self.on_frame_dropped(index, stage)
+        self._finish_frame(job, False)
+
+    def _report_error(self, job, index, error):
+        self._count('errors')
+        if self.on_error:
+            self.on_error(f"screen {index}: {error}")
+        self._finish_frame(job, False)
+
+    def _offer(self, stage_queue, item, job, index, stage):
+        """Hand an item to the next stage, dropping the frame if that stage is saturated."""
+        try:
+            stage_queue.put_nowait(item)
+        except queue.Full:
+            self._drop_frame(job, index, stage)
+
+    def _grab_loop(self):
+        # The frame source lives on this thread for the whole life of the engine.
+        factory = self.frame_source
+        source = factory(self.capture_mode)
+        while True:
+            job = self._grab_queue.get()
+            if job is _STOP:
+                source.close()
+                self._convert_queue.put(_STOP)
+                return
+            if self.frame_source is not factory:
+                source.close()
+                factory = self.frame_source
+                source = factory(self.capture_mode)
+            source.mode = self.capture_mode
+            started = time.perf_counter()
+            try:
+                frames = source.grab(job.monitors)
+            except Exception as e:
+                # Reopen the session on the next tick, e.g. after a display change.
+                source.close()
+                for index in job.monitors:
+                    self._report_error(job, index, e)
+                continue
+            self.metrics.observe('grab', time.perf_counter() - started)
+            self.monitor_count = len(source.monitors()) - 1
+            self.metrics.add('grabbed_bytes', sum(frame.height * frame.stride for frame in frames))
+            grabbed = {frame.monitor for frame in frames}
+            for index in job.monitors:
+                if index not in grabbed:
+                    self._finish_frame(job, False)
+            for frame in frames:
+                self._count('grabbed')
+                self._offer(self._convert_queue, (job, frame), job, frame.monitor, 'convert')
+
+    def _convert_loop(self):
+        while True:
+            item = self._convert_queue.get()
+            if item is _STOP:
+                self._encoder.shutdown(wait=True)
+                self._write_queue.put(_STOP)
+                return
+            job, frame = item
+            index = frame.monitor
+            try:
+                # Blank frames are rejected from the raw buffer, before paying for a decode.
+                started = time.perf_counter()
+                blank = self.blank_detector.is_blank(frame)
+                converting = time.perf_counter()
+                self.metrics.observe('blank_check', converting - started)
+                if blank:
+                    self._count('blank')
+                    job.blank += 1
+                    self._finish_frame(job, False)
+                    continue
+                signature = None
+                if self.dedup_mode != DEDUP_OFF or self.track_changes:
+                    signature = self._check_duplicate(job, frame)
+                    if signature is None:
+                        continue
+                # For near-duplicate search; hashed from the grab buffer, so delta frames get one too.
+                perceptual_hash = frame_dhash(frame)
+            except Exception as e:
+                self._report_error(job, index, e)
+                continue
+            if not self._encode_slots.acquire(blocking=False):
+                self._drop_frame(job, index, 'encode')
+                continue
+            try:
+                task = self.storage.prepare(job, frame, self._frame_pool)
+            except Exception as e:
+                self._encode_slots.release()
+                self._report_error(job, index, e)
+                continue
+            # The grab buffer is no longer needed once the storage has taken what it needs.
+            del frame
+            if task is None:
+                self._encode_slots.release()
+                self._drop_frame(job, index, 'buffer')
+                continue
+            task.perceptual_hash = perceptual_hash
+            if signature is not None:
+                self.change_detector.remember(index, signature)
+            self.metrics.observe('convert', time.perf_counter() - converting)
+            self._encoder.submit(self._encode, self._take_seq(), task)
+
+    def _take_seq(self):
+        """Number the next item for the writer; only called from the convert thread."""
+        seq = self._next_seq
+        self._next_seq += 1
+        return seq
+
+    def _check_duplicate(self, job, frame):
+        """Return the frame's signature, or None if it repeats the last saved frame and was handled."""
+        day = job.timestamp.date()
+        if day != self._dedup_day:
+            # Every day folder starts with a full frame per monitor.
+            self.change_detector.reset()
+            self._dedup_day = day
+        signature = self.change_detector.signature(frame)
+        difference = self.change_detector.difference(frame.monitor, signature)
+        job.note_change(difference)
+        if self.dedup_mode == DEDUP_OFF or difference > self.change_detector.threshold:
+            return signature
+        self._count_duplicate(frame.monitor)
+        if self.dedup_mode == DEDUP_MARK:
+            # Blocking put: every numbered item must reach the writer, or it would wait for it forever.
+            self._write_queue.put((self._take_seq(), job, frame.monitor, None, None))
+        else:
+            self._finish_frame(job, False)
+        return None
+
+    def _encode(self, seq, task):
+        error = None
+        started = time.perf_counter()
+        try:
+            task.storage.encode(task, self.encode_backend)
+            if task.data:
+                task.content_hash = content_hash(task.data)
+                self.metrics.add('encoded_bytes', len(task.data))
+            self.metrics.observe('encode', time.perf_counter() - started)
+        except Exception as e:
+            error = e
+        finally:
+            if task.pooled and task.image is not None:
+                self._frame_pool.release(task.image)
+            task.image = None
+        try:
+            self._write_queue.put((seq, task.job, task.monitor, task, error))
+        finally:
+            self._encode_slots.release()
+
+    def _write_loop(self):
+        pending = {}
+        next_seq = 0
+        storage = None
+        while True:
+            try:
+                item = self._write_queue.get(timeout=SINK_FLUSH_INTERVAL)
+            except queue.Empty:
+                self._flush_sinks()
+                continue
+            if item is _STOP:
+                for open_storage in {storage, self.storage} - {None}:
+                    open_storage.close()
+                for sink in self.sinks:
+                    self._call_sink(sink.close)
+                return
+            pending[item[0]] = item
+            while next_seq in pending:
+                _, job, index, task, error = pending.pop(next_seq)
+                next_seq += 1
+                if task is not None and task.storage is not storage:
+                    # Storages are picked on the convert thread in the writer's order: no later frame goes to the previous one.
+                    if storage is not None:
+                        storage.close()
+                    storage = task.storage
+                self._write_item(job, index, task, error)
+
+    def _write_item(self, job, index, task, error):
+        if task is None:
+            self._write_duplicate_entry(job, index)
+            return
+        if error is None:
+            started = time.perf_counter()
+            try:
+                saved = task.storage.write(task)
+            except Exception as e:
+                error = e
+            else:
+                self.metrics.observe('write', time.perf_counter() - started)
+                self.metrics.add('written_bytes', sum(record.size or 0 for record in saved))
+        if error is not None:
+            task.storage.discard(task)
+            self._report_error(job, index, error)
+            return
+        for record in saved:
+            self._last_saved[index] = record.path
+            self._count('saved')
+            self._record(job, record)
+            if self.on_frame_saved:
+                self.on_frame_saved(record)
+        self._finish_frame(job, bool(saved))
+
+    def _record(self, job, record):
+        for sink in self.sinks:
+            self._call_sink(sink.add, job, record)
+
+    def _flush_sinks(self):
+        for sink in self.sinks:
+            self._call_sink(sink.flush)
+
+    def _call_sink(self, method, *args):
+        # A failing sink must not stop frames from being written.
+        try:
+            method(*args)
+        except Exception as e:
+            self._count('errors')
+            if self.on_error:
+                self.on_error(f"{type(method.__self__).__name__}: {e}")
+
+    def _write_duplicate_entry(self, job, index):
+        """Log a frame that repeats the previous capture instead of saving it again."""
+        same_as = self._last_saved.get(index)
+        entry = {'monitor': index, 'timestamp': job.timestamp.isoformat(), 'same_as': same_as}
+        path = os.path.join(date_folder(job.output_folder, job.timestamp), DUPLICATES_LOG)
+        try:
+            self._writer.write(path, (json.dumps(entry) + '\n').encode('utf-8'), mode='ab')
+        except OSError as e:
+            self._report_error(job, index, e)
+            return
+        self._record(job, SavedFrame(job.timestamp, index, same_as or path, 0, SAME_AS_PREVIOUS, None, None))
+        self._finish_frame(job, False)
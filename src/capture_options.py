@@ -0,0 +1,33 @@
+# The choices and defaults of the capture settings, kept apart from the modules that implement them so that
+# the window can offer them without loading PIL or psutil.
+
+# Screenshot formats (the `screenshot_format` setting); AUTO picks one per frame within the budgets
+FORMAT_PNG = 'PNG'
+FORMAT_JPEG = 'JPEG'
+FORMAT_WEBP = 'WEBP'
+FORMAT_WEBP_LOSSLESS = 'WEBP_LOSSLESS'
+FORMAT_AUTO = 'AUTO'
+SCREENSHOT_FORMATS = (FORMAT_PNG, FORMAT_JPEG, FORMAT_WEBP, FORMAT_WEBP_LOSSLESS, FORMAT_AUTO)
+
+# Capture modes
+CAPTURE_MODE_PER_MONITOR = 'per_monitor'
+CAPTURE_MODE_VIRTUAL_SCREEN = 'virtual_screen'
+CAPTURE_MODES = (CAPTURE_MODE_PER_MONITOR, CAPTURE_MODE_VIRTUAL_SCREEN)
+
+# Dedup modes
+DEDUP_OFF = 'off'
+DEDUP_SKIP = 'skip'
+DEDUP_MARK = 'mark'
+DEDUP_MODES = (DEDUP_OFF, DEDUP_SKIP, DEDUP_MARK)
+
+# Encode backends (the `encode_backend` setting)
+ENCODE_BACKEND_THREADS = 'threads'
+ENCODE_BACKEND_PROCESSES = 'processes'
+ENCODE_BACKENDS = (ENCODE_BACKEND_THREADS, ENCODE_BACKEND_PROCESSES)
+
+# Defaults
+DEFAULT_BYTE_BUDGET_MB = 500
+DEFAULT_ENCODE_BUDGET_MS = 250
+DEFAULT_DEDUP_THRESHOLD = 0.005
+DEFAULT_KEYFRAME_INTERVAL = 30
+DEFAULT_EXPORT_INTERVAL = 60
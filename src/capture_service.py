@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import threading
+from capture_engine import CaptureEngine, CaptureJob, build_storage
+from catalog import CatalogSink
+from storage_stats import StorageStatsSink
+from uploader import Uploader
+from storage import STORAGE_FILES, STORAGE_DELTA
+from delta_storage import DEFAULT_KEYFRAME_INTERVAL
+from frame_sources import build_frame_source, CAPTURE_MODE_PER_MONITOR
+from blank_detection import build_blank_detector
+from change_detection import DEDUP_OFF, DEFAULT_DEDUP_THRESHOLD
+from retention import RetentionEngine, RetentionPolicy, DEFAULT_RETENTION_DAYS
+from scheduler import CaptureScheduler, build_policy, MIN_INTERVAL, DEFAULT_INTERVAL, SCHEDULE_ADAPTIVE
+from input_idle import InputIdleMonitor
+from metrics import Metrics, MetricsExporter, summarize, DEFAULT_EXPORT_INTERVAL
+from encoders import build_encoder, ENCODER_SETTINGS, FORMAT_PNG
+from encode_pool import (build_encode_backend, process_workers, ENCODE_BACKEND_THREADS, MAX_PROCESS_WORKERS,
+                         DISPATCH_THREADS)
+
+# Constants
+SETTINGS_FILE = 'app_settings.json'
+BYTES_PER_GB = 1024 ** 3
+
+
+def read_settings(path=SETTINGS_FILE):
+    """Return the settings saved by the GUI, or an empty dict if there are none yet."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+class CaptureService:
+    """Everything that has to run while capturing, without any GUI.
+
+    Owns the capture engine, the capture scheduler, the retention engine,
+    the storage totals, the uploader and the metrics exporter, and is
+    configured with the same settings dict the GUI saves.
+    Events (status changes, saved frames, errors, removed days) are passed
+    to `on_event` as JSON-serializable dicts.
+    """
+
+    def __init__(self, settings=None, on_event=None):
+        self.on_event = on_event
+        self.settings = {}
+        self.started = time.time()
+        self.metrics = Metrics()
+        self.uploader = Uploader(metrics=self.metrics, on_error=self._on_error)
+        self.storage_stats = StorageStatsSink()
+        self.engine = CaptureEngine(encode_workers=DISPATCH_THREADS, metrics=self.metrics,
+                                    on_frame_saved=self._on_frame_saved,
+                                    on_capture_finished=self._on_capture_finished,
+                                    on_error=self._on_error,
+                                    sinks=[CatalogSink(), self.storage_stats, self.uploader])
+        self.retention = RetentionEngine(on_deleted=self._on_day_deleted, on_error=self._on_error,
+                                         metrics=self.metrics)
+        self.exporter = MetricsExporter(self.metrics, on_error=self._on_error)
+        self.scheduler = CaptureScheduler(self._tick, idle_source=InputIdleMonitor().idle_seconds)
+        self.encoder = build_encoder({})
+        self._storage_key = None
+        self._source_key = None
+        self._encoder_key = None
+        self._backend_key = None
+        self._retention_key = None
+        self._lock = threading.Lock()
+        self.configure(settings or {})
+        self.retention.start()
+        self.uploader.start()
+        self.exporter.start()
+
+    def configure(self, settings):
+        """Merge changed settings into the current ones and apply them; returns the status."""
+        with self._lock:
+            self.settings.update(settings)
+            settings = dict(self.settings)
+        engine = self.engine
+        engine.capture_mode = settings.get('capture_mode', CAPTURE_MODE_PER_MONITOR)
+        source_key = json.dumps(settings.get('frame_source', {}), sort_keys=True)
+        if source_key != self._source_key:
+            # A synthetic or replayed source lets the daemon run without a display, e.g. on a CI box.
+            try:
+                engine.frame_source = build_frame_source(settings.get('frame_source', {}))
+            except ValueError as e:
+                self._on_error(f"frame source: {e}")
+            self._source_key = source_key
+        engine.blank_detector = build_blank_detector(settings.get('blank_detection', {}))
+        engine.dedup_mode = settings.get('dedup_mode', DEDUP_OFF)
+        engine.track_changes = settings.get('schedule_mode') == SCHEDULE_ADAPTIVE
+        engine.change_detector.threshold = float(settings.get('dedup_threshold', DEFAULT_DEDUP_THRESHOLD))
+        storage_mode = settings.get('storage_mode', STORAGE_FILES)
+        keyframe_interval = int(settings.get('keyframe_interval', DEFAULT_KEYFRAME_INTERVAL))
+        # Only the delta storage uses the keyframe interval; the writer closes the previous storage after its last frame.
+        storage_key = (storage_mode, keyframe_interval if storage_mode == STORAGE_DELTA else None)
+        if storage_key != self._storage_key:
+            engine.storage = build_storage(storage_mode, keyframe_interval)
+            self._storage_key = storage_key
+        encoder_key = tuple(settings.get(key) for key in ENCODER_SETTINGS)
+        if encoder_key != self._encoder_key:
+            # Rebuilt only on change, so the budget policy keeps what it learned about the content.
+            try:
+                self.encoder = build_encoder(settings)
+            except ValueError as e:
+                self._on_error(f"encoder: {e}; saving PNG instead")
+                self.encoder = build_encoder({'screenshot_format': FORMAT_PNG})
+            self._encoder_key = encoder_key
+        selected = settings.get('selected_monitors') or []
+        monitor_count = sum(map(bool, selected)) if selected else MAX_PROCESS_WORKERS
+        backend_key = (settings.get('encode_backend', ENCODE_BACKEND_THREADS), process_workers(monitor_count))
+        if backend_key != self._backend_key:
+            previous, engine.encode_backend = engine.encode_backend, build_encode_backend(backend_key[0], monitor_count)
+            self._backend_key = backend_key
+            if engine.encode_backend.fallback:
+                self._on_error(f"encoder: {engine.encode_backend.fallback}")
+            # Frames already handed to the previous backend finish there.
+            previous.close()
+
+        try:
+            policy = RetentionPolicy(max(1, int(settings.get('retention_period_days') or DEFAULT_RETENTION_DAYS)),
+                                     max(0, int(float(settings.get('max_total_gb') or 0) * BYTES_PER_GB)),
+                                     max(0, int(float(settings.get('min_free_gb') or 0) * BYTES_PER_GB)))
+        except (TypeError, ValueError) as e:
+            self._on_error(f"retention: {e}; keeping the previous limits")
+            policy = self.retention.policy
+        retention_key = (settings.get('screenshots_folder'), policy.max_age_days, policy.max_total_bytes,
+                         policy.min_free_bytes)
+        if retention_key != self._retention_key:
+            # A full pass only when the folder or the limits changed, not on every settings change.
+            self.retention.configure(settings.get('screenshots_folder'), policy)
+            self.retention.run_now()
+            self._retention_key = retention_key
+        try:
+            self.uploader.configure(settings.get('upload', {}), settings.get('screenshots_folder'))
+        except ValueError as e:
+            self._on_error(f"upload: {e}")
+        # A metrics interval of 0 turns the metrics files off.
+        try:
+            metrics_interval = float(settings.get('metrics_interval_seconds', DEFAULT_EXPORT_INTERVAL))
+        except (TypeError, ValueError):
+            metrics_interval = DEFAULT_EXPORT_INTERVAL
+        self.exporter.configure(settings.get('metrics_folder') or settings.get('screenshots_folder')
+                                if metrics_interval > 0 else None, metrics_interval)
+
+        if self.scheduler.running:
+            try:
+                self.scheduler.set_policy(self.schedule_policy())
+            except ValueError:
+                pass  # keep capturing at the previous interval
+        return self.status()
+
+    def interval(self):
+        """Seconds between two captures; settings saved before sub-second support use whole minutes."""
+        try:
+            if self.settings.get('interval_seconds') not in (None, ''):
+                seconds = float(self.settings['interval_seconds'])
+            else:
+                seconds = float(self.settings.get('interval_minutes') or DEFAULT_INTERVAL / 60) * 60
+        except ValueError:
+            seconds = 0
+        if seconds < MIN_INTERVAL:
+            raise ValueError(f"the capture interval must be at least {MIN_INTERVAL} seconds")
+        return seconds
+
+    def schedule_policy(self):
+        """Create the fixed or adaptive schedule described by the settings."""
+        return build_policy(self.settings, self.interval())
+
+    def monitors(self):
+        """Indexes of the monitors to capture; every monitor if none were ever selected."""
+        selected = self.settings.get('selected_monitors') or []
+        if not selected:
+            # The grab thread keeps the count of its live session; a source is only opened before the first grab.
+            count = self.engine.monitor_count
+            if count is None:
+                with self.engine.frame_source() as source:
+                    count = self.engine.monitor_count = len(source.monitors()) - 1
+            return list(range(1, count + 1))
+        return [i + 1 for i, checked in enumerate(selected) if checked]
+
+    def start(self):
+        """Start capturing every interval; the first capture happens one interval from now."""
+        if not self.settings.get('screenshots_folder'):
+            raise ValueError("the output folder is not set")
+        if not self.scheduler.running:
+            self.scheduler.start(self.schedule_policy())
+        return self._publish_status()
+
+    def stop(self):
+        """Stop capturing."""
+        self.scheduler.stop()
+        return self._publish_status()
+
+    def capture_now(self):
+        """Capture the selected monitors once, right away."""
+        folder = self.settings.get('screenshots_folder')
+        if not folder:
+            raise ValueError("the output folder is not set")
+        return self.engine.submit(CaptureJob(folder, self.monitors(), self.encoder))
+
+    def status(self):
+        """Return what the service is doing as a JSON-serializable dict."""
+        stats = self.engine.stats()
+        stats['deduplicated_by_monitor'] = {str(index): count for index, count in stats['deduplicated_by_monitor'].items()}
+        return {
+            'capturing': self.scheduler.running,
+            'next_capture': self.scheduler.next_capture_time(),
+            'schedule': self.scheduler.stats(),
+            'output_folder': self.settings.get('screenshots_folder'),
+            'stats': stats,
+            'encoder': self.encoder.stats(),
+            'encode_backend': self.engine.encode_backend.stats(),
+            'metrics': {**summarize(self.metrics.snapshot()), 'process': self.exporter.process},
+            'upload': self.uploader.status(),
+            'pid': os.getpid(),
+            'started': self.started,
+        }
+
+    def close(self):
+        """Stop capturing and shut the engines down."""
+        self.scheduler.close()
+        self.retention.stop()
+        self.engine.shutdown()
+        self.engine.encode_backend.close()
+        self.uploader.stop()
+        self.exporter.stop()
+
+    def _tick(self):
+        try:
+            return self.capture_now()
+        except Exception as e:
+            self._on_error(f"capture: {e}")
+            return False
+
+    def _publish_status(self):
+        status = self.status()
+        self._emit({'event': 'status', **status})
+        return status
+
+    def _emit(self, event):
+        if self.on_event:
+            self.on_event(event)
+
+    def _on_frame_saved(self, record):
+        self._emit({'event': 'frame_saved', 'timestamp': record.timestamp.timestamp(), 'monitor': record.monitor,
+                    'path': record.path, 'offset': record.offset, 'format': record.format, 'size': record.size})
+
+    def _on_capture_finished(self, job):
+        self.scheduler.observe(job.change, bool(job.monitors) and job.blank == len(job.monitors))
+        self._publish_status()
+
+    def _on_error(self, message):
+        self._emit({'event': 'error', 'message': message})
+
+    def _on_day_deleted(self, root, day, freed):
+        self.storage_stats.remove_day(root, day.isoformat())
+        self._emit({'event': 'retention', 'output_folder': root, 'day': day.isoformat(), 'freed': freed})
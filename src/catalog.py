@@ -0,0 +1,414 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from storage import parse_date_folder, DATE_FOLDER_FORMAT, TIMESTAMP_FORMAT, DUPLICATES_LOG, SAME_AS_PREVIOUS
+from delta_storage import DeltaStreamReader, RECORD_HEADER, TILE_ENTRY, FORMAT_NAMES, DELTA_EXTENSION
+from segment_storage import SegmentReader, SEGMENT_EXTENSION, RECORD_HEADER as SEGMENT_RECORD_HEADER
+from similarity import (SimilarityIndex, to_signed, BAND_EXPRESSIONS, DEFAULT_MAX_DISTANCE, DEFAULT_INDEX_WORKERS)
+
+# Constants
+CATALOG_FILE = 'catalog.sqlite3'
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_SCAN_WORKERS = 8
+DEFAULT_PAGE_SIZE = 500
+IMAGE_EXTENSIONS = {'png': 'PNG', 'jpeg': 'JPEG', 'jpg': 'JPEG', 'webp': 'WEBP'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS frames (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    day TEXT NOT NULL,
+    monitor INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    offset INTEGER,
+    size INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    content_hash TEXT,
+    perceptual_hash INTEGER
+);
+CREATE INDEX IF NOT EXISTS frames_timestamp ON frames (timestamp);
+CREATE INDEX IF NOT EXISTS frames_monitor_timestamp ON frames (monitor, timestamp);
+CREATE INDEX IF NOT EXISTS frames_day ON frames (day);
+"""
+# Catalogs created before perceptual hashes get the column when they are opened
+MIGRATIONS = (('perceptual_hash', "ALTER TABLE frames ADD COLUMN perceptual_hash INTEGER"),)
+# One index per band of the perceptual hash; the hash itself is in the index too, so search candidates
+# are checked without reading their rows
+SIMILARITY_SCHEMA = "".join(
+    f"CREATE INDEX IF NOT EXISTS frames_perceptual_band_{band} ON frames ({expression}, perceptual_hash) "
+    f"WHERE perceptual_hash IS NOT NULL;\n" for band, expression in enumerate(BAND_EXPRESSIONS))
+COLUMNS = ('timestamp', 'day', 'monitor', 'path', 'offset', 'size', 'format', 'width', 'height', 'content_hash',
+           'perceptual_hash')
+INSERT = f"INSERT INTO frames ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+# Rows found by scanning the folder have no perceptual hash; it is kept from the old rows or backfilled
+SCANNED_COLUMNS = COLUMNS[:-1]
+INSERT_SCANNED = f"INSERT INTO frames ({', '.join(SCANNED_COLUMNS)}) VALUES ({', '.join('?' * len(SCANNED_COLUMNS))})"
+
+
+def content_hash(data):
+    """Return the hash stored in the catalog for a frame's encoded bytes."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class Catalog:
+    """SQLite index of every frame written under an output folder.
+
+    Rows are buffered and inserted in batches; each thread gets its own
+    connection, so the capture writer, retention and the viewer can share
+    one catalog.
+    """
+
+    def __init__(self, root, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.root = root
+        self.path = os.path.join(root, CATALOG_FILE)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._local = threading.local()
+        self._pending = []
+        self._last_flush = time.monotonic()
+        self._pending_lock = threading.Lock()
+
+    def connection(self):
+        """Return this thread's connection, creating the schema on first use."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(self.root, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            existing = {row['name'] for row in connection.execute("PRAGMA table_info(frames)")}
+            for column, statement in MIGRATIONS:
+                if column not in existing:
+                    connection.execute(statement)
+            connection.executescript(SIMILARITY_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def add(self, record):
+        """Queue a SavedFrame for insertion and flush if the batch is full or old enough."""
+        row = (record.timestamp.timestamp(), record.timestamp.strftime(DATE_FOLDER_FORMAT), record.monitor,
+               self.relative_path(record.path), record.offset, record.size, record.format,
+               record.width, record.height, record.content_hash, to_signed(record.perceptual_hash))
+        with self._pending_lock:
+            self._pending.append(row)
+            due = (len(self._pending) >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Insert all queued rows in one transaction."""
+        with self._pending_lock:
+            rows, self._pending = self._pending, []
+            self._last_flush = time.monotonic()
+        if rows:
+            with self.connection() as connection:
+                connection.executemany(INSERT, rows)
+
+    def close(self):
+        """Flush queued rows and close this thread's connection."""
+        self.flush()
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def relative_path(self, path):
+        """Store paths relative to the output folder so the folder can be moved."""
+        try:
+            return os.path.relpath(path, self.root)
+        except ValueError:
+            return path
+
+    def absolute_path(self, path):
+        return os.path.join(self.root, path)
+
+    def frame_at(self, monitor, when):
+        """Return the last catalog row for a monitor at or before `when`, or None."""
+        return self.connection().execute(
+            "SELECT * FROM frames WHERE monitor = ? AND timestamp <= ? ORDER BY timestamp DESC LIMIT 1",
+            (monitor, when.timestamp())).fetchone()
+
+    def frames(self, start=None, end=None, monitor=None):
+        """Return the rows captured in [start, end), optionally for one monitor, in time order."""
+        where, parameters = self._where(start, end, monitor)
+        return self.connection().execute(f"SELECT * FROM frames {where} ORDER BY timestamp, monitor", parameters)
+
+    def newest_frames(self, start=None, end=None, skip_format=None, page_size=DEFAULT_PAGE_SIZE):
+        """Yield the rows captured in [start, end), newest first, reading them a page at a time.
+
+        Each page continues after the last row of the previous one (by
+        timestamp and id), so paging deep into a large catalog costs the
+        same as reading its first page, and nothing is kept in between.
+        """
+        where, parameters = self._where(start, end, None, skip_format)
+        last = None
+        while True:
+            page_where, page_parameters = where, list(parameters)
+            if last is not None:
+                page_where += (" AND " if where else "WHERE ") + "(timestamp < ? OR (timestamp = ? AND id < ?))"
+                page_parameters += [last['timestamp'], last['timestamp'], last['id']]
+            rows = self.connection().execute(
+                f"SELECT * FROM frames {page_where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+                page_parameters + [page_size]).fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            last = rows[-1]
+
+    def count(self, start=None, end=None, monitor=None, skip_format=None):
+        """Return how many rows frames() returns for the same arguments, leaving out one format if given."""
+        where, parameters = self._where(start, end, monitor, skip_format)
+        return self.connection().execute(f"SELECT COUNT(*) FROM frames {where}", parameters).fetchone()[0]
+
+    def monitors(self):
+        """Return the monitor numbers that have frames in the catalog."""
+        return [row[0] for row in self.connection().execute("SELECT DISTINCT monitor FROM frames ORDER BY monitor")]
+
+    @staticmethod
+    def _where(start, end, monitor, skip_format=None):
+        clauses, parameters = [], []
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            parameters.append(start.timestamp())
+        if end is not None:
+            clauses.append("timestamp < ?")
+            parameters.append(end.timestamp())
+        if monitor is not None:
+            clauses.append("monitor = ?")
+            parameters.append(monitor)
+        if skip_format is not None:
+            clauses.append("format != ?")
+            parameters.append(skip_format)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), parameters
+
+    def days(self):
+        """Return (day, frame count, total bytes) for every day in the catalog, oldest first."""
+        return self.connection().execute(
+            "SELECT day, COUNT(*), COALESCE(SUM(size), 0) FROM frames GROUP BY day ORDER BY day").fetchall()
+
+    def delete_day(self, day):
+        """Forget every frame of a day folder name."""
+        self.flush()
+        with self.connection() as connection:
+            connection.execute("DELETE FROM frames WHERE day = ?", (day,))
+
+    def rebuild(self, workers=DEFAULT_SCAN_WORKERS, with_hashes=False, on_progress=None, cancel=None):
+        """Re-scan the output folder and replace the catalog contents; returns the number of rows.
+
+        If `cancel` is set before the scan is done, the catalog is left as
+        it was and None is returned.
+        """
+        self.flush()
+        days = sorted(entry.path for entry in os.scandir(self.root)
+                      if entry.is_dir() and parse_date_folder(entry.name) is not None)
+        scanned = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(scan_day_folder, folder, with_hashes) for folder in days]
+            for number, future in enumerate(futures, start=1):
+                scanned.append(future.result())
+                if cancel is not None and cancel.is_set():
+                    for waiting in futures:
+                        waiting.cancel()
+                    return None
+                if on_progress:
+                    on_progress(number, len(days))
+        rows = [row[:3] + (self.relative_path(row[3]),) + row[4:] for day_rows in scanned for row in day_rows]
+        with self.connection() as connection:
+            # Perceptual hashes cannot be read back from the files, so they are carried over from the old rows.
+            connection.execute("CREATE TEMP TABLE kept_hashes (path TEXT, offset INTEGER, perceptual_hash INTEGER, "
+                               "PRIMARY KEY (path, offset))")
+            connection.execute("INSERT OR IGNORE INTO kept_hashes SELECT path, COALESCE(offset, -1), perceptual_hash "
+                               "FROM frames WHERE perceptual_hash IS NOT NULL")
+            connection.execute("DELETE FROM frames")
+            connection.executemany(INSERT_SCANNED, rows)
+            connection.execute("UPDATE frames SET perceptual_hash = (SELECT perceptual_hash FROM kept_hashes "
+                               "WHERE kept_hashes.path = frames.path AND kept_hashes.offset = COALESCE(frames.offset, -1))")
+            connection.execute("DROP TABLE kept_hashes")
+        return len(rows)
+
+
+class CatalogSink:
+    """Capture-engine sink that records every written frame in its output folder's catalog."""
+
+    def __init__(self, **catalog_options):
+        self.catalog_options = catalog_options
+        self._catalogs = {}
+
+    def catalog(self, root):
+        """Return the catalog of an output folder."""
+        if root not in self._catalogs:
+            self._catalogs[root] = Catalog(root, **self.catalog_options)
+        return self._catalogs[root]
+
+    def add(self, job, record):
+        self.catalog(job.output_folder).add(record)
+
+    def flush(self):
+        for catalog in self._catalogs.values():
+            catalog.flush()
+
+    def close(self):
+        for catalog in self._catalogs.values():
+            catalog.close()
+
+
+def _parse_screenshot_name(name):
+    """Return (monitor, timestamp, format) for screen_{i}_{timestamp}[-{ms}].{ext}, or None."""
+    stem, dot, extension = name.rpartition('.')
+    image_format = IMAGE_EXTENSIONS.get(extension.lower())
+    if not dot or image_format is None or not stem.startswith('screen_'):
+        return None
+    monitor, _, stamp = stem[7:].partition('_')
+    try:
+        timestamp = datetime.datetime.strptime(stamp[:19], TIMESTAMP_FORMAT)
+        if stamp[19:20] == '-':
+            # Milliseconds, added for sub-second capture intervals.
+            timestamp += datetime.timedelta(milliseconds=int(stamp[20:23]))
+        return int(monitor), timestamp, image_format
+    except ValueError:
+        return None
+
+
+def _hash_file(path):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_day_folder(folder, with_hashes=False):
+    """Return catalog rows (with absolute paths) for everything stored in one day folder."""
+    day = os.path.basename(folder)
+    rows = []
+    with os.scandir(folder) as entries:
+        entries = list(entries)
+    for entry in entries:
+        if not entry.is_file():
+            continue
+        parsed = _parse_screenshot_name(entry.name)
+        if parsed is not None:
+            monitor, timestamp, image_format = parsed
+            try:
+                with Image.open(entry.path) as image:
+                    width, height = image.size
+            except OSError:
+                width = height = None
+            rows.append((timestamp.timestamp(), day, monitor, entry.path, None, entry.stat().st_size, image_format,
+                         width, height, _hash_file(entry.path) if with_hashes else None))
+        elif entry.name.endswith('.' + DELTA_EXTENSION) and entry.name.startswith('screen_'):
+            rows.extend(_scan_delta_stream(entry.path, day))
+        elif entry.name.endswith('.' + SEGMENT_EXTENSION) and entry.name.startswith('segment_'):
+            rows.extend(_scan_segment(entry.path, day))
+        elif entry.name == DUPLICATES_LOG:
+            rows.extend(_scan_duplicates_log(entry.path, day, folder))
+    return rows
+
+
+def _scan_delta_stream(path, day):
+    monitor = int(os.path.basename(path)[7:-len(DELTA_EXTENSION) - 1])
+    rows = []
+    with DeltaStreamReader(path) as reader, open(path, 'rb') as f:
+        for timestamp, offset, kind in zip(reader.timestamps, reader.offsets, reader.kinds):
+            f.seek(offset)
+            _, _, _, width, height, _, count, length = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+            size = RECORD_HEADER.size + count * TILE_ENTRY.size + length
+            rows.append((timestamp, day, monitor, path, offset, size, FORMAT_NAMES[kind], width, height, None))
+    return rows
+
+
+def _scan_segment(path, day):
+    rows = []
+    with SegmentReader(path) as reader:
+        for offset, timestamp, monitor in reader.entries:
+            _, _, (width, height), image_format, payload = reader.record(offset)
+            rows.append((timestamp, day, monitor, path, offset, len(payload) + SEGMENT_RECORD_HEADER.size,
+                         image_format, width, height, None))
+            payload.release()
+    return rows
+
+
+def _scan_duplicates_log(path, day, folder):
+    rows = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                timestamp = datetime.datetime.fromisoformat(entry['timestamp'])
+            except (ValueError, KeyError):
+                continue
+            rows.append((timestamp.timestamp(), day, entry['monitor'], entry.get('same_as') or folder, None, 0,
+                         SAME_AS_PREVIOUS, None, None, None))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen Tracker capture catalog")
+    commands = parser.add_subparsers(dest='command', required=True)
+    rebuild = commands.add_parser('rebuild', help="re-scan an output folder and rebuild its catalog")
+    rebuild.add_argument('folder')
+    rebuild.add_argument('--workers', type=int, default=DEFAULT_SCAN_WORKERS)
+    rebuild.add_argument('--hash', action='store_true', help="also hash every file (reads all data)")
+    query = commands.add_parser('query', help="show what was captured on a monitor at a given time")
+    query.add_argument('folder')
+    query.add_argument('--monitor', type=int, required=True)
+    query.add_argument('--at', required=True, help="YYYY-MM-DD HH:MM[:SS]")
+    index = commands.add_parser('index', help="compute the perceptual hash of every frame that has none yet")
+    index.add_argument('folder')
+    index.add_argument('--workers', type=int, default=DEFAULT_INDEX_WORKERS)
+    similar = commands.add_parser('similar', help="find the frames that look like a sample image")
+    similar.add_argument('folder')
+    similar.add_argument('image', help="a screenshot or any image file")
+    similar.add_argument('--distance', type=int, default=DEFAULT_MAX_DISTANCE, help="maximum Hamming distance")
+    similar.add_argument('--monitor', type=int)
+    similar.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args(argv)
+
+    catalog = Catalog(args.folder)
+    if args.command == 'rebuild':
+        start = time.perf_counter()
+        count = catalog.rebuild(workers=args.workers, with_hashes=args.hash)
+        print(f"Indexed {count} frames in {time.perf_counter() - start:.2f}s -> {catalog.path}")
+    elif args.command == 'index':
+        start = time.perf_counter()
+        hashed, failed = SimilarityIndex(catalog).backfill(args.workers)
+        print(f"Hashed {hashed} frames in {time.perf_counter() - start:.2f}s" + (f", {failed} unreadable" if failed else ""))
+    elif args.command == 'similar':
+        similarity = SimilarityIndex(catalog)
+        sample = similarity.hash_of(args.image)
+        start = time.perf_counter()
+        matches = similarity.search(sample, args.distance, args.monitor, args.limit)
+        for distance, row in matches:
+            when = datetime.datetime.fromtimestamp(row['timestamp'])
+            print(f"{distance:>2} {when:%Y-%m-%d %H:%M:%S} {catalog.absolute_path(row['path'])}"
+                  + (f" @ {row['offset']}" if row['offset'] is not None else ""))
+        print(f"{len(matches)} matches in {(time.perf_counter() - start) * 1000:.1f} ms"
+              + (f"; {similarity.missing()} frames are not hashed yet, run 'index'" if similarity.missing() else ""))
+    else:
+        row = catalog.frame_at(args.monitor, datetime.datetime.fromisoformat(args.at))
+        if row is None:
+            print("Nothing captured before that time.")
+            return 1
+        when = datetime.datetime.fromtimestamp(row['timestamp'])
+        print(f"{when:%Y-%m-%d %H:%M:%S} {row['format']} {catalog.absolute_path(row['path'])}"
+              + (f" @ {row['offset']}" if row['offset'] is not None else ""))
+    catalog.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
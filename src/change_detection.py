@@ -0,0 +1,88 @@
+import zlib
+import threading
+from frames import BYTES_PER_PIXEL
+from capture_options import DEDUP_OFF, DEDUP_SKIP, DEDUP_MARK, DEDUP_MODES, DEFAULT_DEDUP_THRESHOLD
+
+# Defaults
+DEFAULT_TILE_SIZE = 128
+DEFAULT_ROW_STEP = 4
+
+
+class TileSignature:
+    """Per-tile CRC32 hashes of a frame, computed over every `row_step`-th row."""
+
+    __slots__ = ('size', 'tile_size', 'columns', 'rows', 'hashes')
+
+    def __init__(self, size, tile_size, columns, rows, hashes):
+        self.size = size
+        self.tile_size = tile_size
+        self.columns = columns
+        self.rows = rows
+        self.hashes = hashes
+
+    @classmethod
+    def from_frame(cls, frame, tile_size=DEFAULT_TILE_SIZE, row_step=DEFAULT_ROW_STEP):
+        """Hash every tile of a frame; with row_step=1 every pixel contributes."""
+        columns = -(-frame.width // tile_size)
+        rows = -(-frame.height // tile_size)
+        tile_bytes = tile_size * BYTES_PER_PIXEL
+        row_bytes = frame.width * BYTES_PER_PIXEL
+        hashes = [0] * (columns * rows)
+        for y in range(0, frame.height, row_step):
+            row = frame.row(y)
+            base = (y // tile_size) * columns
+            for column, x in enumerate(range(0, row_bytes, tile_bytes)):
+                hashes[base + column] = zlib.crc32(row[x:x + tile_bytes], hashes[base + column])
+        return cls(frame.size, tile_size, columns, rows, hashes)
+
+    def changed_tiles(self, other):
+        """Return the (column, row) of every tile that differs from another signature."""
+        if other is None or other.size != self.size or other.tile_size != self.tile_size:
+            return [(i % self.columns, i // self.columns) for i in range(len(self.hashes))]
+        return [(i % self.columns, i // self.columns)
+                for i, (a, b) in enumerate(zip(self.hashes, other.hashes)) if a != b]
+
+    def difference(self, other):
+        """Return the fraction of tiles that differ from another signature (1.0 if incomparable)."""
+        if other is None or other.size != self.size or other.tile_size != self.tile_size:
+            return 1.0
+        changed = sum(1 for a, b in zip(self.hashes, other.hashes) if a != b)
+        return changed / len(self.hashes) if self.hashes else 0.0
+
+
+class ChangeDetector:
+    """Remember the signature of the last saved frame of each monitor and spot repeats."""
+
+    def __init__(self, threshold=DEFAULT_DEDUP_THRESHOLD, tile_size=DEFAULT_TILE_SIZE, row_step=DEFAULT_ROW_STEP):
+        self.threshold = threshold
+        self.tile_size = tile_size
+        self.row_step = row_step
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def signature(self, frame):
+        """Compute the signature used to compare a frame with the previous one."""
+        return TileSignature.from_frame(frame, self.tile_size, self.row_step)
+
+    def difference(self, monitor, signature):
+        """Return the fraction of tiles that changed since the last saved frame (1.0 if there is none)."""
+        with self._lock:
+            last = self._last.get(monitor)
+        return signature.difference(last)
+
+    def is_duplicate(self, monitor, signature):
+        """Return True if the signature is within the threshold of the last saved frame."""
+        return self.difference(monitor, signature) <= self.threshold
+
+    def remember(self, monitor, signature):
+        """Record the signature of a frame that is being saved."""
+        with self._lock:
+            self._last[monitor] = signature
+
+    def reset(self, monitor=None):
+        """Forget the last frame of one monitor, or of all monitors."""
+        with self._lock:
+            if monitor is None:
+                self._last.clear()
+            else:
+                self._last.pop(monitor, None)
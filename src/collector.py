@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import json
+import zipfile
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from uploader import MANIFEST_NAME, HOST_HEADER, BUNDLE_PATH, BUNDLE_EXTENSION
+
+# Constants
+INDEX_FILE = 'index.jsonl'
+BUNDLE_NAME = re.compile(r'^[0-9a-f-]{1,64}$')
+UNSAFE_HOST_CHARACTERS = re.compile(r'[^A-Za-z0-9._-]')
+MAX_BUNDLE_BYTES = 1024 ** 3
+
+# Defaults
+DEFAULT_PORT = 8750
+DEFAULT_FOLDER = 'collected'
+
+
+def valid_host(host):
+    """A host name is used as a folder name, so it must not be empty, '.', '..' or hidden."""
+    return bool(host) and not host.startswith('.')
+
+
+class CollectorHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps the uploaders' connections open between bundles.
+    protocol_version = 'HTTP/1.1'
+
+    def do_PUT(self):
+        collector = self.server.collector
+        name = self.path[len(BUNDLE_PATH):] if self.path.startswith(BUNDLE_PATH) else ''
+        if not BUNDLE_NAME.match(name):
+            self.reply(404, {'error': f"no such resource: {self.path}"})
+            return
+        if collector.token and self.headers.get('Authorization') != f"Bearer {collector.token}":
+            self.reply(401, {'error': "missing or wrong token"})
+            return
+        length = int(self.headers.get('Content-Length') or 0)
+        if not 0 < length <= MAX_BUNDLE_BYTES:
+            self.reply(413 if length else 411, {'error': "a bundle needs a Content-Length of at most 1 GB"})
+            self.close_connection = True
+            return
+        data = self.rfile.read(length)
+        host = UNSAFE_HOST_CHARACTERS.sub('_', self.headers.get(HOST_HEADER) or self.client_address[0])
+        if not valid_host(host):
+            self.reply(400, {'error': f"not a valid host name: {host}"})
+            return
+        try:
+            frames = collector.store(host, name, data)
+        except (ValueError, KeyError, zipfile.BadZipFile) as e:
+            self.reply(400, {'error': f"not a bundle: {e}"})
+            return
+        self.reply(200, {'host': host, 'bundle': name, 'frames': frames})
+
+    def do_GET(self):
+        if self.path != '/':
+            self.reply(404, {'error': f"no such resource: {self.path}"})
+            return
+        self.reply(200, self.server.collector.stats())
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.collector.verbose:
+            super().log_message(format, *args)
+
+
+class Collector:
+    """Reference collector for testing uploads: keeps every bundle it receives, one folder per host.
+
+    Bundles are written as <folder>/<host>/<id>.zip, and the metadata of
+    their frames is appended to <folder>/<host>/index.jsonl. A bundle that
+    was received before is acknowledged again without being stored twice.
+    """
+
+    def __init__(self, folder=DEFAULT_FOLDER, host='127.0.0.1', port=DEFAULT_PORT, token=None, verbose=False):
+        self.folder = folder
+        self.token = token
+        self.verbose = verbose
+        self.received = {'bundles': 0, 'frames': 0, 'bytes': 0, 'duplicates': 0}
+        self._lock = threading.Lock()
+        self._thread = None
+        self.server = ThreadingHTTPServer((host, port), CollectorHandler)
+        self.server.daemon_threads = True
+        self.server.collector = self
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def store(self, host, name, data):
+        """Keep a received bundle; returns the number of frames in it. Raises ValueError if it is not one."""
+        if not valid_host(host) or UNSAFE_HOST_CHARACTERS.search(host):
+            raise ValueError(f"not a valid host name: {host}")
+        folder = os.path.join(self.folder, host)
+        path = os.path.join(folder, name + BUNDLE_EXTENSION)
+        temporary = f"{path}.{threading.get_ident()}.tmp"
+        os.makedirs(folder, exist_ok=True)
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        try:
+            with zipfile.ZipFile(temporary) as bundle:
+                frames = json.loads(bundle.read(MANIFEST_NAME))['frames']
+                if bundle.testzip() is not None:
+                    raise ValueError("a damaged frame")
+            with self._lock:
+                if os.path.exists(path):
+                    self.received['duplicates'] += 1
+                    return len(frames)
+                os.replace(temporary, path)
+                with open(os.path.join(folder, INDEX_FILE), 'a', encoding='utf-8') as f:
+                    for frame in frames:
+                        f.write(json.dumps({**frame, 'bundle': name}) + '\n')
+                self.received['bundles'] += 1
+                self.received['frames'] += len(frames)
+                self.received['bytes'] += len(data)
+            return len(frames)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.received)
+
+    def start(self):
+        """Serve on a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, name="collector", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Receive the bundles uploaded by Screen Tracker (for local testing).")
+    parser.add_argument('--folder', default=DEFAULT_FOLDER, help=f"where to keep them (default {DEFAULT_FOLDER})")
+    parser.add_argument('--host', default='127.0.0.1', help="address to listen on; 0.0.0.0 for every interface")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--token', help="only accept uploads with this token")
+    parser.add_argument('--verbose', action='store_true', help="log every request")
+    args = parser.parse_args(argv)
+    collector = Collector(args.folder, args.host, args.port, args.token, args.verbose)
+    print(f"Collecting into {os.path.abspath(args.folder)} at {collector.url}{BUNDLE_PATH}<id>", file=sys.stderr)
+    try:
+        collector.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
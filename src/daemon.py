@@ -0,0 +1,148 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import multiprocessing
+import datetime
+import subprocess
+from ipc import ControlServer, ControlClient, default_address
+
+# Constants
+SETTINGS_FILE = 'app_settings.json'
+STARTUP_TIMEOUT = 10.0
+
+
+def run(settings_path=SETTINGS_FILE, address=None):
+    """Run the capture service until it is asked to shut down or the process is signalled."""
+    # Imported here: the window uses this module to reach the daemon and must not load the capture stack.
+    from capture_service import CaptureService, read_settings
+    settings = read_settings(settings_path)
+    service = CaptureService(settings)
+    server = ControlServer(service, address)
+    service.on_event = server.publish
+    server.start()
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signal_number, lambda *args: server.close())
+    if settings.get('is_capturing'):
+        try:
+            service.start()
+        except ValueError as e:
+            print(f"Not capturing: {e}", file=sys.stderr)
+    try:
+        # Wake up regularly so signals are handled on Windows as well.
+        while not server.wait(1.0):
+            pass
+    finally:
+        server.close()
+        service.close()
+
+
+def daemon_command(settings_path, address=None):
+    """Return the command line that starts the daemon from this installation."""
+    if getattr(sys, 'frozen', False):
+        command = [sys.executable, '--daemon']
+    else:
+        command = [sys.executable, os.path.abspath(__file__)]
+    command += ['run', '--settings', os.path.abspath(settings_path)]
+    if address:
+        command += ['--address', address]
+    return command
+
+
+def spawn_daemon(settings_path=SETTINGS_FILE, address=None):
+    """Start the daemon as a detached background process and return its Popen."""
+    options = {}
+    if sys.platform == 'win32':
+        options['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        options['start_new_session'] = True
+    return subprocess.Popen(daemon_command(settings_path, address), stdin=subprocess.DEVNULL,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, close_fds=True, **options)
+
+
+def wait_for_daemon(client, timeout=STARTUP_TIMEOUT):
+    """Poll until the daemon answers; returns its status or raises ConnectionError."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return client.request('status')
+        except ConnectionError:
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.05)
+
+
+def connect_daemon(settings_path=SETTINGS_FILE, address=None):
+    """Return (client, spawned) for a running daemon, starting one if none is listening."""
+    client = ControlClient(address)
+    try:
+        client.request('status')
+        return client, False
+    except ConnectionError:
+        spawn_daemon(settings_path, address)
+        wait_for_daemon(client)
+        return client, True
+
+
+def format_status(status):
+    """One line describing a status reply."""
+    stats = status['stats']
+    state = "capturing" if status['capturing'] else "stopped"
+    if status['capturing'] and status['next_capture']:
+        state += f", next capture at {datetime.datetime.fromtimestamp(status['next_capture']):%H:%M:%S}"
+    return (f"{state} | folder: {status['output_folder'] or '-'} | saved {stats['saved']}, blank {stats['blank']}, "
+            f"deduplicated {stats['deduplicated']}, dropped {stats['dropped']}, errors {stats['errors']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen Tracker headless capture daemon")
+    parser.add_argument('--address', default=None, help=f"control socket or pipe (default: {default_address()})")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="run the daemon in the foreground")
+    run_parser.add_argument('--settings', default=SETTINGS_FILE)
+    for name, help_text in (('start', "start capturing"), ('stop', "stop capturing"), ('status', "show the daemon status"),
+                            ('capture', "capture once right away"), ('shutdown', "stop the daemon"),
+                            ('watch', "print status events as they happen")):
+        commands.add_parser(name, help=help_text)
+    configure = commands.add_parser('configure', help="change settings, e.g. configure interval_seconds=0.5")
+    configure.add_argument('settings', nargs='+', metavar='KEY=JSON')
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        run(args.settings, args.address)
+        return 0
+
+    client = ControlClient(args.address)
+    try:
+        if args.command == 'watch':
+            for event in client.events():
+                print(json.dumps(event), flush=True)
+            return 0
+        if args.command == 'configure':
+            changes = {}
+            for item in args.settings:
+                key, _, value = item.partition('=')
+                try:
+                    changes[key] = json.loads(value)
+                except ValueError:
+                    changes[key] = value
+            print(format_status(client.request('configure', settings=changes)))
+        elif args.command == 'capture':
+            client.request('capture_now')
+        elif args.command == 'shutdown':
+            client.request('shutdown')
+        else:
+            print(format_status(client.request(args.command)))
+    except (ConnectionError, RuntimeError, TimeoutError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    finally:
+        client.close()
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main())
@@ -0,0 +1,324 @@
+import os
+import io
+import math
+import struct
+import bisect
+import datetime
+import threading
+from PIL import Image
+from frames import BYTES_PER_PIXEL
+from change_detection import TileSignature, DEFAULT_TILE_SIZE
+from storage import FrameStorage, StorageTask, SavedFrame, date_folder, STORAGE_DELTA
+from encoders import Encoding
+from capture_options import DEFAULT_KEYFRAME_INTERVAL
+
+# Stream layout: screen_{i}.delta holds the records, screen_{i}.delta.idx one INDEX_ENTRY per record.
+DELTA_EXTENSION = 'delta'
+INDEX_SUFFIX = '.idx'
+DELTA_MAGIC = b'STD1'
+KEYFRAME = 0
+DELTA = 1
+RECORD_HEADER = struct.Struct('<4sBdIIHII')  # magic, kind, timestamp, width, height, tile size, tile count, payload length
+TILE_ENTRY = struct.Struct('<HH')  # tile column, tile row
+INDEX_ENTRY = struct.Struct('<dQB')  # timestamp, record offset, kind
+FORMAT_NAMES = {KEYFRAME: 'KEYFRAME', DELTA: 'DELTA'}
+
+# Defaults
+DEFAULT_COMPRESS_LEVEL = 6
+# A delta touching more than this share of the tiles is stored as a keyframe instead
+MAX_DELTA_FRACTION = 0.5
+
+
+def stream_path(root, day, monitor):
+    """Return the delta stream file of a monitor for the given day."""
+    return os.path.join(date_folder(root, day), f"screen_{monitor}.{DELTA_EXTENSION}")
+
+
+def day_streams(folder):
+    """Return {monitor: stream path} for the delta streams in a day folder."""
+    streams = {}
+    for name in os.listdir(folder):
+        stem, dot, extension = name.rpartition('.')
+        if dot and extension == DELTA_EXTENSION and stem.startswith('screen_') and stem[7:].isdigit():
+            streams[int(stem[7:])] = os.path.join(folder, name)
+    return streams
+
+
+def atlas_columns(tile_count):
+    """Number of tile columns in the atlas image of a delta record."""
+    return max(1, math.ceil(math.sqrt(tile_count)))
+
+
+class _StreamState:
+    """Convert-stage view of one monitor stream: what the last stored frame looked like."""
+
+    __slots__ = ('signature', 'since_keyframe', 'day', 'needs_keyframe')
+
+    def __init__(self):
+        self.signature = None
+        self.since_keyframe = 0
+        self.day = None
+        self.needs_keyframe = True
+
+
+class DeltaStorage(FrameStorage):
+    """Store each monitor as a stream of keyframes and changed-tile deltas.
+
+    A full lossless keyframe is written every `keyframe_interval` captures.
+    In between, only the tiles whose pixels differ from the previous capture
+    are stored, packed into one PNG atlas together with their coordinates.
+    Each day and monitor gets one stream file plus a fixed-size index, which
+    DeltaStreamReader uses to rebuild any capture from the nearest keyframe.
+    """
+
+    name = STORAGE_DELTA
+
+    def __init__(self, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL, tile_size=DEFAULT_TILE_SIZE,
+                 compress_level=DEFAULT_COMPRESS_LEVEL):
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.tile_size = tile_size
+        self.compress_level = compress_level
+        self._encoding = Encoding(f"png-{compress_level}", 'PNG', {'compress_level': compress_level})
+        self._streams = {}
+        self._broken = set()
+        self._lock = threading.Lock()
+        self._known_folders = set()
+
+    def prepare(self, job, frame, pool):
+        key = (job.output_folder, frame.monitor)
+        with self._lock:
+            state = self._streams.setdefault(key, _StreamState())
+            # Cleared in the same step as it is read, so a discard() on a writer thread is never lost.
+            needs_keyframe, state.needs_keyframe = state.needs_keyframe, False
+        signature = TileSignature.from_frame(frame, self.tile_size, row_step=1)
+        day = job.timestamp.date()
+
+        tiles = None
+        if not (needs_keyframe or state.day != day or state.since_keyframe >= self.keyframe_interval - 1):
+            tiles = signature.changed_tiles(state.signature)
+            if len(tiles) > MAX_DELTA_FRACTION * len(signature.hashes):
+                tiles = None
+
+        if tiles is None:
+            image = pool.decode(frame)
+            if image is None:
+                if needs_keyframe:
+                    with self._lock:
+                        state.needs_keyframe = True
+                return None
+            task = StorageTask(self, job, frame.monitor, image, pooled=True, extra=(frame.size, None))
+            state.since_keyframe = 0
+        else:
+            image = self._build_atlas(frame, tiles) if tiles else None
+            task = StorageTask(self, job, frame.monitor, image, extra=(frame.size, tiles))
+            state.since_keyframe += 1
+        state.signature = signature
+        state.day = day
+        return task
+
+    def _build_atlas(self, frame, tiles):
+        """Copy the changed tiles out of the raw frame into one compact image."""
+        size = self.tile_size
+        columns = atlas_columns(len(tiles))
+        rows = math.ceil(len(tiles) / columns)
+        atlas = Image.new("RGB", (columns * size, rows * size))
+        for n, (column, row) in enumerate(tiles):
+            x, y = column * size, row * size
+            width, height = min(size, frame.width - x), min(size, frame.height - y)
+            offset = frame.offset + y * frame.stride + x * BYTES_PER_PIXEL
+            tile = Image.frombuffer("RGB", (width, height), frame.buffer[offset:], "raw", "BGRX", frame.stride, 1)
+            atlas.paste(tile, ((n % columns) * size, (n // columns) * size))
+        return atlas
+
+    def encode(self, task, backend):
+        if task.image is None:
+            task.data = b''
+            return
+        task.data, _ = backend.encode(self._encoding, task.image)
+
+    def write(self, task):
+        job = task.job
+        (width, height), tiles = task.extra
+        kind = KEYFRAME if tiles is None else DELTA
+        key = (job.output_folder, task.monitor)
+        if kind == DELTA and key in self._broken:
+            # The chain this delta builds on was lost; wait for the next keyframe.
+            return []
+        self._broken.discard(key)
+
+        tiles = tiles or ()
+        timestamp = job.timestamp.timestamp()
+        record = b''.join([
+            RECORD_HEADER.pack(DELTA_MAGIC, kind, timestamp, width, height, self.tile_size, len(tiles), len(task.data)),
+            b''.join(TILE_ENTRY.pack(column, row) for column, row in tiles),
+            task.data,
+        ])
+        path = stream_path(job.output_folder, job.timestamp, task.monitor)
+        folder = os.path.dirname(path)
+        if folder not in self._known_folders:
+            os.makedirs(folder, exist_ok=True)
+            self._known_folders.add(folder)
+        try:
+            offset = self._append(path, record)
+        except FileNotFoundError:
+            # The day folder was removed underneath us (e.g. by "Clean Folders").
+            os.makedirs(folder, exist_ok=True)
+            offset = self._append(path, record)
+        with open(path + INDEX_SUFFIX, 'ab') as f:
+            f.write(INDEX_ENTRY.pack(timestamp, offset, kind))
+        return [SavedFrame(job.timestamp, task.monitor, path, len(record), FORMAT_NAMES[kind], width, height,
+                           offset=offset, content_hash=task.content_hash, perceptual_hash=task.perceptual_hash)]
+
+    def _append(self, path, record):
+        with open(path, 'ab') as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(record)
+        return offset
+
+    def discard(self, task):
+        key = (task.job.output_folder, task.monitor)
+        self._broken.add(key)
+        with self._lock:
+            state = self._streams.get(key)
+            if state is not None:
+                state.needs_keyframe = True
+
+
+class DeltaStreamReader:
+    """Random access to the captures of one delta stream file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._cache = None
+        self._load_index()
+
+    def _load_index(self):
+        try:
+            with open(self.path + INDEX_SUFFIX, 'rb') as f:
+                data = f.read()
+            usable = len(data) - len(data) % INDEX_ENTRY.size
+            entries = list(INDEX_ENTRY.iter_unpack(data[:usable]))
+        except FileNotFoundError:
+            entries = []
+        if entries and entries[0][1] != 0:
+            # The index was recreated after the stream started; it cannot be trusted.
+            entries = []
+        self.timestamps, self.offsets, self.kinds, self._keyframes = [], [], [], []
+        self._add(entries)
+        # Records written after the index was last updated (e.g. a crash between the two writes).
+        self.refresh()
+
+    def refresh(self):
+        """Pick up the records appended to the stream since it was opened, reading only their headers."""
+        self._add(list(self._scan_records(self._record_end(self.offsets[-1]) if self.offsets else 0)))
+
+    def _add(self, entries):
+        for timestamp, offset, kind in entries:
+            if kind == KEYFRAME:
+                self._keyframes.append(len(self.offsets))
+            self.timestamps.append(timestamp)
+            self.offsets.append(offset)
+            self.kinds.append(kind)
+
+    def _record_end(self, offset):
+        self._file.seek(offset)
+        _, _, _, _, _, _, count, length = RECORD_HEADER.unpack(self._file.read(RECORD_HEADER.size))
+        return offset + RECORD_HEADER.size + count * TILE_ENTRY.size + length
+
+    def _scan_records(self, offset):
+        """Read record headers from `offset` to the end of the stream, stopping at a truncated record."""
+        self._file.seek(0, os.SEEK_END)
+        end = self._file.tell()
+        while offset + RECORD_HEADER.size <= end:
+            self._file.seek(offset)
+            magic, kind, timestamp, _, _, _, count, length = RECORD_HEADER.unpack(self._file.read(RECORD_HEADER.size))
+            next_offset = offset + RECORD_HEADER.size + count * TILE_ENTRY.size + length
+            if magic != DELTA_MAGIC or next_offset > end:
+                return
+            yield timestamp, offset, kind
+            offset = next_offset
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def times(self):
+        """Return the capture time of every record."""
+        return [datetime.datetime.fromtimestamp(timestamp) for timestamp in self.timestamps]
+
+    def position_at(self, when):
+        """Return the index of the last capture taken at or before `when`, or -1."""
+        return bisect.bisect_right(self.timestamps, when.timestamp()) - 1
+
+    def frame_at(self, when):
+        """Rebuild the screen as it was at `when`, or return None if nothing was captured yet."""
+        position = self.position_at(when)
+        return self.frame(position) if position >= 0 else None
+
+    def frame(self, position):
+        """Rebuild the capture at a record index as an RGB image."""
+        if not 0 <= position < len(self.timestamps):
+            raise IndexError(position)
+        keyframe_slot = bisect.bisect_right(self._keyframes, position) - 1
+        if keyframe_slot < 0:
+            raise ValueError(f"{self.path}: no keyframe before record {position}")
+        keyframe = self._keyframes[keyframe_slot]
+
+        if self._cache and keyframe <= self._cache[0] <= position:
+            start, image = self._cache[0] + 1, self._cache[1].copy()
+        else:
+            start, image = keyframe + 1, self._read_keyframe(keyframe)
+        for index in range(start, position + 1):
+            image = self._apply(image, index)
+        self._cache = (position, image)
+        return image.copy()
+
+    def _read_record(self, position):
+        self._file.seek(self.offsets[position])
+        magic, kind, _, width, height, tile_size, count, length = RECORD_HEADER.unpack(self._file.read(RECORD_HEADER.size))
+        if magic != DELTA_MAGIC:
+            raise ValueError(f"{self.path}: corrupt record {position}")
+        tiles = list(TILE_ENTRY.iter_unpack(self._file.read(count * TILE_ENTRY.size)))
+        payload = self._file.read(length)
+        return kind, (width, height), tile_size, tiles, payload
+
+    def _read_keyframe(self, position):
+        _, _, _, _, payload = self._read_record(position)
+        with Image.open(io.BytesIO(payload)) as image:
+            return image.convert("RGB")
+
+    def _apply(self, image, position):
+        kind, size, tile_size, tiles, payload = self._read_record(position)
+        if kind == KEYFRAME:
+            return self._read_keyframe(position)
+        if not tiles:
+            return image
+        if size != image.size:
+            raise ValueError(f"{self.path}: record {position} does not match its keyframe size")
+        columns = atlas_columns(len(tiles))
+        with Image.open(io.BytesIO(payload)) as atlas:
+            atlas.load()
+            for n, (column, row) in enumerate(tiles):
+                x, y = column * tile_size, row * tile_size
+                width, height = min(tile_size, size[0] - x), min(tile_size, size[1] - y)
+                ax, ay = (n % columns) * tile_size, (n // columns) * tile_size
+                image.paste(atlas.crop((ax, ay, ax + width, ay + height)), (x, y))
+        return image
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_capture(root, monitor, when):
+    """Rebuild what a monitor showed at `when` from that day's delta stream, or return None."""
+    path = stream_path(root, when, monitor)
+    if not os.path.exists(path):
+        return None
+    with DeltaStreamReader(path) as reader:
+        return reader.frame_at(when)
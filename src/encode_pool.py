@@ -0,0 +1,188 @@
+import os
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from PIL import Image
+from capture_options import ENCODE_BACKEND_THREADS, ENCODE_BACKEND_PROCESSES, ENCODE_BACKENDS
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7
+    shared_memory = None
+
+# Defaults
+CPU_COUNT = os.cpu_count() or 1
+THREAD_WORKERS = min(4, CPU_COUNT)
+MAX_PROCESS_WORKERS = 8
+# Encode threads in the capture engine; they only dispatch, each backend bounds its own parallelism
+DISPATCH_THREADS = max(THREAD_WORKERS, min(MAX_PROCESS_WORKERS, CPU_COUNT))
+
+
+def process_workers(monitor_count):
+    """One worker per captured monitor, leaving a core for grabbing, up to MAX_PROCESS_WORKERS."""
+    return max(1, min(monitor_count, CPU_COUNT - 1, MAX_PROCESS_WORKERS))
+
+
+def build_encode_backend(mode, monitor_count=1):
+    """Create the encode backend for a mode; falls back to threads if worker processes are unavailable."""
+    if mode != ENCODE_BACKEND_PROCESSES:
+        return ThreadEncoder()
+    if shared_memory is None:
+        return ThreadEncoder(fallback="multiprocessing.shared_memory needs Python 3.8")
+    try:
+        return ProcessEncoder(process_workers(monitor_count))
+    except (OSError, ValueError) as e:
+        return ThreadEncoder(fallback=f"worker processes could not be started: {e}")
+
+
+class EncodeBackend:
+    """Where Encoding.encode() runs. encode() is called concurrently from the capture engine's encode threads."""
+
+    name = None
+
+    def __init__(self, workers, fallback=None):
+        self.workers = workers
+        self.fallback = fallback
+        self._started = time.monotonic()
+        self._usage = {}
+        self._usage_lock = threading.Lock()
+
+    def encode(self, encoding, image):
+        """Return (encoded bytes, (width, height) as stored)."""
+        raise NotImplementedError
+
+    def close(self):
+        """Release worker processes and shared memory."""
+
+    def _note(self, worker, seconds):
+        with self._usage_lock:
+            frames, busy = self._usage.get(worker, (0, 0.0))
+            self._usage[worker] = (frames + 1, busy + seconds)
+
+    def stats(self):
+        """Backend name, worker count and, per worker, frames encoded and the share of time spent encoding."""
+        elapsed = max(1e-9, time.monotonic() - self._started)
+        with self._usage_lock:
+            per_worker = {worker: {'frames': frames, 'busy_seconds': round(busy, 3),
+                                   'utilization': round(busy / elapsed, 3)}
+                          for worker, (frames, busy) in self._usage.items()}
+        return {'backend': self.name, 'workers': self.workers, 'fallback': self.fallback, 'per_worker': per_worker}
+
+
+class ThreadEncoder(EncodeBackend):
+    """Encode on the calling thread, with at most `workers` encodes at a time."""
+
+    name = ENCODE_BACKEND_THREADS
+
+    def __init__(self, workers=THREAD_WORKERS, fallback=None):
+        super().__init__(workers, fallback)
+        self._slots = threading.Semaphore(workers)
+
+    def encode(self, encoding, image):
+        with self._slots:
+            start = time.perf_counter()
+            result = encoding.encode(image)
+            self._note(threading.current_thread().name, time.perf_counter() - start)
+        return result
+
+
+def _encode_shared(block_name, size, encoding):
+    """Worker process: encode the RGB pixels in a shared memory block."""
+    start = time.perf_counter()
+    block = shared_memory.SharedMemory(name=block_name)
+    try:
+        with block.buf[:size[0] * size[1] * 3] as pixels:
+            image = Image.frombytes("RGB", size, pixels)
+    finally:
+        block.close()
+    data, stored_size = encoding.encode(image)
+    return data, stored_size, os.getpid(), time.perf_counter() - start
+
+
+class ProcessEncoder(EncodeBackend):
+    """Encode in a pool of worker processes, so zlib/libjpeg/libwebp work is not bound to one interpreter.
+
+    Pixels are unpacked to RGB bytes and copied into a shared memory block
+    that the worker reads in place (Pillow cannot unpack into a buffer
+    directly); only the encoding settings go through the pipe, and the
+    compressed result comes back. Blocks are reused between frames. If the
+    pool breaks (e.g. a worker was killed), this and every later frame are
+    encoded in-process and `fallback` says why.
+    """
+
+    name = ENCODE_BACKEND_PROCESSES
+
+    def __init__(self, workers):
+        super().__init__(workers)
+        # Worker processes are spawned, not forked: forking a process that runs capture threads is not safe.
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self._free_blocks = []
+        self._blocks_lock = threading.Lock()
+        self._closed = False
+        self._in_process = ThreadEncoder(workers)
+        for _ in range(workers):
+            self._executor.submit(os.getpid)  # start the workers now rather than on the first capture
+
+    def encode(self, encoding, image):
+        if self.fallback is not None:
+            return self._in_process.encode(encoding, image)
+        try:
+            block = self._lease(image.width * image.height * 3)
+        except OSError as e:
+            self.fallback = f"shared memory unavailable: {e}"
+            return self._in_process.encode(encoding, image)
+        try:
+            block.buf[:image.width * image.height * 3] = image.tobytes()
+            data, stored_size, pid, seconds = self._executor.submit(
+                _encode_shared, block.name, image.size, encoding).result()
+        except (BrokenProcessPool, RuntimeError) as e:
+            # RuntimeError: the pool was shut down while this frame was waiting.
+            self.fallback = f"worker pool stopped: {e or type(e).__name__}"
+            return self._in_process.encode(encoding, image)
+        finally:
+            self._release(block)
+        self._note(f"pid {pid}", seconds)
+        return data, stored_size
+
+    def _lease(self, size):
+        """Return a shared memory block of at least `size` bytes."""
+        with self._blocks_lock:
+            fitting = [block for block in self._free_blocks if block.size >= size]
+            if fitting:
+                block = min(fitting, key=lambda block: block.size)
+                self._free_blocks.remove(block)
+                return block
+            if self._free_blocks:
+                # The capture size changed; a block too small for it will not be needed again soon.
+                self._destroy(self._free_blocks.pop(0))
+        return shared_memory.SharedMemory(create=True, size=size)
+
+    def _release(self, block):
+        with self._blocks_lock:
+            if self._closed:
+                self._destroy(block)
+            else:
+                self._free_blocks.append(block)
+
+    def _destroy(self, block):
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        stats = super().stats()
+        for worker, usage in self._in_process.stats()['per_worker'].items():
+            stats['per_worker'][f"in-process {worker}"] = usage
+        return stats
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._blocks_lock:
+            self._closed = True
+            blocks, self._free_blocks = self._free_blocks, []
+        for block in blocks:
+            self._destroy(block)
@@ -0,0 +1,238 @@
+import io
+import time
+import threading
+import collections
+from PIL import Image, features
+from capture_options import (FORMAT_PNG, FORMAT_JPEG, FORMAT_WEBP, FORMAT_WEBP_LOSSLESS, FORMAT_AUTO, SCREENSHOT_FORMATS,
+                             DEFAULT_BYTE_BUDGET_MB, DEFAULT_ENCODE_BUDGET_MS)
+
+# Settings that change how frames are encoded
+ENCODER_SETTINGS = ('screenshot_format', 'png_compress_level', 'jpeg_quality', 'webp_quality', 'downscale',
+                    'byte_budget_mb_per_hour', 'encode_budget_ms')
+
+# Defaults
+DEFAULT_PNG_COMPRESS_LEVEL = 1
+DEFAULT_JPEG_QUALITY = 85
+DEFAULT_WEBP_QUALITY = 80
+BYTES_PER_MB = 1024 ** 2
+# Weight of the newest measurement in the per-encoding size and time estimates
+ESTIMATE_WEIGHT = 0.25
+# Number of recent frames whose timestamps give the observed frame rate
+RATE_WINDOW = 64
+# How far spending may run ahead of (or behind) the hourly budget, in seconds of budget
+BUCKET_SECONDS = 600
+# Bounds of the correction applied to the per-frame allowance while over or under budget
+MIN_ALLOWANCE_FACTOR = 0.25
+MAX_ALLOWANCE_FACTOR = 2.0
+# Every this many frames encoded below the best encoding, try the next better one to refresh its estimate
+PROBE_INTERVAL = 30
+
+
+def webp_supported():
+    return features.check('webp')
+
+
+class Encoding:
+    """One way of storing a frame: a Pillow format with its save options, optionally downscaled."""
+
+    __slots__ = ('name', 'format', 'options', 'scale', 'bytes_per_pixel', 'ms_per_megapixel')
+
+    def __init__(self, name, format, options=None, scale=1.0, bytes_per_pixel=0.5, ms_per_megapixel=20.0):
+        self.name = name
+        self.format = format
+        self.options = options or {}
+        self.scale = scale
+        # Starting estimates for screen content, replaced by measurements as frames are encoded.
+        self.bytes_per_pixel = bytes_per_pixel
+        self.ms_per_megapixel = ms_per_megapixel
+
+    @property
+    def extension(self):
+        return self.format.lower()
+
+    def encode(self, image):
+        """Return (encoded bytes, (width, height) as stored)."""
+        if self.scale < 1.0:
+            size = (max(1, round(image.width * self.scale)), max(1, round(image.height * self.scale)))
+            image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        image.save(buffer, format=self.format, **self.options)
+        return buffer.getvalue(), image.size
+
+
+def fixed_encoding(screenshot_format, png_compress_level=DEFAULT_PNG_COMPRESS_LEVEL, jpeg_quality=DEFAULT_JPEG_QUALITY,
+                   webp_quality=DEFAULT_WEBP_QUALITY, scale=1.0):
+    """Return the Encoding used for every frame by one of the fixed screenshot formats."""
+    if screenshot_format == FORMAT_JPEG:
+        return Encoding(f"jpeg-q{jpeg_quality}", 'JPEG', {'quality': jpeg_quality}, scale)
+    if screenshot_format in (FORMAT_WEBP, FORMAT_WEBP_LOSSLESS):
+        if not webp_supported():
+            raise ValueError("this Pillow build cannot write WebP")
+        if screenshot_format == FORMAT_WEBP_LOSSLESS:
+            return Encoding("webp-lossless", 'WEBP', {'lossless': True, 'quality': 0, 'method': 0}, scale)
+        return Encoding(f"webp-q{webp_quality}", 'WEBP', {'quality': webp_quality, 'method': 2}, scale)
+    if screenshot_format != FORMAT_PNG:
+        raise ValueError(f"unknown screenshot format: {screenshot_format}")
+    return Encoding(f"png-{png_compress_level}", 'PNG', {'compress_level': png_compress_level}, scale)
+
+
+def encoding_ladder():
+    """Encodings the budget policy chooses from, best quality first."""
+    ladder = [Encoding("png-1", 'PNG', {'compress_level': 1}, bytes_per_pixel=0.3, ms_per_megapixel=55.0)]
+    if webp_supported():
+        ladder.append(Encoding("webp-lossless", 'WEBP', {'lossless': True, 'quality': 0, 'method': 0},
+                               bytes_per_pixel=0.25, ms_per_megapixel=55.0))
+    ladder.append(Encoding("jpeg-q90", 'JPEG', {'quality': 90}, bytes_per_pixel=0.3, ms_per_megapixel=7.0))
+    if webp_supported():
+        ladder.append(Encoding("webp-q80", 'WEBP', {'quality': 80, 'method': 2},
+                               bytes_per_pixel=0.15, ms_per_megapixel=85.0))
+    ladder.append(Encoding("jpeg-q75", 'JPEG', {'quality': 75}, bytes_per_pixel=0.2, ms_per_megapixel=6.0))
+    if webp_supported():
+        ladder.append(Encoding("webp-q70-75%", 'WEBP', {'quality': 70, 'method': 2}, scale=0.75,
+                               bytes_per_pixel=0.13, ms_per_megapixel=55.0))
+    ladder.append(Encoding("jpeg-q70-75%", 'JPEG', {'quality': 70}, scale=0.75,
+                           bytes_per_pixel=0.18, ms_per_megapixel=18.0))
+    ladder.append(Encoding("jpeg-q60-50%", 'JPEG', {'quality': 60}, scale=0.5,
+                           bytes_per_pixel=0.15, ms_per_megapixel=13.0))
+    return ladder
+
+
+def build_encoder(settings):
+    """Create the EncoderPolicy described by the settings dict."""
+    screenshot_format = settings.get('screenshot_format', FORMAT_PNG)
+    if screenshot_format == FORMAT_AUTO:
+        return BudgetEncoder(encoding_ladder(),
+                             float(settings.get('byte_budget_mb_per_hour') or DEFAULT_BYTE_BUDGET_MB) * BYTES_PER_MB,
+                             float(settings.get('encode_budget_ms') or DEFAULT_ENCODE_BUDGET_MS) / 1000)
+    scale = min(1.0, max(0.1, float(settings.get('downscale') or 1.0)))
+    return FixedEncoder(fixed_encoding(screenshot_format,
+                                       int(settings.get('png_compress_level', DEFAULT_PNG_COMPRESS_LEVEL)),
+                                       int(settings.get('jpeg_quality', DEFAULT_JPEG_QUALITY)),
+                                       int(settings.get('webp_quality', DEFAULT_WEBP_QUALITY)), scale))
+
+
+class EncoderPolicy:
+    """Decides how each frame is encoded and keeps count of what it cost.
+
+    encode() is called concurrently from the capture engine's encode workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'frames': 0, 'bytes': 0, 'encode_ms': 0.0, 'by_encoding': {}}
+
+    def choose(self, pixels, timestamp):
+        """Return the Encoding for a frame of `pixels` pixels captured at `timestamp` (seconds)."""
+        raise NotImplementedError
+
+    def measured(self, encoding, pixels, seconds, size, timestamp):
+        """Learn from a frame that was just encoded (lock held)."""
+
+    def encode(self, image, timestamp, backend=None):
+        """Encode an RGB image, on `backend` if given; returns (bytes, (width, height) as stored, Encoding)."""
+        pixels = image.width * image.height
+        with self._lock:
+            encoding = self.choose(pixels, timestamp)
+        start = time.perf_counter()
+        data, size = backend.encode(encoding, image) if backend else encoding.encode(image)
+        seconds = time.perf_counter() - start
+        with self._lock:
+            self._stats['frames'] += 1
+            self._stats['bytes'] += len(data)
+            self._stats['encode_ms'] += seconds * 1000
+            by_encoding = self._stats['by_encoding']
+            by_encoding[encoding.name] = by_encoding.get(encoding.name, 0) + 1
+            self.measured(encoding, pixels, seconds, len(data), timestamp)
+        return data, size, encoding
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['by_encoding'] = dict(stats['by_encoding'])
+            return stats
+
+
+class FixedEncoder(EncoderPolicy):
+    """Encode every frame the same way."""
+
+    def __init__(self, encoding):
+        super().__init__()
+        self.encoding = encoding
+
+    def choose(self, pixels, timestamp):
+        return self.encoding
+
+
+class BudgetEncoder(EncoderPolicy):
+    """Pick the best encoding per frame that fits a bytes-per-hour and a per-frame encode-time budget.
+
+    Every encoding keeps running estimates of its output bytes and encode
+    time per pixel, updated from each frame it encodes. A frame gets the
+    first encoding in the ladder whose estimates fit both its share of the
+    hourly budget and the time budget, or the last one if none does.
+
+    A frame's share is the hourly budget divided by the observed frame rate,
+    corrected by a bucket that fills at the budgeted rate and drains by what
+    was actually written: while spending runs ahead of the budget the share
+    shrinks, while it runs behind the share grows. Because estimates of the
+    better encodings would otherwise go stale, one is re-measured every
+    PROBE_INTERVAL frames.
+    """
+
+    def __init__(self, ladder, bytes_per_hour, encode_budget):
+        super().__init__()
+        self.ladder = list(ladder)
+        self.byte_rate = bytes_per_hour / 3600
+        self.encode_budget = encode_budget
+        self._capacity = self.byte_rate * BUCKET_SECONDS
+        self._bucket = self._capacity / 2
+        self._bucket_time = None
+        self._timestamps = collections.deque(maxlen=RATE_WINDOW)
+        self._since_probe = 0
+
+    def frame_allowance(self):
+        """Bytes the next frame may use, or None until the frame rate is known."""
+        if len(self._timestamps) < 2:
+            return None
+        span = max(self._timestamps) - min(self._timestamps)
+        if span <= 0:
+            return None
+        frames_per_second = (len(self._timestamps) - 1) / span
+        factor = self._bucket / (self._capacity / 2) if self._capacity else 1.0
+        factor = min(MAX_ALLOWANCE_FACTOR, max(MIN_ALLOWANCE_FACTOR, factor))
+        return self.byte_rate / frames_per_second * factor
+
+    def choose(self, pixels, timestamp):
+        self._timestamps.append(timestamp)
+        allowance = self.frame_allowance()
+        chosen = len(self.ladder) - 1
+        for level, encoding in enumerate(self.ladder):
+            size = encoding.bytes_per_pixel * pixels * encoding.scale ** 2
+            seconds = encoding.ms_per_megapixel * pixels / 1e9
+            if (allowance is None or size <= allowance) and seconds <= self.encode_budget:
+                chosen = level
+                break
+        if chosen > 0:
+            self._since_probe += 1
+            if self._since_probe >= PROBE_INTERVAL:
+                self._since_probe = 0
+                chosen -= 1
+        return self.ladder[chosen]
+
+    def measured(self, encoding, pixels, seconds, size, timestamp):
+        stored_pixels = max(1.0, pixels * encoding.scale ** 2)
+        encoding.bytes_per_pixel += ESTIMATE_WEIGHT * (size / stored_pixels - encoding.bytes_per_pixel)
+        encoding.ms_per_megapixel += ESTIMATE_WEIGHT * (seconds * 1e9 / pixels - encoding.ms_per_megapixel)
+        if self._bucket_time is not None and timestamp > self._bucket_time:
+            self._bucket = min(self._capacity, self._bucket + self.byte_rate * (timestamp - self._bucket_time))
+        if self._bucket_time is None or timestamp > self._bucket_time:
+            self._bucket_time = timestamp
+        self._bucket = max(-self._capacity, self._bucket - size)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['allowance'] = self.frame_allowance()
+            stats['estimates'] = {encoding.name: (round(encoding.bytes_per_pixel, 4), round(encoding.ms_per_megapixel, 1))
+                                  for encoding in self.ladder}
+        return stats
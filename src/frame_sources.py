@@ -0,0 +1,363 @@
+import os
+import math
+import random
+import functools
+from frames import Frame, BYTES_PER_PIXEL
+from storage import SAME_AS_PREVIOUS
+from capture_options import CAPTURE_MODE_PER_MONITOR, CAPTURE_MODE_VIRTUAL_SCREEN, CAPTURE_MODES
+
+# Frame sources
+SOURCE_MSS = 'mss'
+SOURCE_SYNTHETIC = 'synthetic'
+SOURCE_REPLAY = 'replay'
+FRAME_SOURCES = (SOURCE_MSS, SOURCE_SYNTHETIC, SOURCE_REPLAY)
+
+# Defaults
+DEFAULT_SYNTHETIC_MONITORS = ((1920, 1080),)
+# Chance that a monitor changes between two grabs, and how much of it changes when it does
+DEFAULT_CHANGE_RATE = 0.5
+DEFAULT_CHANGE_AREA = 0.05
+DEFAULT_REPLAY_FRAMES = 30
+# Synthetic desktop layout, in pixels
+TASKBAR_HEIGHT = 40
+TITLE_BAR_HEIGHT = 28
+LINE_HEIGHT = 16
+GLYPH_ROWS = range(4, 13)
+
+
+def union_rect(monitors):
+    """Return the smallest mss monitor dict that covers all the given monitors."""
+    left = min(m['left'] for m in monitors)
+    top = min(m['top'] for m in monitors)
+    right = max(m['left'] + m['width'] for m in monitors)
+    bottom = max(m['top'] + m['height'] for m in monitors)
+    return {'left': left, 'top': top, 'width': right - left, 'height': bottom - top}
+
+
+def area_frames(buffer, area, monitors, indexes):
+    """Cut the given monitors out of one BGRA grab of `area`, as views into its buffer."""
+    buffer = memoryview(buffer)
+    stride = area['width'] * BYTES_PER_PIXEL
+    frames = []
+    for i in indexes:
+        monitor = monitors[i]
+        x = monitor['left'] - area['left']
+        y = monitor['top'] - area['top']
+        frames.append(Frame(i, monitor['width'], monitor['height'], buffer,
+                            y * stride + x * BYTES_PER_PIXEL, stride))
+    return frames
+
+
+def build_frame_source(settings):
+    """Return a factory that creates the frame source described by the settings, given a capture mode."""
+    kind = settings.get('kind', SOURCE_MSS)
+    if kind == SOURCE_SYNTHETIC:
+        return functools.partial(SyntheticFrameSource,
+                                 monitors=[tuple(size) for size in settings.get('monitors', DEFAULT_SYNTHETIC_MONITORS)],
+                                 change_rate=float(settings.get('change_rate', DEFAULT_CHANGE_RATE)),
+                                 change_area=float(settings.get('change_area', DEFAULT_CHANGE_AREA)),
+                                 seed=settings.get('seed', 0))
+    if kind == SOURCE_REPLAY:
+        if not settings.get('folder'):
+            raise ValueError("a replay frame source needs a folder")
+        return functools.partial(ReplayFrameSource, folder=settings['folder'],
+                                 frames=int(settings.get('frames', DEFAULT_REPLAY_FRAMES)))
+    if kind != SOURCE_MSS:
+        raise ValueError(f"unknown frame source: {kind}")
+    return MssFrameSource
+
+
+class FrameSource:
+    """Where the capture engine's frames come from.
+
+    monitors() follows mss: index 0 is the whole virtual screen and the
+    others are the monitors. grab() returns one Frame per existing monitor
+    asked for, cut from a single grab in CAPTURE_MODE_VIRTUAL_SCREEN. A
+    source is opened, used and closed on one thread.
+    """
+
+    def __init__(self, mode=CAPTURE_MODE_PER_MONITOR):
+        self.mode = mode
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def monitors(self):
+        raise NotImplementedError
+
+    def grab(self, indexes):
+        raise NotImplementedError
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class MssFrameSource(FrameSource):
+    """Grab frames through one long-lived mss session.
+
+    In CAPTURE_MODE_PER_MONITOR every selected monitor is grabbed separately.
+    In CAPTURE_MODE_VIRTUAL_SCREEN the desktop area covering the selected
+    monitors is grabbed once and each monitor is returned as a view into that
+    single buffer, so all monitors are captured at the same instant.
+
+    mss handles belong to the thread that opened them, so a source must be
+    opened, used and closed on one thread.
+    """
+
+    def __init__(self, mode=CAPTURE_MODE_PER_MONITOR):
+        super().__init__(mode)
+        self._sct = None
+
+    def open(self):
+        """Open the mss session if it is not open yet."""
+        if self._sct is None:
+            # Imported on first use, which is on a background thread in the window.
+            from mss import mss
+            self._sct = mss()
+
+    def close(self):
+        """Close the mss session."""
+        if self._sct is not None:
+            self._sct.close()
+            self._sct = None
+
+    def monitors(self):
+        """Return the mss monitor list; index 0 is the whole virtual screen."""
+        self.open()
+        return self._sct.monitors
+
+    def grab(self, indexes):
+        """Grab the given monitor indexes and return one Frame per monitor that exists."""
+        monitors = self.monitors()
+        indexes = [i for i in indexes if 0 < i < len(monitors)]
+        if self.mode == CAPTURE_MODE_VIRTUAL_SCREEN and len(indexes) > 1:
+            return self._grab_virtual_screen(monitors, indexes)
+        return [self._grab_monitor(i, monitors[i]) for i in indexes]
+
+    def _grab_monitor(self, index, monitor):
+        shot = self._sct.grab(monitor)
+        return Frame(index, shot.width, shot.height, shot.raw)
+
+    def _grab_virtual_screen(self, monitors, indexes):
+        if len(indexes) == len(monitors) - 1:
+            area = monitors[0]
+        else:
+            area = union_rect([monitors[i] for i in indexes])
+        shot = self._sct.grab(area)
+        return area_frames(shot.raw, {'left': shot.left, 'top': shot.top, 'width': shot.width}, monitors, indexes)
+
+
+class CanvasFrameSource(FrameSource):
+    """A frame source that draws a virtual desktop in memory, for running without a display.
+
+    Monitors are laid out side by side on one BGRA canvas. Every grab first
+    lets the subclass update the canvas, then copies the monitors out of it,
+    so frames stay valid while the canvas moves on, as mss grabs do.
+    """
+
+    def __init__(self, mode=CAPTURE_MODE_PER_MONITOR, sizes=()):
+        super().__init__(mode)
+        self._monitors = None
+        self._canvas = None
+        if sizes:
+            self.layout(sizes)
+
+    def layout(self, sizes):
+        """Place monitors of the given (width, height) from left to right and clear the canvas."""
+        monitors, left = [], 0
+        for width, height in sizes:
+            monitors.append({'left': left, 'top': 0, 'width': width, 'height': height})
+            left += width
+        self._monitors = [union_rect(monitors)] + monitors
+        self._canvas = bytearray(left * max(height for _, height in sizes) * BYTES_PER_PIXEL)
+
+    def monitors(self):
+        self.open()
+        return self._monitors
+
+    def grab(self, indexes):
+        monitors = self.monitors()
+        indexes = [i for i in indexes if 0 < i < len(monitors)]
+        self.advance(indexes)
+        if self.mode == CAPTURE_MODE_VIRTUAL_SCREEN and len(indexes) > 1:
+            area = union_rect([monitors[i] for i in indexes])
+            return area_frames(self.copy(area), area, monitors, indexes)
+        return [Frame(i, monitors[i]['width'], monitors[i]['height'], self.copy(monitors[i])) for i in indexes]
+
+    def advance(self, indexes):
+        """Update the canvas before the given monitors are grabbed."""
+
+    def copy(self, area):
+        """Return the BGRA pixels of an area of the canvas in a new buffer."""
+        stride = self._monitors[0]['width'] * BYTES_PER_PIXEL
+        row_bytes = area['width'] * BYTES_PER_PIXEL
+        start = area['left'] * BYTES_PER_PIXEL
+        if row_bytes == stride:
+            return bytearray(self._canvas[area['top'] * stride:(area['top'] + area['height']) * stride])
+        data = bytearray(row_bytes * area['height'])
+        canvas = memoryview(self._canvas)
+        for y in range(area['height']):
+            offset = (area['top'] + y) * stride + start
+            data[y * row_bytes:(y + 1) * row_bytes] = canvas[offset:offset + row_bytes]
+        return data
+
+    def paint(self, monitor, x, y, rows):
+        """Draw BGRA rows (bytes, one per line) on a monitor at (x, y), clipped to the monitor."""
+        if not rows:
+            return
+        stride = self._monitors[0]['width'] * BYTES_PER_PIXEL
+        width = min(monitor['width'] - x, len(rows[0]) // BYTES_PER_PIXEL)
+        for n, row in enumerate(rows[:monitor['height'] - y]):
+            offset = (monitor['top'] + y + n) * stride + (monitor['left'] + x) * BYTES_PER_PIXEL
+            self._canvas[offset:offset + width * BYTES_PER_PIXEL] = row[:width * BYTES_PER_PIXEL]
+
+
+class SyntheticFrameSource(CanvasFrameSource):
+    """Generate desktop-like frames: a wallpaper, a taskbar and windows full of text-like lines.
+
+    Before every grab each monitor changes with probability change_rate:
+    a block covering change_area of it is redrawn with new text, as when
+    typing or scrolling. The sequence of frames depends only on the seed,
+    so runs can be compared with each other.
+    """
+
+    def __init__(self, mode=CAPTURE_MODE_PER_MONITOR, monitors=DEFAULT_SYNTHETIC_MONITORS,
+                 change_rate=DEFAULT_CHANGE_RATE, change_area=DEFAULT_CHANGE_AREA, seed=0):
+        super().__init__(mode)
+        self.sizes = list(monitors)
+        self.change_rate = change_rate
+        self.change_area = change_area
+        self.seed = seed
+        self._random = None
+        self._glyphs = None
+
+    def open(self):
+        if self._monitors is None:
+            self._random = random.Random(self.seed)
+            self.layout(self.sizes)
+            # One long row of "glyphs" per glyph line; text lines are slices of them.
+            width = self._monitors[0]['width'] * 2
+            self._glyphs = [self._glyph_row(width) for _ in GLYPH_ROWS]
+            try:
+                for monitor in self._monitors[1:]:
+                    self._paint_desktop(monitor)
+            except Exception:
+                self._monitors = None  # painted again by the next open
+                raise
+
+    def advance(self, indexes):
+        for i in indexes:
+            if self._random.random() < self.change_rate:
+                monitor = self._monitors[i]
+                area = self.change_area * monitor['width'] * monitor['height']
+                width = min(monitor['width'], max(LINE_HEIGHT, int(math.sqrt(area * 2))))
+                height = min(monitor['height'], max(LINE_HEIGHT, int(area / width)))
+                x = self._random.randrange(monitor['width'] - width + 1)
+                y = self._random.randrange(monitor['height'] - height + 1)
+                self.paint(monitor, x, y, self._text(width, height))
+
+    def _glyph_row(self, width):
+        """BGRA bytes of dark runs (glyph strokes) and white gaps."""
+        row = bytearray(b'\xff' * width * BYTES_PER_PIXEL)
+        x = 0
+        while x < width:
+            run = self._random.choice((1, 1, 2, 3))
+            if self._random.random() < 0.45:
+                row[x * BYTES_PER_PIXEL:(x + run) * BYTES_PER_PIXEL] = b'\x20\x20\x20\xff' * min(run, width - x)
+            x += run + self._random.choice((1, 1, 2, 6))
+        return bytes(row)
+
+    def _text(self, width, height, background=b'\xff\xff\xff\xff'):
+        """Rows of text lines of random length on a plain background."""
+        blank = background * width
+        rows = []
+        while len(rows) < height:
+            shift = self._random.randrange(len(self._glyphs[0]) // BYTES_PER_PIXEL - width) * BYTES_PER_PIXEL
+            length = self._random.randrange(width // 4, width + 1) * BYTES_PER_PIXEL
+            for y in range(LINE_HEIGHT):
+                if y in GLYPH_ROWS:
+                    glyphs = self._glyphs[y - GLYPH_ROWS.start]
+                    rows.append(glyphs[shift:shift + length] + blank[length:])
+                else:
+                    rows.append(blank)
+        return rows[:height]
+
+    def _paint_desktop(self, monitor):
+        width, height = monitor['width'], monitor['height']
+        # A vertical gradient wallpaper
+        self.paint(monitor, 0, 0, [bytes((120 + y * 100 // height, 80, 30, 255)) * width for y in range(height)])
+        # Windows fit above the taskbar; a monitor too small for a title bar gets none.
+        usable = height - TASKBAR_HEIGHT
+        for _ in range(self._random.randint(2, 4) if usable >= TITLE_BAR_HEIGHT else 0):
+            window_width = self._random.randint(max(1, width // 4), max(1, width * 3 // 4))
+            shortest = max(TITLE_BAR_HEIGHT, min(height // 4, usable))
+            window_height = self._random.randint(shortest, max(shortest, min(height * 3 // 4, usable)))
+            x = self._random.randrange(width - window_width + 1)
+            y = self._random.randrange(usable - window_height + 1)
+            title = bytes((self._random.randrange(256), self._random.randrange(256), 90, 255)) * window_width
+            self.paint(monitor, x, y, [title] * TITLE_BAR_HEIGHT)
+            self.paint(monitor, x, y + TITLE_BAR_HEIGHT, self._text(window_width, window_height - TITLE_BAR_HEIGHT))
+        self.paint(monitor, 0, max(0, usable), [b'\x30\x30\x30\xff' * width] * min(TASKBAR_HEIGHT, height))
+
+
+class ReplayFrameSource(CanvasFrameSource):
+    """Replay frames recorded by Screen Tracker, monitor by monitor, over and over.
+
+    The last `frames` frames of every monitor in an output folder's catalog
+    are decoded once when the source is opened; each grab shows the next
+    one. A monitor's frames must all have the size of its latest frame;
+    others are skipped.
+    """
+
+    def __init__(self, mode=CAPTURE_MODE_PER_MONITOR, folder=None, frames=DEFAULT_REPLAY_FRAMES):
+        super().__init__(mode)
+        self.folder = folder
+        self.frames = frames
+        self._recorded = None
+        self._positions = None
+
+    def open(self):
+        if self._recorded is not None:
+            return
+        from catalog import Catalog, CATALOG_FILE
+        from thumbnails import FrameLoader
+        catalog = Catalog(self.folder)
+        try:
+            if not os.path.exists(os.path.join(self.folder, CATALOG_FILE)):
+                catalog.rebuild()
+            rows = [row for row in catalog.frames() if row['format'] != SAME_AS_PREVIOUS]
+        finally:
+            catalog.close()
+        by_monitor = {}
+        for row in rows:
+            by_monitor.setdefault(row['monitor'], []).append(row)
+        if not by_monitor:
+            raise ValueError(f"no recorded frames in {self.folder}")
+        loader = FrameLoader()
+        self._recorded, sizes = [], []
+        for monitor in sorted(by_monitor):
+            latest = by_monitor[monitor][-1]
+            size = (latest['width'], latest['height'])
+            matching = [row for row in by_monitor[monitor] if (row['width'], row['height']) == size]
+            self._recorded.append([
+                loader.load(catalog.absolute_path(row['path']), row['offset'], row['format']).convert('RGBA')
+                .tobytes('raw', 'BGRA') for row in matching[-self.frames:]])
+            sizes.append(size)
+        self.layout(sizes)
+        self._positions = [0] * len(self._recorded)
+
+    def advance(self, indexes):
+        for i in indexes:
+            monitor = self._monitors[i]
+            frames = self._recorded[i - 1]
+            data = frames[self._positions[i - 1] % len(frames)]
+            self._positions[i - 1] += 1
+            row_bytes = monitor['width'] * BYTES_PER_PIXEL
+            self.paint(monitor, 0, 0, [data[y * row_bytes:(y + 1) * row_bytes] for y in range(monitor['height'])])
@@ -0,0 +1,106 @@
+import threading
+from PIL import Image
+
+BYTES_PER_PIXEL = 4
+DEFAULT_POOL_SLOTS = 8
+# A size that has not been requested for this many acquisitions is released
+POOL_IDLE_ACQUISITIONS = 64
+
+
+class Frame:
+    """A BGRA pixel region inside a capture buffer.
+
+    The frame does not own its pixels: it is a view (offset + stride) into the
+    buffer returned by the grab, so a monitor cut out of a full virtual-screen
+    grab costs no copy.
+    """
+
+    __slots__ = ('monitor', 'width', 'height', 'buffer', 'offset', 'stride')
+
+    def __init__(self, monitor, width, height, buffer, offset=0, stride=None):
+        self.monitor = monitor
+        self.width = width
+        self.height = height
+        self.buffer = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+        self.offset = offset
+        self.stride = stride or width * BYTES_PER_PIXEL
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def row(self, y):
+        """Return the BGRA bytes of row y as a memoryview."""
+        start = self.offset + y * self.stride
+        return self.buffer[start:start + self.width * BYTES_PER_PIXEL]
+
+    def to_image(self):
+        """Decode the frame into a new RGB PIL image."""
+        return Image.frombuffer("RGB", self.size, self.buffer[self.offset:], "raw", "BGRX", self.stride, 1)
+
+    def decode_into(self, image):
+        """Decode the frame into an existing RGB image of the same size, reusing its memory."""
+        image.frombytes(self.buffer[self.offset:], "raw", "BGRX", self.stride, 1)
+        return image
+
+
+class FramePool:
+    """A bounded ring of preallocated RGB images reused between capture ticks.
+
+    At most `slots` images exist per frame size. Once the ring is warm, decoding
+    a frame allocates nothing proportional to its resolution. When every slot is
+    in use acquire() returns None so the caller can drop the frame.
+    """
+
+    def __init__(self, slots=DEFAULT_POOL_SLOTS):
+        self.slots = slots
+        self._free = {}
+        self._allocated = {}
+        self._last_used = {}
+        self._acquisitions = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, size):
+        """Return a free RGB image of the given size, or None if the ring is exhausted."""
+        with self._lock:
+            self._acquisitions += 1
+            self._last_used[size] = self._acquisitions
+            self._evict_idle_sizes()
+            free = self._free.setdefault(size, [])
+            if free:
+                return free.pop()
+            if self._allocated.get(size, 0) >= self.slots:
+                return None
+            self._allocated[size] = self._allocated.get(size, 0) + 1
+        return Image.new("RGB", size)
+
+    def release(self, image):
+        """Return an image to the ring."""
+        with self._lock:
+            if image.size in self._allocated:
+                self._free.setdefault(image.size, []).append(image)
+
+    def decode(self, frame):
+        """Decode a frame into a pooled image, or return None if no slot is free."""
+        image = self.acquire(frame.size)
+        if image is None:
+            return None
+        try:
+            return frame.decode_into(image)
+        except Exception:
+            self.release(image)
+            raise
+
+    def stats(self):
+        """Return the number of allocated and free images per size."""
+        with self._lock:
+            return {size: (count, len(self._free.get(size, ()))) for size, count in self._allocated.items()}
+
+    def _evict_idle_sizes(self):
+        # Drop the ring for a resolution that is no longer captured, once all of its images are back.
+        for size, last_used in list(self._last_used.items()):
+            if (self._acquisitions - last_used > POOL_IDLE_ACQUISITIONS
+                    and len(self._free.get(size, ())) == self._allocated.get(size, 0)):
+                self._free.pop(size, None)
+                self._allocated.pop(size, None)
+                del self._last_used[size]
@@ -0,0 +1,94 @@
+import sys
+import ctypes
+import ctypes.util
+import threading
+
+
+class _LastInputInfo(ctypes.Structure):
+    _fields_ = [('cbSize', ctypes.c_uint), ('dwTime', ctypes.c_uint)]
+
+
+class _XScreenSaverInfo(ctypes.Structure):
+    _fields_ = [('window', ctypes.c_ulong), ('state', ctypes.c_int), ('kind', ctypes.c_int),
+                ('til_or_since', ctypes.c_ulong), ('idle', ctypes.c_ulong), ('eventMask', ctypes.c_ulong)]
+
+
+class InputIdleMonitor:
+    """Seconds since the last keyboard or mouse input, where the platform can tell.
+
+    Uses GetLastInputInfo on Windows, CoreGraphics on macOS and the X11
+    screen saver extension elsewhere. idle_seconds() returns None when none
+    of them is available (e.g. Wayland or no display). It may be called
+    from any thread: the X11 display connection and the structures the
+    queries fill in are shared, so one query runs at a time.
+    """
+
+    def __init__(self):
+        self._query = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def idle_seconds(self):
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    self._query = self._load()
+                except (OSError, AttributeError):
+                    self._query = None
+            if self._query is None:
+                return None
+            try:
+                return self._query()
+            except OSError:
+                return None
+
+    def _load(self):
+        if sys.platform == 'win32':
+            return self._load_windows()
+        if sys.platform == 'darwin':
+            return self._load_macos()
+        return self._load_x11()
+
+    def _load_windows(self):
+        user32, kernel32 = ctypes.windll.user32, ctypes.windll.kernel32
+        kernel32.GetTickCount.restype = ctypes.c_uint
+        info = _LastInputInfo()
+        info.cbSize = ctypes.sizeof(info)
+
+        def query():
+            if not user32.GetLastInputInfo(ctypes.byref(info)):
+                return None
+            return ((kernel32.GetTickCount() - info.dwTime) & 0xFFFFFFFF) / 1000.0
+        return query
+
+    def _load_macos(self):
+        quartz = ctypes.CDLL(ctypes.util.find_library('ApplicationServices'))
+        seconds_since = quartz.CGEventSourceSecondsSinceLastEventType
+        seconds_since.restype = ctypes.c_double
+        seconds_since.argtypes = [ctypes.c_int, ctypes.c_uint32]
+        hid_system_state, any_input_event = 1, 0xFFFFFFFF
+        return lambda: seconds_since(hid_system_state, any_input_event)
+
+    def _load_x11(self):
+        x11_path, xss_path = ctypes.util.find_library('X11'), ctypes.util.find_library('Xss')
+        if not x11_path or not xss_path:
+            return None
+        x11, xss = ctypes.CDLL(x11_path), ctypes.CDLL(xss_path)
+        x11.XOpenDisplay.restype = ctypes.c_void_p
+        x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+        x11.XDefaultRootWindow.restype = ctypes.c_ulong
+        x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+        xss.XScreenSaverAllocInfo.restype = ctypes.POINTER(_XScreenSaverInfo)
+        xss.XScreenSaverQueryInfo.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.POINTER(_XScreenSaverInfo)]
+        display = x11.XOpenDisplay(None)
+        if not display:
+            return None
+        root = x11.XDefaultRootWindow(display)
+        info = xss.XScreenSaverAllocInfo()
+
+        def query():
+            if not xss.XScreenSaverQueryInfo(display, root, info):
+                return None
+            return info.contents.idle / 1000.0
+        return query
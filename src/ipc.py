@@ -0,0 +1,195 @@
+import os
+import sys
+import json
+import queue
+import getpass
+import tempfile
+import threading
+from multiprocessing.connection import Listener, Client
+
+# Constants
+PIPE_PREFIX = '\\\\.\\pipe\\'
+ADDRESS_VARIABLE = 'SCREENTRACKER_ADDRESS'
+DEFAULT_TIMEOUT = 5.0
+# Events waiting to be sent to status subscribers; when full, new events are dropped
+EVENT_QUEUE_SIZE = 1000
+
+
+def default_address():
+    """Return the per-user control channel: a named pipe on Windows, a Unix socket elsewhere.
+
+    SCREENTRACKER_ADDRESS overrides it, e.g. to run a second daemon for testing.
+    """
+    if os.environ.get(ADDRESS_VARIABLE):
+        return os.environ[ADDRESS_VARIABLE]
+    if sys.platform == 'win32':
+        return f"{PIPE_PREFIX}ScreenTracker-{getpass.getuser()}"
+    folder = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(folder, f"screentracker-{os.getuid()}.sock")
+
+
+def send_message(connection, message):
+    connection.send_bytes(json.dumps(message).encode('utf-8'))
+
+
+def receive_message(connection):
+    return json.loads(connection.recv_bytes().decode('utf-8'))
+
+
+class ControlServer:
+    """Serve control requests for a CaptureService over a local socket or named pipe.
+
+    Every message is a JSON object. A request names a `command` and gets one
+    reply with `ok` set; a client that sends {"command": "subscribe"} instead
+    receives a stream of events until it disconnects.
+    """
+
+    def __init__(self, service, address=None):
+        self.service = service
+        self.address = address or default_address()
+        self._listener = None
+        self._subscribers = []
+        self._subscribers_lock = threading.Lock()
+        self._events = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self._closed = threading.Event()
+        self._commands = {
+            'status': lambda message: service.status(),
+            'start': lambda message: service.start(),
+            'stop': lambda message: service.stop(),
+            'capture_now': lambda message: service.capture_now(),
+            'configure': lambda message: service.configure(message.get('settings', {})),
+            'shutdown': lambda message: self.close(),
+        }
+
+    def start(self):
+        """Bind the control channel and start accepting clients."""
+        if not self.address.startswith(PIPE_PREFIX) and os.path.exists(self.address):
+            try:
+                Client(self.address).close()
+            except OSError:
+                os.remove(self.address)  # left behind by a daemon that did not exit cleanly
+            else:
+                raise RuntimeError(f"a capture daemon is already listening on {self.address}")
+        previous_umask = os.umask(0o177)  # only the current user may connect
+        try:
+            self._listener = Listener(self.address)
+        finally:
+            os.umask(previous_umask)
+        threading.Thread(target=self._accept_loop, name="ipc-accept", daemon=True).start()
+        threading.Thread(target=self._feed_loop, name="ipc-feed", daemon=True).start()
+
+    def wait(self, timeout=None):
+        """Block until the server is closed (e.g. by a 'shutdown' request)."""
+        return self._closed.wait(timeout)
+
+    def close(self):
+        """Stop accepting clients and disconnect every subscriber."""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._events.put(None)
+        if self._listener is not None:
+            try:
+                self._listener.close()
+            except OSError:
+                pass
+        with self._subscribers_lock:
+            for connection in self._subscribers:
+                connection.close()
+            self._subscribers = []
+
+    def publish(self, event):
+        """Queue an event (a JSON-serializable dict with an 'event' key) for every subscriber."""
+        try:
+            self._events.put_nowait(event)
+        except queue.Full:
+            pass
+
+    def _accept_loop(self):
+        while not self._closed.is_set():
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                continue
+            threading.Thread(target=self._serve, args=(connection,), name="ipc-client", daemon=True).start()
+
+    def _serve(self, connection):
+        try:
+            while not self._closed.is_set():
+                message = receive_message(connection)
+                command = message.get('command')
+                if command == 'subscribe':
+                    send_message(connection, {'event': 'status', **self.service.status()})
+                    with self._subscribers_lock:
+                        self._subscribers.append(connection)
+                    return
+                handler = self._commands.get(command)
+                if handler is None:
+                    reply = {'ok': False, 'error': f"unknown command: {command}"}
+                else:
+                    try:
+                        reply = {'ok': True, 'result': handler(message)}
+                    except Exception as e:
+                        reply = {'ok': False, 'error': str(e)}
+                send_message(connection, reply)
+        except (EOFError, OSError, ValueError):
+            connection.close()
+
+    def _feed_loop(self):
+        while True:
+            event = self._events.get()
+            if event is None:
+                return
+            with self._subscribers_lock:
+                for connection in list(self._subscribers):
+                    try:
+                        send_message(connection, event)
+                    except (OSError, ValueError):
+                        connection.close()
+                        self._subscribers.remove(connection)
+
+
+class ControlClient:
+    """Talk to a running capture daemon."""
+
+    def __init__(self, address=None, timeout=DEFAULT_TIMEOUT):
+        self.address = address or default_address()
+        self.timeout = timeout
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def request(self, command, **arguments):
+        """Send a command and return its result; raises ConnectionError if the daemon is not reachable."""
+        with self._lock:
+            try:
+                if self._connection is None:
+                    self._connection = Client(self.address)
+                send_message(self._connection, {'command': command, **arguments})
+                if not self._connection.poll(self.timeout):
+                    raise TimeoutError(f"no reply to '{command}' within {self.timeout}s")
+                reply = receive_message(self._connection)
+            except (EOFError, OSError) as e:
+                self.close()
+                raise ConnectionError(f"capture daemon not reachable at {self.address}: {e}") from e
+        if not reply.get('ok'):
+            raise RuntimeError(reply.get('error'))
+        return reply.get('result')
+
+    def events(self):
+        """Yield status events from the daemon until it disconnects."""
+        try:
+            connection = Client(self.address)
+        except OSError as e:
+            raise ConnectionError(f"capture daemon not reachable at {self.address}: {e}") from e
+        with connection:
+            send_message(connection, {'command': 'subscribe'})
+            while True:
+                try:
+                    yield receive_message(connection)
+                except (EOFError, OSError):
+                    return
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
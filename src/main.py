@@ -1,17 +1,24 @@
 import sys
 import os
-import datetime
-import json
-import shutil
 import time
-import subprocess
+# Taken before the other imports, so that the startup times include them
+STARTUP_STARTED = time.perf_counter()
+import json
+import threading
+import multiprocessing
 from PyQt5.QtWidgets import (QApplication, QMenu, qApp, QSystemTrayIcon, QGroupBox, QWidget, QVBoxLayout, QPushButton, QFileDialog, QLabel, QLineEdit, QMessageBox, QComboBox, QCheckBox, QDialog, QListWidget, QAbstractItemView, QDialogButtonBox, QScrollArea)
-from PyQt5.QtCore import QTimer, QDateTime, Qt
+from PyQt5.QtCore import QTimer, QDateTime, Qt, QObject, pyqtSignal
 from PyQt5.QtGui import QIcon, QPixmap
-from mss import mss
-from PIL import Image, ImageChops
-from dateutil.relativedelta import relativedelta
-import psutil  # Ensure psutil is imported
+from storage import STORAGE_MODES, STORAGE_FILES
+from scheduler import SCHEDULE_MODES, SCHEDULE_FIXED, MIN_INTERVAL, DEFAULT_INTERVAL
+from retention import DEFAULT_RETENTION_DAYS
+# Not the capture modules themselves: they load PIL and psutil, which the window only needs later, off the GUI thread.
+from capture_options import (SCREENSHOT_FORMATS, FORMAT_PNG, FORMAT_AUTO, FORMAT_WEBP, FORMAT_WEBP_LOSSLESS,
+                             DEFAULT_BYTE_BUDGET_MB, DEFAULT_ENCODE_BUDGET_MS, DEFAULT_KEYFRAME_INTERVAL,
+                             CAPTURE_MODES, CAPTURE_MODE_PER_MONITOR, DEDUP_MODES, DEDUP_OFF, DEFAULT_DEDUP_THRESHOLD,
+                             ENCODE_BACKENDS, ENCODE_BACKEND_THREADS, DEFAULT_EXPORT_INTERVAL)
+from ipc import ControlClient
+from daemon import connect_daemon, main as daemon_main, STARTUP_TIMEOUT
 
 # Constants
 SETTINGS_FILE = 'app_settings.json'
@@ -22,6 +29,10 @@ SUPPORTED_LANGUAGES = {
     "Polish": "polish"
 }
 TRAY_ICON_TOOLTIP = "app_title"
+# screenshot_browser.DEFAULT_PIXMAP_CACHE_MB; the browser and the catalog are only imported when they are opened
+DEFAULT_THUMBNAIL_CACHE_MB = 128
+# Milliseconds since the process started at which the window was built, shown, attached to the daemon and knew the monitors
+STARTUP_PHASES = ('ui', 'shown', 'daemon', 'monitors')
 
 # Determine if the app is frozen using PyInstaller
 if getattr(sys, 'frozen', False):
@@ -33,36 +44,206 @@ icon_folder_path = os.path.join(current_path, 'icons')
 icon_path = os.path.join(icon_folder_path, 'app_icon.ico')
 
 
+# Parsed language files, so that each one is read once however often the language changes
+_translations = {}
+
+
 def load_translations(language_code):
     """Load translations from the specified language file."""
+    if language_code in _translations:
+        return _translations[language_code]
     translation_file = os.path.join(current_path, 'lang', f'{language_code}.json')
     try:
         with open(translation_file, 'r', encoding='utf-8') as file:
-            return json.load(file)
+            translations = _translations[language_code] = json.load(file)
+            return translations
     except FileNotFoundError:
         QMessageBox.warning(None, "Translation Error", f"Translation file for language '{language_code}' not found.")
         return {}
 
 
+class CaptureSignals(QObject):
+    """Qt signals used to report capture daemon events back to the GUI thread."""
+    status = pyqtSignal(object)
+    error = pyqtSignal(str)
+    disconnected = pyqtSignal()
+    connected = pyqtSignal(object, bool)
+    connect_failed = pyqtSignal(str)
+
+
+class StartupSignals(QObject):
+    """Qt signals used to hand the results of the background startup work to the GUI thread."""
+    monitors = pyqtSignal(int)
+    webp = pyqtSignal(bool)
+    finished = pyqtSignal(object)
+
+
+def read_settings_file():
+    """Return the saved settings, or an empty dict before the first save."""
+    try:
+        with open(SETTINGS_FILE) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def read_number(settings, key, convert, default):
+    """Return a numeric setting, or the default if it is missing, empty or not a number."""
+    try:
+        return convert(settings.get(key) or default)
+    except (TypeError, ValueError):
+        return default
+
+
 class WorkTrackerApp(QWidget):
     def __init__(self):
         super().__init__()
-        self.language_code = DEFAULT_LANGUAGE
+        self.startup_times = {}
+        # The saved language is loaded up front, so the widgets are created in it rather than translated afterwards.
+        saved_settings = read_settings_file()
+        self.language_code = saved_settings.get('language_code', DEFAULT_LANGUAGE)
         self.translations = load_translations(self.language_code)
         self.tr = lambda key: self.translations.get(key, key)
         self.screenshots_folder = None
         self.dark_mode_enabled = False
-        self.screenshot_format = 'PNG'
-        self.monitor_selection = []
-        self.retention_period_days = 30
+        self.screenshot_format = FORMAT_PNG
+        self.capture_mode = CAPTURE_MODE_PER_MONITOR
+        self.blank_detection = {}
+        self.dedup_mode = DEDUP_OFF
+        self.dedup_threshold = DEFAULT_DEDUP_THRESHOLD
+        self.storage_mode = STORAGE_FILES
+        self.encode_backend = ENCODE_BACKEND_THREADS
+        self.keyframe_interval = DEFAULT_KEYFRAME_INTERVAL
+        self.schedule_mode = SCHEDULE_FIXED
+        self.frame_source = {}
+        self.upload = {}
+        self.monitor_selection = saved_settings.get('selected_monitors', [])
+        self.monitor_count = saved_settings.get('monitor_count', 0)
+        self.retention_period_days = DEFAULT_RETENTION_DAYS
+        self.max_total_gb = 0
+        self.min_free_gb = 0
+        self.thumbnail_cache_mb = DEFAULT_THUMBNAIL_CACHE_MB
+        self.metrics_interval_seconds = DEFAULT_EXPORT_INTERVAL
+        self.metrics_folder = ''
         self.is_capturing = False
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.take_and_save_screenshots)
+        # Set when Start or Stop was pressed while the daemon was being reattached
+        self.resume_capture = None
+        self.daemon_status = {}
+        # The window is sampled on its own; the daemon's sampler also counts its encode worker processes.
+        self.window_sampler = None
+        self.usage = None
+        self.daemon_sampler = None
+        self.init_daemon_client()
 
         self.init_ui()
         self.load_settings()
         self.init_tray_icon()
-        self.init_cleanup_timer()
+        self.start_monitor_probe()
+        self.record_startup('ui')
+
+    def init_daemon_client(self):
+        """Attach to the capture daemon on a background thread, starting it if needed; the window is usable meanwhile."""
+        self.capture_signals = CaptureSignals()
+        self.capture_signals.status.connect(self.on_daemon_status)
+        self.capture_signals.error.connect(self.on_capture_error)
+        self.capture_signals.disconnected.connect(self.on_daemon_disconnected)
+        self.capture_signals.connected.connect(self.on_daemon_connected)
+        self.capture_signals.connect_failed.connect(self.on_daemon_failed)
+        self.startup_signals = StartupSignals()
+        self.startup_signals.monitors.connect(self.on_monitors_probed)
+        self.startup_signals.webp.connect(self.on_webp_probed)
+        self.daemon, self.owns_daemon = ControlClient(), False
+        self.attach_daemon()
+        qApp.aboutToQuit.connect(self.detach_daemon)
+
+    def attach_daemon(self):
+        """Attach to the daemon, or start one, on a background thread; commands wait until it answers."""
+        self.daemon_ready = False
+        self.started_daemon = None
+        self.daemon_thread = threading.Thread(target=self.connect_daemon_in_background, name="daemon-connect", daemon=True)
+        self.daemon_thread.start()
+
+    def connect_daemon_in_background(self):
+        try:
+            self.started_daemon = connect_daemon(SETTINGS_FILE)
+        except ConnectionError as e:
+            self.capture_signals.connect_failed.emit(str(e))
+        else:
+            self.capture_signals.connected.emit(*self.started_daemon)
+
+    def on_daemon_connected(self, daemon, owns_daemon):
+        """Hand the settings to the daemon once it answers and resume capturing if it was on when the window closed."""
+        self.daemon, self.owns_daemon = daemon, owns_daemon
+        self.daemon_ready = True
+        self.start_event_feed()
+        self.record_startup('daemon')
+        resume, self.resume_capture = self.resume_capture, None
+        if resume or (resume is None and self.is_capturing):
+            self.start_capture()
+        else:
+            self.push_daemon_settings()
+
+    def on_daemon_failed(self, message):
+        """Report that no daemon could be started; the next command tries again."""
+        self.daemon_ready = True
+        self.on_daemon_disconnected()
+        self.record_startup('daemon')
+        QMessageBox.warning(None, "Screen Tracker", message)
+
+    def record_startup(self, phase):
+        """Note when a startup phase was reached, and report the phases once all of them were."""
+        if phase in self.startup_times:
+            return
+        self.startup_times[phase] = round((time.perf_counter() - STARTUP_STARTED) * 1000, 1)
+        if all(name in self.startup_times for name in STARTUP_PHASES):
+            self.startup_signals.finished.emit(dict(self.startup_times))
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.record_startup('shown')
+
+    def start_event_feed(self):
+        """Relay the daemon's status events to the GUI thread from a background thread."""
+        threading.Thread(target=self.follow_daemon_events, name="daemon-events", daemon=True).start()
+
+    def follow_daemon_events(self):
+        try:
+            for event in self.daemon.events():
+                kind = event.pop('event', None)
+                if kind == 'status':
+                    self.capture_signals.status.emit(event)
+                elif kind == 'error':
+                    self.capture_signals.error.emit(event['message'])
+        except ConnectionError:
+            pass
+        self.capture_signals.disconnected.emit()
+
+    def daemon_request(self, command, **arguments):
+        """Send a command to the capture daemon; returns None if it went away, and a new one is attached in the background."""
+        if not self.daemon_ready:
+            return None
+        try:
+            return self.daemon.request(command, **arguments)
+        except ConnectionError:
+            self.attach_daemon()
+            self.statusIndicator.setText(self.tr("daemon_connecting"))
+            self.startButton.setEnabled(False)
+            self.stopButton.setEnabled(False)
+            return None
+
+    def detach_daemon(self):
+        """Stop the daemon on exit if this window started it; a daemon started on its own keeps running."""
+        if not self.daemon_ready:
+            # Quitting while the daemon starts: wait for it, so that one started for this window is not left behind.
+            self.daemon_thread.join(STARTUP_TIMEOUT)
+            if self.started_daemon:
+                self.daemon, self.owns_daemon = self.started_daemon
+        if self.owns_daemon:
+            try:
+                self.daemon.request('shutdown')
+            except (ConnectionError, RuntimeError):
+                pass
+        self.daemon.close()
 
     def init_ui(self):
         """Initialize the UI components."""
@@ -98,22 +279,92 @@ class WorkTrackerApp(QWidget):
         self.browseButton.clicked.connect(self.set_output_folder)
         generalLayout.addWidget(self.browseButton)
 
-        self.intervalInput = QLineEdit("5")
-        self.intervalLabel = QLabel(self.tr("screenshot_interval"))
+        self.intervalInput = QLineEdit(f"{DEFAULT_INTERVAL:g}")
+        self.intervalInput.editingFinished.connect(self.push_daemon_settings)
+        self.intervalLabel = QLabel(self.tr("screenshot_interval_seconds"))
         generalLayout.addWidget(self.intervalLabel)
         generalLayout.addWidget(self.intervalInput)
 
+        self.scheduleComboBox = QComboBox()
+        for mode in SCHEDULE_MODES:
+            self.scheduleComboBox.addItem(self.tr(f"schedule_{mode}"), mode)
+        self.scheduleComboBox.currentIndexChanged.connect(self.change_schedule_mode)
+        self.scheduleLabel = QLabel(self.tr("schedule_mode"))
+        generalLayout.addWidget(self.scheduleLabel)
+        generalLayout.addWidget(self.scheduleComboBox)
+
         self.formatComboBox = QComboBox()
-        self.formatComboBox.addItems(["PNG", "JPEG"])
+        # The WebP formats are removed again if the monitor probe finds that Pillow cannot write them.
+        for screenshot_format in SCREENSHOT_FORMATS:
+            self.formatComboBox.addItem(self.tr(f"format_{screenshot_format.lower()}"), screenshot_format)
+        self.formatComboBox.currentIndexChanged.connect(self.change_screenshot_format)
         self.formatLabel = QLabel(self.tr("screenshot_format"))
         generalLayout.addWidget(self.formatLabel)
         generalLayout.addWidget(self.formatComboBox)
 
+        self.byteBudgetInput = QLineEdit(str(DEFAULT_BYTE_BUDGET_MB))
+        self.byteBudgetInput.editingFinished.connect(self.update_encode_budgets)
+        self.byteBudgetLabel = QLabel(self.tr("byte_budget"))
+        generalLayout.addWidget(self.byteBudgetLabel)
+        generalLayout.addWidget(self.byteBudgetInput)
+
+        self.encodeBudgetInput = QLineEdit(str(DEFAULT_ENCODE_BUDGET_MS))
+        self.encodeBudgetInput.editingFinished.connect(self.update_encode_budgets)
+        self.encodeBudgetLabel = QLabel(self.tr("encode_time_budget"))
+        generalLayout.addWidget(self.encodeBudgetLabel)
+        generalLayout.addWidget(self.encodeBudgetInput)
+        self.update_budget_inputs()
+
+        self.captureModeComboBox = QComboBox()
+        for mode in CAPTURE_MODES:
+            self.captureModeComboBox.addItem(self.tr(f"capture_mode_{mode}"), mode)
+        self.captureModeComboBox.currentIndexChanged.connect(self.change_capture_mode)
+        self.captureModeLabel = QLabel(self.tr("capture_mode"))
+        generalLayout.addWidget(self.captureModeLabel)
+        generalLayout.addWidget(self.captureModeComboBox)
+
+        self.dedupComboBox = QComboBox()
+        for mode in DEDUP_MODES:
+            self.dedupComboBox.addItem(self.tr(f"dedup_{mode}"), mode)
+        self.dedupComboBox.currentIndexChanged.connect(self.change_dedup_mode)
+        self.dedupLabel = QLabel(self.tr("duplicate_frames"))
+        generalLayout.addWidget(self.dedupLabel)
+        generalLayout.addWidget(self.dedupComboBox)
+
+        self.storageComboBox = QComboBox()
+        for mode in STORAGE_MODES:
+            self.storageComboBox.addItem(self.tr(f"storage_mode_{mode}"), mode)
+        self.storageComboBox.currentIndexChanged.connect(self.change_storage_mode)
+        self.storageLabel = QLabel(self.tr("storage_mode"))
+        generalLayout.addWidget(self.storageLabel)
+        generalLayout.addWidget(self.storageComboBox)
+
+        self.encodeBackendComboBox = QComboBox()
+        for backend in ENCODE_BACKENDS:
+            self.encodeBackendComboBox.addItem(self.tr(f"encode_backend_{backend}"), backend)
+        self.encodeBackendComboBox.currentIndexChanged.connect(self.change_encode_backend)
+        self.encodeBackendLabel = QLabel(self.tr("encode_backend"))
+        generalLayout.addWidget(self.encodeBackendLabel)
+        generalLayout.addWidget(self.encodeBackendComboBox)
+
         self.retentionInput = QLineEdit(str(self.retention_period_days))
+        self.retentionInput.editingFinished.connect(self.update_retention_policy)
         self.retentionLabel = QLabel(self.tr("retention_period"))
         generalLayout.addWidget(self.retentionLabel)
         generalLayout.addWidget(self.retentionInput)
 
+        self.quotaInput = QLineEdit(str(self.max_total_gb))
+        self.quotaInput.editingFinished.connect(self.update_retention_policy)
+        self.quotaLabel = QLabel(self.tr("storage_quota"))
+        generalLayout.addWidget(self.quotaLabel)
+        generalLayout.addWidget(self.quotaInput)
+
+        self.minFreeInput = QLineEdit(str(self.min_free_gb))
+        self.minFreeInput.editingFinished.connect(self.update_retention_policy)
+        self.minFreeLabel = QLabel(self.tr("min_free_space"))
+        generalLayout.addWidget(self.minFreeLabel)
+        generalLayout.addWidget(self.minFreeInput)
+
         generalSettingsGroup.setLayout(generalLayout)
         self.layout.addWidget(generalSettingsGroup)
 
@@ -122,7 +373,8 @@ class WorkTrackerApp(QWidget):
         monitorSelectionGroup = QGroupBox(self.tr("monitor_selection"))
         monitorLayout = QVBoxLayout()
         self.monitorCheckboxes = QVBoxLayout()
-        self.populate_monitor_checkboxes()
+        # Until the background probe answers, the monitors found last time are shown.
+        self.populate_monitor_checkboxes(self.monitor_count)
         monitorLayout.addLayout(self.monitorCheckboxes)
         monitorSelectionGroup.setLayout(monitorLayout)
         self.layout.addWidget(monitorSelectionGroup)
@@ -143,6 +395,12 @@ class WorkTrackerApp(QWidget):
         self.statusIndicator = QLabel(self.tr("stopped"))
         controlLayout.addWidget(self.statusIndicator)
 
+        self.dedupCounterLabel = QLabel(self.tr("deduplicated") + ": 0")
+        controlLayout.addWidget(self.dedupCounterLabel)
+
+        self.missedLabel = QLabel(self.tr("missed_captures") + ": 0")
+        controlLayout.addWidget(self.missedLabel)
+
         self.toggleDarkModeButton = QPushButton(self.tr("enable_dark_mode"))
         self.toggleDarkModeButton.clicked.connect(self.toggle_dark_mode)
         controlLayout.addWidget(self.toggleDarkModeButton)
@@ -151,6 +409,10 @@ class WorkTrackerApp(QWidget):
         self.viewScreenshotsButton.clicked.connect(self.open_screenshot_viewer)
         controlLayout.addWidget(self.viewScreenshotsButton)
 
+        self.exportTimelapseButton = QPushButton(self.tr("export_timelapse"))
+        self.exportTimelapseButton.clicked.connect(self.open_timelapse_export)
+        controlLayout.addWidget(self.exportTimelapseButton)
+
         self.diskSpaceButton = QPushButton(self.tr("disk_space_info"))
         self.diskSpaceButton.clicked.connect(self.show_disk_space_info)
         controlLayout.addWidget(self.diskSpaceButton)
@@ -159,11 +421,13 @@ class WorkTrackerApp(QWidget):
         self.cleanFoldersButton.clicked.connect(self.clean_folders)
         controlLayout.addWidget(self.cleanFoldersButton)
 
-        # System Status Monitoring
-        self.cpu_label = QLabel(self.tr("cpu_usage") + ": 0%")
-        self.memory_label = QLabel(self.tr("memory_usage") + ": 0%")
+        # Tracker Resource Monitoring
+        self.cpu_label = QLabel()
+        self.memory_label = QLabel()
+        self.stage_times_label = QLabel()
         controlLayout.addWidget(self.cpu_label)
         controlLayout.addWidget(self.memory_label)
+        controlLayout.addWidget(self.stage_times_label)
 
         self.system_status_timer = QTimer()
         self.system_status_timer.timeout.connect(self.update_system_status)
@@ -190,12 +454,6 @@ class WorkTrackerApp(QWidget):
         self.trayIcon.setContextMenu(trayMenu)
         self.trayIcon.show()
 
-    def init_cleanup_timer(self):
-        """Initialize the automatic cleanup timer."""
-        self.cleanup_timer = QTimer()
-        self.cleanup_timer.timeout.connect(self.automatic_cleanup)
-        self.cleanup_timer.start(86400000)  # Run cleanup every 24 hours
-
     def closeEvent(self, event):
         """Override the close event to minimize to system tray."""
         event.ignore()
@@ -221,18 +479,42 @@ class WorkTrackerApp(QWidget):
         self.languageLabel.setText(self.tr("select_language"))
         self.folderLabel.setText(f"{self.tr('output_folder')}: {self.screenshots_folder if self.screenshots_folder else self.tr('output_folder_not_set')}")
         self.browseButton.setText(self.tr("set_output_folder"))
-        self.intervalLabel.setText(self.tr("screenshot_interval"))
+        self.intervalLabel.setText(self.tr("screenshot_interval_seconds"))
+        self.scheduleLabel.setText(self.tr("schedule_mode"))
+        for i in range(self.scheduleComboBox.count()):
+            self.scheduleComboBox.setItemText(i, self.tr(f"schedule_{self.scheduleComboBox.itemData(i)}"))
         self.formatLabel.setText(self.tr("screenshot_format"))
+        for i in range(self.formatComboBox.count()):
+            self.formatComboBox.setItemText(i, self.tr(f"format_{self.formatComboBox.itemData(i).lower()}"))
+        self.byteBudgetLabel.setText(self.tr("byte_budget"))
+        self.encodeBudgetLabel.setText(self.tr("encode_time_budget"))
+        self.captureModeLabel.setText(self.tr("capture_mode"))
+        for i in range(self.captureModeComboBox.count()):
+            self.captureModeComboBox.setItemText(i, self.tr(f"capture_mode_{self.captureModeComboBox.itemData(i)}"))
+        self.dedupLabel.setText(self.tr("duplicate_frames"))
+        for i in range(self.dedupComboBox.count()):
+            self.dedupComboBox.setItemText(i, self.tr(f"dedup_{self.dedupComboBox.itemData(i)}"))
+        self.storageLabel.setText(self.tr("storage_mode"))
+        for i in range(self.storageComboBox.count()):
+            self.storageComboBox.setItemText(i, self.tr(f"storage_mode_{self.storageComboBox.itemData(i)}"))
+        self.encodeBackendLabel.setText(self.tr("encode_backend"))
+        for i in range(self.encodeBackendComboBox.count()):
+            self.encodeBackendComboBox.setItemText(i, self.tr(f"encode_backend_{self.encodeBackendComboBox.itemData(i)}"))
+        self.update_dedup_counter()
+        self.update_missed_counter()
         self.retentionLabel.setText(self.tr("retention_period"))
+        self.quotaLabel.setText(self.tr("storage_quota"))
+        self.minFreeLabel.setText(self.tr("min_free_space"))
         self.startButton.setText(self.tr("start"))
         self.stopButton.setText(self.tr("stop"))
         self.statusIndicator.setText(self.tr("stopped"))
         self.toggleDarkModeButton.setText(self.tr("enable_dark_mode") if not self.dark_mode_enabled else self.tr("enable_light_mode"))
         self.viewScreenshotsButton.setText(self.tr("view_screenshots"))
+        self.exportTimelapseButton.setText(self.tr("export_timelapse"))
         self.diskSpaceButton.setText(self.tr("disk_space_info"))
         self.cleanFoldersButton.setText(self.tr("clean_folders"))
-        self.cpu_label.setText(self.tr("cpu_usage") + ": 0%")
-        self.memory_label.setText(self.tr("memory_usage") + ": 0%")
+        self.show_system_status()
+        self.update_stage_times()
 
         # Update group box titles
         self.layout.itemAt(2).widget().setTitle(self.tr("general_settings"))
@@ -243,13 +525,105 @@ class WorkTrackerApp(QWidget):
         for i in range(self.monitorCheckboxes.count()):
             self.monitorCheckboxes.itemAt(i).widget().setText(f"{self.tr('monitor')} {i + 1}")
 
-    def populate_monitor_checkboxes(self):
-        """Populate monitor checkboxes based on available monitors."""
-        with mss() as sct:
-            for i, monitor in enumerate(sct.monitors[1:], start=1):
-                checkbox = QCheckBox(f"{self.tr('monitor')} {i}")
-                checkbox.setChecked(True)  # Default to checked
-                self.monitorCheckboxes.addWidget(checkbox)
+    def populate_monitor_checkboxes(self, count):
+        """Show one checkbox per monitor, checked as last selected."""
+        while self.monitorCheckboxes.count() > count:
+            self.monitorCheckboxes.takeAt(self.monitorCheckboxes.count() - 1).widget().deleteLater()
+        for i in range(self.monitorCheckboxes.count() + 1, count + 1):
+            checkbox = QCheckBox(f"{self.tr('monitor')} {i}")
+            # Default to checked
+            checkbox.setChecked(self.monitor_selection[i - 1] if i <= len(self.monitor_selection) else True)
+            checkbox.stateChanged.connect(self.change_monitor_selection)
+            self.monitorCheckboxes.addWidget(checkbox)
+
+    def start_monitor_probe(self):
+        """Count the monitors on a background thread: opening a screen grabber can take a while."""
+        threading.Thread(target=self.probe_monitors, args=(dict(self.frame_source), self.capture_mode),
+                         name="monitor-probe", daemon=True).start()
+
+    def probe_monitors(self, frame_source, capture_mode):
+        from frame_sources import build_frame_source
+        from encoders import webp_supported
+        self.startup_signals.webp.emit(webp_supported())
+        count = self.monitor_count
+        try:
+            with build_frame_source(frame_source)(capture_mode) as source:
+                count = len(source.monitors()) - 1
+        except Exception as e:
+            self.capture_signals.error.emit(f"monitors: {e}")
+        self.startup_signals.monitors.emit(count)
+
+    def on_monitors_probed(self, count):
+        """Replace the monitors remembered from last time with the ones found now."""
+        self.record_startup('monitors')
+        if count == self.monitorCheckboxes.count():
+            return
+        self.monitor_count = count
+        self.populate_monitor_checkboxes(count)
+        self.change_monitor_selection()
+        self.save_settings()
+
+    def change_monitor_selection(self):
+        """Remember which monitors are checked and hand the selection to the capture daemon."""
+        self.monitor_selection = [self.monitorCheckboxes.itemAt(i).widget().isChecked()
+                                  for i in range(self.monitorCheckboxes.count())]
+        self.push_daemon_settings()
+
+    def change_screenshot_format(self):
+        """Pick a fixed image format, or let the daemon choose one per frame within the size and time budgets."""
+        self.screenshot_format = self.formatComboBox.currentData() or FORMAT_PNG
+        self.update_budget_inputs()
+        self.push_daemon_settings()
+
+    def update_budget_inputs(self):
+        """The budgets only apply to the automatic format."""
+        automatic = self.screenshot_format == FORMAT_AUTO
+        for widget in (self.byteBudgetLabel, self.byteBudgetInput, self.encodeBudgetLabel, self.encodeBudgetInput):
+            widget.setEnabled(automatic)
+
+    def update_encode_budgets(self):
+        """Check the budgets entered in the UI and hand them to the capture daemon."""
+        try:
+            if float(self.byteBudgetInput.text()) <= 0 or float(self.encodeBudgetInput.text()) <= 0:
+                raise ValueError
+        except ValueError:
+            QMessageBox.warning(self, self.tr("invalid_input"), self.tr("invalid_budget"))
+            return
+        self.push_daemon_settings()
+
+    def change_capture_mode(self):
+        """Switch the capture engine between per-monitor and single desktop grabs."""
+        self.capture_mode = self.captureModeComboBox.currentData() or CAPTURE_MODE_PER_MONITOR
+        self.push_daemon_settings()
+
+    def change_schedule_mode(self):
+        """Switch between a fixed interval and one that follows screen and input activity."""
+        self.schedule_mode = self.scheduleComboBox.currentData() or SCHEDULE_FIXED
+        self.push_daemon_settings()
+
+    def change_dedup_mode(self):
+        """Choose what happens to captures that are unchanged since the last saved one."""
+        self.dedup_mode = self.dedupComboBox.currentData() or DEDUP_OFF
+        self.push_daemon_settings()
+
+    def change_storage_mode(self):
+        """Switch between one file per screenshot and keyframe + changed-tile streams."""
+        self.storage_mode = self.storageComboBox.currentData() or STORAGE_FILES
+        self.push_daemon_settings()
+
+    def change_encode_backend(self):
+        """Encode screenshots on threads of the daemon or in separate worker processes."""
+        self.encode_backend = self.encodeBackendComboBox.currentData() or ENCODE_BACKEND_THREADS
+        self.push_daemon_settings()
+
+    def push_daemon_settings(self):
+        """Send the settings shown in the window to the capture daemon."""
+        if not self.daemon_ready:
+            return  # they are all sent once the daemon answers
+        try:
+            self.daemon.request('configure', settings=self.current_settings())
+        except (ConnectionError, RuntimeError) as e:
+            self.on_capture_error(str(e))
 
     def set_output_folder(self):
         """Set the output folder for screenshots."""
@@ -258,77 +632,92 @@ class WorkTrackerApp(QWidget):
             self.screenshots_folder = folder
             self.folderLabel.setText(f"{self.tr('output_folder')}: {self.screenshots_folder}")
             self.save_settings()
+            self.update_retention_policy()
 
     def start_capture(self):
-        """Start the screenshot capture process."""
+        """Ask the capture daemon to start capturing."""
         if not self.screenshots_folder:
             QMessageBox.warning(self, self.tr("output_folder_not_set"), self.tr("please_set_output_folder"))
             return
         try:
-            interval_minutes = int(self.intervalInput.text())
-            if interval_minutes <= 0:
-                raise ValueError(self.tr("interval_positive_integer"))
-            interval_milliseconds = interval_minutes * 60 * 1000
-            self.timer.start(interval_milliseconds)
-            self.is_capturing = True
-            self.update_status_indicator(True)
-            self.startButton.setEnabled(False)
-            self.stopButton.setEnabled(True)
+            interval_seconds = float(self.intervalInput.text())
+            if interval_seconds < MIN_INTERVAL:
+                raise ValueError(self.tr("invalid_interval"))
         except ValueError:
-            QMessageBox.warning(self, self.tr("invalid_input"), self.tr("please_enter_valid_integer"))
+            QMessageBox.warning(self, self.tr("invalid_input"), self.tr("invalid_interval"))
+            return
+        try:
+            status = self.daemon_request('start') if self.daemon_request('configure', settings=self.current_settings()) else None
+            if status is None:
+                self.resume_capture = True  # capturing starts once the new daemon answers
+            else:
+                self.on_daemon_status(status)
+        except (ConnectionError, RuntimeError) as e:
+            QMessageBox.warning(self, self.tr("app_title"), str(e))
 
     def stop_capture(self):
-        """Stop the screenshot capture process."""
-        self.timer.stop()
-        self.is_capturing = False
-        self.update_status_indicator(False)
+        """Ask the capture daemon to stop capturing."""
+        try:
+            status = self.daemon_request('stop')
+            if status is None:
+                self.resume_capture = False  # the new daemon is only configured
+            else:
+                self.on_daemon_status(status)
+        except (ConnectionError, RuntimeError) as e:
+            QMessageBox.warning(self, self.tr("app_title"), str(e))
+
+    def on_daemon_status(self, status):
+        """Reflect the daemon's state in the status indicator, buttons and counters."""
+        self.daemon_status = status
+        self.is_capturing = status['capturing']
+        self.update_status_indicator(self.is_capturing)
+        self.startButton.setEnabled(not self.is_capturing)
+        self.stopButton.setEnabled(self.is_capturing)
+        self.update_dedup_counter()
+        self.update_missed_counter()
+        self.update_stage_times()
+
+    def on_daemon_disconnected(self):
+        """Show that the daemon went away; the next command starts a new one."""
+        self.statusIndicator.setText(self.tr("daemon_disconnected"))
+        self.statusIndicator.setStyleSheet('color: red;')
         self.startButton.setEnabled(True)
         self.stopButton.setEnabled(False)
 
-    def take_and_save_screenshots(self):
-        """Take and save screenshots from selected monitors."""
-        if self.screenshots_folder:
-            todays_folder = self.create_todays_folder()
-            now = datetime.datetime.now()
-
-            with mss() as sct:
-                for i, monitor in enumerate(sct.monitors[1:], start=1):
-                    if not self.monitorCheckboxes.layout().itemAt(i - 1).widget().isChecked():
-                        continue
-                    screenshot_file = f"screen_{i}_{now.strftime('%Y-%m-%d_%H-%M-%S')}.{self.formatComboBox.currentText().lower()}"
-                    screenshot_path = os.path.join(todays_folder, screenshot_file)
-
-                    sct_img = sct.grab(monitor)
-                    img = Image.frombytes("RGB", sct_img.size, sct_img.rgb)
+    def update_dedup_counter(self):
+        """Show how many unchanged captures were not saved, per monitor."""
+        stats = self.daemon_status.get('stats', {})
+        per_monitor = ", ".join(f"{self.tr('monitor')} {index}: {count}"
+                                for index, count in sorted(stats.get('deduplicated_by_monitor', {}).items(),
+                                                           key=lambda item: int(item[0])))
+        text = f"{self.tr('deduplicated')}: {stats.get('deduplicated', 0)}"
+        self.dedupCounterLabel.setText(f"{text} ({per_monitor})" if per_monitor else text)
 
-                    if not self.is_black_image(img):
-                        img.save(screenshot_path)
+    def update_missed_counter(self):
+        """Show how many capture deadlines the daemon could not keep."""
+        missed = self.daemon_status.get('schedule', {}).get('missed_deadlines', 0)
+        self.missedLabel.setText(f"{self.tr('missed_captures')}: {missed}")
 
-            self.update_status_indicator(True)
-
-    def is_black_image(self, img):
-        """Check if the given image is completely black."""
-        black = Image.new('RGB', img.size, (0, 0, 0))
-        difference = ImageChops.difference(img, black)
-        return not difference.getbbox()
+    def on_capture_error(self, message):
+        """Show the last capture error as a tooltip on the status indicator."""
+        self.statusIndicator.setToolTip(message)
 
     def update_status_indicator(self, is_capturing):
         """Update the status indicator based on the capturing state."""
         if is_capturing:
-            next_capture_time = QDateTime.currentDateTime().addSecs(int(self.intervalInput.text()) * 60)
+            next_capture = self.daemon_status.get('next_capture')
+            if next_capture:
+                next_capture_time = QDateTime.fromMSecsSinceEpoch(int(next_capture * 1000))
+            else:
+                # The daemon's interval, since the field may hold an edit that was not applied (or is not a number).
+                interval = (self.daemon_status.get('schedule') or {}).get('interval') or DEFAULT_INTERVAL
+                next_capture_time = QDateTime.currentDateTime().addMSecs(int(interval * 1000))
             self.statusIndicator.setText(f'{self.tr("active")} - {self.tr("next_capture_at")}: {next_capture_time.toString("hh:mm:ss")}')
         else:
-            self.statusIndicator.setText(self.tr("stopped"))
+            self.statusIndicator.setText(self.tr("stopped") if self.daemon_ready else self.tr("daemon_connecting"))
         self.statusIndicator.setStyleSheet('color: green;' if is_capturing else 'color: red;')
         self.statusIndicator.adjustSize()
 
-    def create_todays_folder(self):
-        """Create a folder for today's screenshots."""
-        today = datetime.date.today()
-        todays_folder = os.path.join(self.screenshots_folder, today.strftime("%Y-%m-%d"))
-        os.makedirs(todays_folder, exist_ok=True)
-        return todays_folder
-
     def toggle_dark_mode(self):
         """Toggle dark mode on and off."""
         self.dark_mode_enabled = not self.dark_mode_enabled
@@ -344,45 +733,103 @@ class WorkTrackerApp(QWidget):
             self.setStyleSheet("")
             self.toggleDarkModeButton.setText(self.tr("enable_dark_mode"))
 
-    def save_settings(self):
-        """Save the current settings to a file."""
-        settings = {
+    def current_settings(self):
+        """Return the settings shown in the window as a dict."""
+        return {
             'screenshots_folder': self.screenshots_folder,
             'dark_mode_enabled': self.dark_mode_enabled,
-            'interval_minutes': self.intervalInput.text(),
-            'screenshot_format': self.formatComboBox.currentText(),
-            'retention_period_days': self.retentionInput.text(),
-            'selected_monitors': [self.monitorCheckboxes.layout().itemAt(i).widget().isChecked() for i in range(self.monitorCheckboxes.layout().count())],
+            'interval_seconds': self.intervalInput.text(),
+            'schedule_mode': self.schedule_mode,
+            'screenshot_format': self.screenshot_format,
+            'byte_budget_mb_per_hour': self.byteBudgetInput.text(),
+            'encode_budget_ms': self.encodeBudgetInput.text(),
+            'capture_mode': self.capture_mode,
+            'blank_detection': self.blank_detection,
+            'dedup_mode': self.dedup_mode,
+            'dedup_threshold': self.dedup_threshold,
+            'storage_mode': self.storage_mode,
+            'encode_backend': self.encode_backend,
+            'keyframe_interval': self.keyframe_interval,
+            'retention_period_days': self.retention_period_days,
+            'max_total_gb': self.max_total_gb,
+            'min_free_gb': self.min_free_gb,
+            'thumbnail_cache_mb': self.thumbnail_cache_mb,
+            'metrics_interval_seconds': self.metrics_interval_seconds,
+            'metrics_folder': self.metrics_folder,
+            'frame_source': self.frame_source,
+            'upload': self.upload,
+            'selected_monitors': self.monitor_selection,
+            'monitor_count': self.monitor_count,
             'language_code': self.language_code,
             'is_capturing': self.is_capturing
         }
+
+    def save_settings(self):
+        """Save the current settings to a file."""
         with open(SETTINGS_FILE, 'w') as f:
-            json.dump(settings, f)
+            json.dump(self.current_settings(), f)
 
     def load_settings(self):
         """Load settings from the settings file."""
-        try:
-            with open(SETTINGS_FILE) as f:
-                settings = json.load(f)
-                self.apply_settings(settings)
-                self.update_ui_texts()
-                self.update_language_combo_box()
-                if self.is_capturing:
-                    self.start_capture()
-        except FileNotFoundError:
-            pass
+        settings = read_settings_file()
+        if settings:
+            self.apply_settings(settings)
+            self.update_ui_texts()
+            self.update_language_combo_box()
+            # While the daemon is still starting, capturing resumes once it answers.
+            if self.is_capturing and self.daemon_ready:
+                self.start_capture()
+        if not self.daemon_ready:
+            self.statusIndicator.setText(self.tr("daemon_connecting"))
+            self.startButton.setEnabled(False)
 
     def apply_settings(self, settings):
         """Apply the loaded settings to the application."""
         self.screenshots_folder = settings.get('screenshots_folder')
         self.dark_mode_enabled = settings.get('dark_mode_enabled', False)
-        self.intervalInput.setText(str(settings.get('interval_minutes', 5)))
-        self.formatComboBox.setCurrentText(settings.get('screenshot_format', 'PNG'))
-        self.retention_period_days = int(settings.get('retention_period_days', 30))
+        if 'interval_seconds' in settings:
+            self.intervalInput.setText(str(settings['interval_seconds']))
+        else:
+            # Settings saved before sub-second intervals were supported hold whole minutes.
+            self.intervalInput.setText(f"{float(settings.get('interval_minutes', DEFAULT_INTERVAL / 60)) * 60:g}")
+        index = self.scheduleComboBox.findData(settings.get('schedule_mode', SCHEDULE_FIXED))
+        self.scheduleComboBox.setCurrentIndex(max(index, 0))
+        self.byteBudgetInput.setText(str(settings.get('byte_budget_mb_per_hour', DEFAULT_BYTE_BUDGET_MB)))
+        self.encodeBudgetInput.setText(str(settings.get('encode_budget_ms', DEFAULT_ENCODE_BUDGET_MS)))
+        index = self.formatComboBox.findData(settings.get('screenshot_format', FORMAT_PNG))
+        self.formatComboBox.setCurrentIndex(max(index, 0))
+        self.change_screenshot_format()
+        index = self.captureModeComboBox.findData(settings.get('capture_mode', CAPTURE_MODE_PER_MONITOR))
+        self.captureModeComboBox.setCurrentIndex(max(index, 0))
+        self.blank_detection = settings.get('blank_detection', {})
+        self.dedup_threshold = float(settings.get('dedup_threshold', DEFAULT_DEDUP_THRESHOLD))
+        index = self.dedupComboBox.findData(settings.get('dedup_mode', DEDUP_OFF))
+        self.dedupComboBox.setCurrentIndex(max(index, 0))
+        self.keyframe_interval = int(settings.get('keyframe_interval', DEFAULT_KEYFRAME_INTERVAL))
+        index = self.storageComboBox.findData(settings.get('storage_mode', STORAGE_FILES))
+        self.storageComboBox.setCurrentIndex(max(index, 0))
+        self.change_storage_mode()
+        index = self.encodeBackendComboBox.findData(settings.get('encode_backend', ENCODE_BACKEND_THREADS))
+        self.encodeBackendComboBox.setCurrentIndex(max(index, 0))
+        self.change_encode_backend()
+        self.retention_period_days = max(1, read_number(settings, 'retention_period_days', int, DEFAULT_RETENTION_DAYS))
         self.retentionInput.setText(str(self.retention_period_days))
-        for i, checked in enumerate(settings.get('selected_monitors', [])):
-            if i < self.monitorCheckboxes.layout().count():
-                self.monitorCheckboxes.layout().itemAt(i).widget().setChecked(checked)
+        self.max_total_gb = max(0.0, read_number(settings, 'max_total_gb', float, 0.0))
+        self.quotaInput.setText(f"{self.max_total_gb:g}")
+        self.min_free_gb = max(0.0, read_number(settings, 'min_free_gb', float, 0.0))
+        self.minFreeInput.setText(f"{self.min_free_gb:g}")
+        self.thumbnail_cache_mb = int(settings.get('thumbnail_cache_mb', DEFAULT_THUMBNAIL_CACHE_MB))
+        self.metrics_interval_seconds = settings.get('metrics_interval_seconds', DEFAULT_EXPORT_INTERVAL)
+        self.metrics_folder = settings.get('metrics_folder', '')
+        self.frame_source = settings.get('frame_source', {})
+        self.upload = settings.get('upload', {})
+        self.update_retention_policy()
+        selection = settings.get('selected_monitors', [])
+        for i, checked in enumerate(selection):
+            if i < self.monitorCheckboxes.count():
+                self.monitorCheckboxes.itemAt(i).widget().setChecked(checked)
+        # Kept whole, for monitors that have no checkbox until the probe finds them
+        self.monitor_selection = selection
         self.language_code = settings.get('language_code', DEFAULT_LANGUAGE)
         self.translations = load_translations(self.language_code)
         self.tr = lambda key: self.translations.get(key, key)
@@ -402,17 +849,7 @@ class WorkTrackerApp(QWidget):
         fileName, _ = QFileDialog.getSaveFileName(self, self.tr("export_settings"), "", "JSON Files (*.json)", options=options)
         if fileName:
             with open(fileName, 'w') as file:
-                settings = {
-                    'screenshots_folder': self.screenshots_folder,
-                    'dark_mode_enabled': self.dark_mode_enabled,
-                    'interval_minutes': self.intervalInput.text(),
-                    'screenshot_format': self.formatComboBox.currentText(),
-                    'retention_period_days': self.retentionInput.text(),
-                    'selected_monitors': [self.monitorCheckboxes.layout().itemAt(i).widget().isChecked() for i in range(self.monitorCheckboxes.layout().count())],
-                    'language_code': self.language_code,
-                    'is_capturing': self.is_capturing
-                }
-                json.dump(settings, file)
+                json.dump(self.current_settings(), file)
             QMessageBox.information(self, self.tr("export_successful"), self.tr("settings_exported_successfully"))
 
     def import_settings(self):
@@ -427,30 +864,32 @@ class WorkTrackerApp(QWidget):
             self.load_settings()
 
     def open_screenshot_viewer(self):
-        """Open the system's file explorer to the screenshot folder."""
+        """Open the built-in screenshot browser on the output folder."""
         if not self.screenshots_folder:
             QMessageBox.warning(self, self.tr("output_folder_not_set"), self.tr("please_set_output_folder"))
             return
+        from screenshot_browser import ScreenshotBrowser
+        browser = ScreenshotBrowser(self.screenshots_folder, self.tr, self.thumbnail_cache_mb, self)
+        browser.exec_()
 
-        # Open the screenshots folder in the system's file explorer
-        if os.name == 'nt':  # Windows
-            os.startfile(self.screenshots_folder)
-        elif os.name == 'posix':  # macOS, Linux
-            subprocess.Popen(['open', self.screenshots_folder] if sys.platform == 'darwin' else ['xdg-open', self.screenshots_folder])
-        else:
-            QMessageBox.warning(self, self.tr("unsupported_os"), self.tr("file_explorer_not_supported"))
+    def open_timelapse_export(self):
+        """Open the timelapse export dialog on the output folder."""
+        if not self.screenshots_folder:
+            QMessageBox.warning(self, self.tr("output_folder_not_set"), self.tr("please_set_output_folder"))
+            return
+        from timelapse_dialog import TimelapseDialog
+        dialog = TimelapseDialog(self.screenshots_folder, self.tr, self)
+        dialog.exec_()
 
     def show_disk_space_info(self):
-        """Show disk space information for the screenshots folder."""
-        if self.screenshots_folder:
-            total, used, free = shutil.disk_usage(self.screenshots_folder)
-            total_gb = total / (1024 ** 3)
-            used_gb = used / (1024 ** 3)
-            free_gb = free / (1024 ** 3)
-            QMessageBox.information(self, self.tr("disk_space_info"), 
-                                    f"{self.tr('total')}: {total_gb:.2f} GB\n{self.tr('used')}: {used_gb:.2f} GB\n{self.tr('free')}: {free_gb:.2f} GB")
-        else:
+        """Show the disk space and how much of it the captures use, per day and per monitor, and how fast it grows."""
+        if not self.screenshots_folder or not os.path.isdir(self.screenshots_folder):
             QMessageBox.warning(self, self.tr("output_folder_not_set"), self.tr("please_set_output_folder"))
+            return
+        from storage_dialog import StorageDialog
+        dialog = StorageDialog(self.screenshots_folder, self.tr, int(self.max_total_gb * 1024 ** 3),
+                               int(self.min_free_gb * 1024 ** 3), self)
+        dialog.exec_()
 
     def clean_folders(self):
         """Clean old folders from the screenshots directory."""
@@ -497,6 +936,8 @@ class WorkTrackerApp(QWidget):
 
     def delete_selected_folders(self, selected_folders):
         """Delete the selected folders from the screenshots directory."""
+        from catalog import Catalog, CATALOG_FILE
+        from thumbnails import remove_day_thumbnails
         for folder in selected_folders:
             folder_path = os.path.join(self.screenshots_folder, folder)
             if os.path.isdir(folder_path):
@@ -507,30 +948,88 @@ class WorkTrackerApp(QWidget):
                         for name in dirs:
                             os.rmdir(os.path.join(root, name))
                     os.rmdir(folder_path)
+                    if os.path.exists(os.path.join(self.screenshots_folder, CATALOG_FILE)):
+                        catalog = Catalog(self.screenshots_folder)
+                        catalog.delete_day(folder)
+                        catalog.close()
+                    remove_day_thumbnails(self.screenshots_folder, folder)
                 except Exception as e:
                     QMessageBox.warning(self, self.tr("error_deleting_folder"), f"{self.tr('error_deleting_folder')}: {folder} - {e}")
 
-    def automatic_cleanup(self):
-        """Automatically clean up old files and folders."""
-        if self.screenshots_folder:
-            now = time.time()
-            retention_time = self.retention_period_days * 86400  # Convert days to seconds
-            for root, dirs, files in os.walk(self.screenshots_folder):
-                for name in files:
-                    file_path = os.path.join(root, name)
-                    if os.stat(file_path).st_mtime < now - retention_time:
-                        os.remove(file_path)
-                for name in dirs:
-                    dir_path = os.path.join(root, name)
-                    if os.stat(dir_path).st_mtime < now - retention_time:
-                        shutil.rmtree(dir_path)
+    def update_retention_policy(self):
+        """Check the retention limits entered in the UI and hand them to the capture daemon."""
+        try:
+            limits = (max(1, int(self.retentionInput.text())), max(0.0, float(self.quotaInput.text() or 0)),
+                      max(0.0, float(self.minFreeInput.text() or 0)))
+        except ValueError:
+            limits = None
+        if limits is not None:
+            self.retention_period_days, self.max_total_gb, self.min_free_gb = limits
+        # The fields go back to the limits in effect, so what is saved is always what was checked.
+        self.retentionInput.setText(str(self.retention_period_days))
+        self.quotaInput.setText(f"{self.max_total_gb:g}")
+        self.minFreeInput.setText(f"{self.min_free_gb:g}")
+        if limits is None:
+            QMessageBox.warning(self, self.tr("invalid_input"), self.tr("please_enter_valid_integer"))
+            return
+        self.push_daemon_settings()
+
+    def on_webp_probed(self, supported):
+        if supported:
+            return
+        if self.formatComboBox.currentData() in (FORMAT_WEBP, FORMAT_WEBP_LOSSLESS):
+            self.formatComboBox.setCurrentIndex(self.formatComboBox.findData(FORMAT_PNG))
+        for screenshot_format in (FORMAT_WEBP, FORMAT_WEBP_LOSSLESS):
+            index = self.formatComboBox.findData(screenshot_format)
+            if index >= 0:
+                self.formatComboBox.removeItem(index)
 
     def update_system_status(self):
-        """Update system status information (CPU and memory usage)."""
-        cpu_usage = psutil.cpu_percent()
-        memory_usage = psutil.virtual_memory().percent
-        self.cpu_label.setText(f"{self.tr('cpu_usage')}: {cpu_usage}%")
-        self.memory_label.setText(f"{self.tr('memory_usage')}: {memory_usage}%")
+        """Show the CPU and memory used by the tracker itself: the capture daemon (with its workers) and this window."""
+        # Imported on the first tick of the timer, after the window is shown.
+        import psutil
+        from metrics import ProcessSampler
+        if self.window_sampler is None:
+            self.window_sampler = ProcessSampler(children=False)
+        window = self.window_sampler.sample()
+        daemon = None
+        pid = self.daemon_status.get('pid')
+        if pid:
+            try:
+                if self.daemon_sampler is None or self.daemon_sampler.process.pid != pid:
+                    self.daemon_sampler = ProcessSampler(pid)
+                daemon = self.daemon_sampler.sample()
+            except psutil.Error:
+                self.daemon_sampler = None  # the daemon exited; its next status names the new one
+        if daemon is None:
+            # A daemon on another session may not be readable; it reports its own usage in the status.
+            daemon = (self.daemon_status.get('metrics') or {}).get('process')
+        self.usage = (window, daemon)
+        self.show_system_status()
+
+    def show_system_status(self):
+        if self.usage is None:
+            return  # not sampled yet
+        window, daemon = self.usage
+        capture_cpu = daemon['cpu_percent'] if daemon else 0
+        capture_rss = daemon['rss'] if daemon else 0
+        self.cpu_label.setText(f"{self.tr('tracker_cpu')}: {capture_cpu + window['cpu_percent']:.1f}% "
+                               f"({self.tr('capture_process')} {capture_cpu:.1f}%, "
+                               f"{self.tr('window_process')} {window['cpu_percent']:.1f}%)")
+        self.memory_label.setText(f"{self.tr('tracker_memory')}: {(capture_rss + window['rss']) / 1024 ** 2:.0f} MB "
+                                  f"({self.tr('capture_process')} {capture_rss / 1024 ** 2:.0f} MB, "
+                                  f"{self.tr('window_process')} {window['rss'] / 1024 ** 2:.0f} MB)")
+
+    def update_stage_times(self):
+        """Show the median and 95th percentile time of each capture stage since the daemon started."""
+        stages = (self.daemon_status.get('metrics') or {}).get('stages', {})
+        timings = [f"{stage} {summary['p50'] * 1000:.1f}/{summary['p95'] * 1000:.1f}"
+                   for stage, summary in stages.items() if summary['count']]
+        self.stage_times_label.setText(f"{self.tr('stage_times')}: {', '.join(timings) if timings else '-'}")
+        self.stage_times_label.setToolTip("\n".join(
+            f"{stage}: {summary['count']} × {summary['mean'] * 1000:.1f} ms, p50 {summary['p50'] * 1000:.1f} ms, "
+            f"p95 {summary['p95'] * 1000:.1f} ms, p99 {summary['p99'] * 1000:.1f} ms"
+            for stage, summary in stages.items() if summary['count']))
 
     def get_language_name(self, code):
         """Get the language name from the code."""
@@ -541,8 +1040,16 @@ class WorkTrackerApp(QWidget):
 
 
 if __name__ == '__main__':
+    # Frozen builds start encode worker processes through this executable as well.
+    multiprocessing.freeze_support()
+    if sys.argv[1:2] == ['--daemon']:
+        # Frozen builds start the capture daemon through the same executable.
+        sys.exit(daemon_main(sys.argv[2:]))
     app = QApplication(sys.argv)
     app.setWindowIcon(QIcon(icon_path))
     ex = WorkTrackerApp()
+    if '--startup-report' in sys.argv[1:]:
+        # Print the startup phases as one JSON line and exit, for benchmarks/bench_suite.py.
+        ex.startup_signals.finished.connect(lambda times: (print(json.dumps(times), flush=True), app.quit()))
     ex.show()
     sys.exit(app.exec_())
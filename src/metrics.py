@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import bisect
+import threading
+import psutil
+from capture_options import DEFAULT_EXPORT_INTERVAL
+
+# Histogram buckets: upper bounds in seconds, doubling from 100 µs to about 52 s
+BUCKETS = tuple(0.0001 * 2 ** n for n in range(20))
+QUANTILES = (0.5, 0.95, 0.99)
+# Pipeline order, in which stages are listed
+STAGES = ('grab', 'blank_check', 'convert', 'encode', 'write', 'bundle', 'upload', 'retention')
+PROMETHEUS_PREFIX = 'screentracker'
+
+# Defaults
+PROMETHEUS_FILE = 'metrics.prom'
+METRICS_LOG = 'metrics.jsonl'
+MAX_LOG_BYTES = 10 * 1024 * 1024
+# Process usage is sampled at most this often, however many callers ask for it
+MIN_SAMPLE_INTERVAL = 0.5
+# How often the exporter thread samples the process between two exports
+PROCESS_SAMPLE_INTERVAL = 2.0
+
+
+class Histogram:
+    """Counts of observed durations in fixed, log-spaced buckets.
+
+    Observing is a bisect and three additions under a lock, cheap enough
+    for every frame; quantiles are estimated from the bucket counts.
+    """
+
+    __slots__ = ('counts', 'total', 'count', '_lock')
+
+    def __init__(self):
+        # The last bucket counts everything slower than BUCKETS[-1].
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {'count': self.count, 'sum': self.total, 'buckets': list(self.counts)}
+
+
+def quantile(buckets, q):
+    """Estimate a quantile from bucket counts, interpolating inside the bucket; None if nothing was observed."""
+    rank = q * sum(buckets)
+    if not rank:
+        return None
+    seen = 0
+    for index, count in enumerate(buckets):
+        if count and seen + count >= rank:
+            if index == len(BUCKETS):
+                return BUCKETS[-1]
+            lower = BUCKETS[index - 1] if index else 0.0
+            return lower + (BUCKETS[index] - lower) * (rank - seen) / count
+        seen += count
+    return BUCKETS[-1]
+
+
+def _stage_order(stage):
+    return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage)
+
+
+class Metrics:
+    """Per-stage latency histograms and counters, shared by the engines of one process."""
+
+    def __init__(self):
+        self.started = time.time()
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        """Record how long one pass through a stage took."""
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(stage, Histogram())
+        histogram.observe(seconds)
+
+    def add(self, counter, amount=1):
+        """Add to a counter, e.g. the bytes that went through a stage."""
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + amount
+
+    def snapshot(self):
+        """Return every histogram and counter as a JSON-serializable dict."""
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        return {'time': time.time(), 'started': self.started,
+                'stages': {stage: histograms[stage].snapshot() for stage in sorted(histograms, key=_stage_order)},
+                'counters': counters}
+
+
+def summarize(snapshot, previous=None):
+    """Reduce a snapshot to count, mean and quantiles per stage, since `previous` if given."""
+    stages = {}
+    for stage, histogram in snapshot['stages'].items():
+        before = (previous or {}).get('stages', {}).get(stage)
+        buckets, count, total = histogram['buckets'], histogram['count'], histogram['sum']
+        if before:
+            buckets = [now - then for now, then in zip(buckets, before['buckets'])]
+            count -= before['count']
+            total -= before['sum']
+        summary = {'count': count, 'mean': total / count if count else None}
+        for q in QUANTILES:
+            summary[f"p{round(q * 100)}"] = quantile(buckets, q)
+        stages[stage] = summary
+    counters = dict(snapshot['counters'])
+    if previous:
+        counters = {name: value - previous['counters'].get(name, 0) for name, value in counters.items()}
+    return {'time': snapshot['time'], 'stages': stages, 'counters': counters}
+
+
+class ProcessSampler:
+    """CPU and memory used by a process and, optionally, its children (e.g. the encode workers), via psutil."""
+
+    def __init__(self, pid=None, children=True):
+        self.process = psutil.Process(pid)
+        self.children = children
+        self._children = {}
+        self._last = None
+        self._sampled = 0
+        self._lock = threading.Lock()
+
+    def sample(self):
+        """Return cpu_percent (of one core, since the previous sample), rss in bytes, threads and processes."""
+        with self._lock:
+            now = time.monotonic()
+            if self._last is not None and now - self._sampled < MIN_SAMPLE_INTERVAL:
+                return self._last
+            try:
+                children = self.process.children(recursive=True) if self.children else []
+            except psutil.Error:
+                children = []
+            # cpu_percent keeps its reference point per Process object, so the same objects are reused.
+            self._children = {child.pid: self._children.get(child.pid, child) for child in children}
+            cpu = rss = threads = 0
+            for process in [self.process, *self._children.values()]:
+                try:
+                    with process.oneshot():
+                        cpu += process.cpu_percent(None)
+                        rss += process.memory_info().rss
+                        threads += process.num_threads()
+                except psutil.Error:
+                    continue  # exited since it was listed
+            self._last = {'cpu_percent': cpu, 'rss': rss, 'threads': threads, 'processes': 1 + len(self._children)}
+            self._sampled = now
+            return self._last
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(snapshot, process=None):
+    """Render a snapshot in the Prometheus text exposition format."""
+    name = f"{PROMETHEUS_PREFIX}_stage_seconds"
+    lines = [f"# HELP {name} Time spent per frame (per run for retention) in each pipeline stage.",
+             f"# TYPE {name} histogram"]
+    for stage, histogram in snapshot['stages'].items():
+        label = f'stage="{_label(stage)}"'
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram['buckets']):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram["count"]}')
+        lines.append(f"{name}_sum{{{label}}} {histogram['sum']:.6f}")
+        lines.append(f"{name}_count{{{label}}} {histogram['count']}")
+    for counter, value in sorted(snapshot['counters'].items()):
+        metric = f"{PROMETHEUS_PREFIX}_{counter}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    if process:
+        for key, metric in (('cpu_percent', 'process_cpu_percent'), ('rss', 'process_resident_memory_bytes'),
+                            ('threads', 'process_threads'), ('processes', 'process_count')):
+            lines += [f"# TYPE {PROMETHEUS_PREFIX}_{metric} gauge", f"{PROMETHEUS_PREFIX}_{metric} {process[key]}"]
+    lines += [f"# TYPE {PROMETHEUS_PREFIX}_start_time_seconds gauge",
+              f"{PROMETHEUS_PREFIX}_start_time_seconds {snapshot['started']:.3f}"]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """Sample the process every few seconds and write the metrics out every `interval` seconds, on a background thread.
+
+    The Prometheus file (for node_exporter's textfile collector, say) is
+    replaced atomically with the totals since start; each line of the JSON
+    log holds what happened during one interval. The log is rotated once
+    it grows past max_log_bytes. With no folder set, only the process is
+    sampled.
+    """
+
+    def __init__(self, metrics, sampler=None, interval=DEFAULT_EXPORT_INTERVAL, folder=None,
+                 max_log_bytes=MAX_LOG_BYTES, on_error=None):
+        self.metrics = metrics
+        self.sampler = sampler or ProcessSampler()
+        self.interval = interval
+        self.folder = folder
+        self.max_log_bytes = max_log_bytes
+        self.on_error = on_error
+        self.process = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def configure(self, folder=None, interval=None):
+        """Change where the files go (None stops writing them) and how often."""
+        with self._lock:
+            self.folder = folder
+            if interval is not None:
+                self.interval = interval
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="metrics", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the thread after writing the metrics one last time."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self):
+        exported = time.monotonic()
+        while True:
+            stopping = self._stop.wait(PROCESS_SAMPLE_INTERVAL)
+            with self._lock:
+                interval = self.interval
+            try:
+                self.process = self.sampler.sample()
+                if stopping or time.monotonic() - exported >= interval:
+                    exported = time.monotonic()
+                    self.export()
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(f"metrics: {e}")
+            if stopping:
+                return
+
+    def export(self):
+        """Write both files once, if a folder is set."""
+        if self.process is None:
+            self.process = self.sampler.sample()
+        snapshot = self.metrics.snapshot()
+        with self._lock:
+            folder = self.folder
+        if not folder or not os.path.isdir(folder):
+            return
+        path = os.path.join(folder, PROMETHEUS_FILE)
+        temporary = path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            f.write(to_prometheus(snapshot, self.process))
+        os.replace(temporary, path)
+
+        entry = summarize(snapshot, self._previous)
+        entry['process'] = self.process
+        self._previous = snapshot
+        log_path = os.path.join(folder, METRICS_LOG)
+        try:
+            if os.path.getsize(log_path) > self.max_log_bytes:
+                os.replace(log_path, log_path + '.1')
+        except FileNotFoundError:
+            pass
+        with open(log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
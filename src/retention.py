@@ -0,0 +1,187 @@
+import os
+import time
+import shutil
+import datetime
+import threading
+from storage import parse_date_folder
+
+# Defaults
+DEFAULT_RETENTION_DAYS = 30
+DEFAULT_CHECK_INTERVAL = 3600
+# Deletion is done in slices: at most this many files or this much time, then a short pause
+SLICE_FILES = 200
+SLICE_SECONDS = 0.05
+SLICE_PAUSE = 0.05
+
+
+class RetentionPolicy:
+    """Limits enforced on an output folder; 0 disables the quota and the free-space floor."""
+
+    def __init__(self, max_age_days=DEFAULT_RETENTION_DAYS, max_total_bytes=0, min_free_bytes=0):
+        self.max_age_days = max_age_days
+        self.max_total_bytes = max_total_bytes
+        self.min_free_bytes = min_free_bytes
+
+
+class RetentionEngine:
+    """Delete whole day folders, oldest first, on a background thread.
+
+    A day folder is removed when it is older than the retention period, when
+    the folders together exceed the byte quota, or while the disk has less
+    free space than the floor. Today's folder is never removed. Only the
+    root folder is listed on each run; the size of a past day is measured
+    once and then cached, since nothing is written to it any more.
+    """
+
+    def __init__(self, policy=None, check_interval=DEFAULT_CHECK_INTERVAL, on_deleted=None, on_error=None,
+                 metrics=None):
+        self.policy = policy or RetentionPolicy()
+        self.root = None
+        self.check_interval = check_interval
+        self.on_deleted = on_deleted
+        self.on_error = on_error
+        self.metrics = metrics
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def configure(self, root=None, policy=None):
+        """Change the output folder and/or the policy; takes effect on the next run."""
+        with self._lock:
+            if root is not None and root != self.root:
+                self.root = root
+                self._sizes = {}
+            if policy is not None:
+                self.policy = policy
+
+    def start(self):
+        """Start the background thread; it runs once immediately and then every check_interval."""
+        if self._thread is None:
+            self._wake.set()
+            self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the background thread, interrupting a deletion in progress."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_now(self):
+        """Ask the background thread to enforce the policy as soon as possible."""
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.check_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            started = time.perf_counter()
+            try:
+                self.enforce()
+            except Exception as e:
+                if self.on_error:
+                    self.on_error(f"retention: {e}")
+            if self.metrics:
+                self.metrics.observe('retention', time.perf_counter() - started)
+
+    def enforce(self):
+        """Apply the policy once; returns the list of day folders that were removed."""
+        with self._lock:
+            root, policy = self.root, self.policy
+        if not root or not os.path.isdir(root):
+            return []
+
+        today = datetime.date.today()
+        days = []
+        for entry in os.scandir(root):
+            day = parse_date_folder(entry.name) if entry.is_dir() else None
+            if day is not None and day < today:
+                days.append((day, entry.path))
+        days.sort()
+        removed = []
+
+        cutoff = today - datetime.timedelta(days=policy.max_age_days)
+        while days and days[0][0] < cutoff and not self._stop.is_set():
+            removed.append(self._remove_day(root, *days.pop(0)))
+
+        if policy.max_total_bytes:
+            todays_folder = os.path.join(root, today.isoformat())
+            total = self._folder_size(todays_folder) + sum(self._day_size(day, path) for day, path in days)
+            while days and total > policy.max_total_bytes and not self._stop.is_set():
+                day, path = days.pop(0)
+                total -= self._day_size(day, path)
+                removed.append(self._remove_day(root, day, path))
+
+        if policy.min_free_bytes:
+            while days and shutil.disk_usage(root).free < policy.min_free_bytes and not self._stop.is_set():
+                removed.append(self._remove_day(root, *days.pop(0)))
+        return [day for day in removed if day is not None]
+
+    def _day_size(self, day, path):
+        if day not in self._sizes:
+            self._sizes[day] = self._folder_size(path)
+        return self._sizes[day]
+
+    def _folder_size(self, path):
+        total = 0
+        stack = [path]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        else:
+                            total += entry.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                continue
+        return total
+
+    def _remove_day(self, root, day, path):
+        """Delete a day folder in time-sliced batches and drop it from the catalog and thumbnail cache.
+
+        Returns None if stopping interrupts it: the day stays in the catalog
+        and the storage totals until a later run has removed all of it.
+        """
+        # Imported on first use, so that the window can read the retention defaults without loading them.
+        from catalog import Catalog, CATALOG_FILE
+        from thumbnails import remove_day_thumbnails
+        freed = 0
+        slice_start = time.monotonic()
+        deleted_in_slice = 0
+        for folder, _, files in os.walk(path, topdown=False):
+            for name in files:
+                file_path = os.path.join(folder, name)
+                try:
+                    freed += os.stat(file_path).st_size
+                    os.remove(file_path)
+                except FileNotFoundError:
+                    pass
+                deleted_in_slice += 1
+                if deleted_in_slice >= SLICE_FILES or time.monotonic() - slice_start >= SLICE_SECONDS:
+                    if self._stop.wait(SLICE_PAUSE):
+                        self._sizes.pop(day, None)
+                        return None
+                    slice_start = time.monotonic()
+                    deleted_in_slice = 0
+            try:
+                os.rmdir(folder)
+            except OSError:
+                pass
+        self._sizes.pop(day, None)
+        if os.path.exists(os.path.join(root, CATALOG_FILE)):
+            catalog = Catalog(root)
+            catalog.delete_day(day.isoformat())
+            catalog.close()
+        remove_day_thumbnails(root, day.isoformat())
+        if self.metrics:
+            self.metrics.add('retention_freed_bytes', freed)
+        if self.on_deleted:
+            self.on_deleted(root, day, freed)
+        return day
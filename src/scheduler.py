@@ -0,0 +1,227 @@
+import time
+import threading
+
+# Schedule modes
+SCHEDULE_FIXED = 'fixed'
+SCHEDULE_ADAPTIVE = 'adaptive'
+SCHEDULE_MODES = (SCHEDULE_FIXED, SCHEDULE_ADAPTIVE)
+
+# Defaults
+MIN_INTERVAL = 0.25
+DEFAULT_INTERVAL = 300.0
+DEFAULT_ADAPTIVE_MIN_INTERVAL = 1.0
+DEFAULT_ADAPTIVE_MAX_INTERVAL = 1800.0
+DEFAULT_BACKOFF = 2.0
+# A capture whose largest changed-tile fraction is at or below this is "static"; above ACTIVE_CHANGE it is "changing"
+STATIC_CHANGE = 0.005
+ACTIVE_CHANGE = 0.05
+# No keyboard or mouse input for this long counts as idle
+DEFAULT_IDLE_THRESHOLD = 120.0
+# While waiting for a distant deadline in adaptive mode, check for returning input this often
+INPUT_POLL = 1.0
+
+
+class FixedPolicy:
+    """Capture every `interval` seconds."""
+
+    name = SCHEDULE_FIXED
+
+    def __init__(self, interval=DEFAULT_INTERVAL):
+        self.interval = max(MIN_INTERVAL, float(interval))
+
+    def current_interval(self):
+        return self.interval
+
+    def observe(self, change, blank, idle):
+        """Adjust to the outcome of a capture; returns True if the interval got shorter."""
+        return False
+
+    def input_resumed(self):
+        """Called when input is seen after an idle period; returns True if the interval got shorter."""
+        return False
+
+
+class AdaptivePolicy(FixedPolicy):
+    """Capture faster while the screen changes and back off exponentially while it is static, blank or idle.
+
+    The interval starts at the configured one. A capture that changed more
+    than ACTIVE_CHANGE of the screen (while the user is not idle) divides the
+    interval by `backoff`, down to `min_interval`; a static or blank capture,
+    or input idle for `idle_threshold` seconds, multiplies it, up to
+    `max_interval`. Anything in between moves it one step back toward the
+    configured interval. Input after an idle period resets it at once.
+    """
+
+    name = SCHEDULE_ADAPTIVE
+
+    def __init__(self, interval=DEFAULT_INTERVAL, min_interval=DEFAULT_ADAPTIVE_MIN_INTERVAL,
+                 max_interval=DEFAULT_ADAPTIVE_MAX_INTERVAL, backoff=DEFAULT_BACKOFF,
+                 idle_threshold=DEFAULT_IDLE_THRESHOLD):
+        super().__init__(interval)
+        self.min_interval = max(MIN_INTERVAL, min(float(min_interval), self.interval))
+        self.max_interval = max(float(max_interval), self.interval)
+        self.backoff = max(1.0, float(backoff))
+        self.idle_threshold = idle_threshold
+        self.current = self.interval
+
+    def current_interval(self):
+        return self.current
+
+    def observe(self, change, blank, idle):
+        previous = self.current
+        idle = idle is not None and idle >= self.idle_threshold
+        if blank or idle or (change is not None and change <= STATIC_CHANGE):
+            self.current = min(self.max_interval, self.current * self.backoff)
+        elif change is not None and change > ACTIVE_CHANGE:
+            self.current = max(self.min_interval, self.current / self.backoff)
+        elif self.current > self.interval:
+            self.current = max(self.interval, self.current / self.backoff)
+        elif self.current < self.interval:
+            self.current = min(self.interval, self.current * self.backoff)
+        return self.current < previous
+
+    def input_resumed(self):
+        if self.current > self.interval:
+            self.current = self.interval
+            return True
+        return False
+
+
+def build_policy(settings, interval):
+    """Create the schedule policy described by the settings dict for a base interval in seconds."""
+    if settings.get('schedule_mode', SCHEDULE_FIXED) != SCHEDULE_ADAPTIVE:
+        return FixedPolicy(interval)
+    return AdaptivePolicy(interval,
+                          min_interval=float(settings.get('adaptive_min_interval', DEFAULT_ADAPTIVE_MIN_INTERVAL)),
+                          max_interval=float(settings.get('adaptive_max_interval', DEFAULT_ADAPTIVE_MAX_INTERVAL)),
+                          idle_threshold=float(settings.get('idle_threshold', DEFAULT_IDLE_THRESHOLD)))
+
+
+class CaptureScheduler:
+    """Call `tick` on a background thread at fixed deadlines.
+
+    Deadlines are laid out from the previous deadline rather than from when
+    the previous tick finished, so a slow tick or a late wake-up does not
+    shift every later capture. A deadline the thread wakes up too late for is
+    skipped, not caught up with a burst, and counted in `missed_deadlines`;
+    so is a tick that returns False because the capture engine was still busy.
+    """
+
+    def __init__(self, tick, idle_source=None):
+        self.tick = tick
+        self.idle_source = idle_source
+        self.policy = None
+        self._previous_deadline = None
+        self._next_deadline = None
+        self._was_idle = False
+        self._stats = {'ticks': 0, 'missed_deadlines': 0, 'max_lateness_ms': 0.0}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="capture-scheduler", daemon=True)
+        self._thread.start()
+
+    def start(self, policy):
+        """Start ticking; the first tick is one interval from now."""
+        with self._lock:
+            self.policy = policy
+            now = time.monotonic()
+            self._previous_deadline = now
+            self._next_deadline = now + policy.current_interval()
+        self._wake.set()
+
+    def set_policy(self, policy):
+        """Switch to another policy without restarting; the next deadline only ever moves earlier."""
+        with self._lock:
+            if self.policy is None:
+                return
+            self.policy = policy
+            self._pull_deadline_in()
+        self._wake.set()
+
+    def stop(self):
+        with self._lock:
+            self.policy = None
+            self._next_deadline = None
+        self._wake.set()
+
+    @property
+    def running(self):
+        return self.policy is not None
+
+    def observe(self, change, blank):
+        """Report how much a finished capture changed (None if unknown) and whether it was blank."""
+        idle = self.idle_source() if self.idle_source else None
+        with self._lock:
+            if self.policy is not None and self.policy.observe(change, blank, idle):
+                self._pull_deadline_in()
+        self._wake.set()
+
+    def next_capture_time(self):
+        """Wall-clock time of the next tick, or None when stopped."""
+        with self._lock:
+            if self._next_deadline is None:
+                return None
+            return time.time() + (self._next_deadline - time.monotonic())
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['interval'] = self.policy.current_interval() if self.policy else None
+            return stats
+
+    def close(self):
+        self._closed.set()
+        self._wake.set()
+        self._thread.join(5.0)
+
+    def _pull_deadline_in(self):
+        """Move the next deadline earlier if the current interval got shorter (lock held)."""
+        if self._next_deadline is None:
+            return
+        deadline = max(time.monotonic(), self._previous_deadline + self.policy.current_interval())
+        self._next_deadline = min(self._next_deadline, deadline)
+
+    def _check_input(self):
+        """Cut an adaptive back-off short as soon as the user is active again."""
+        idle = self.idle_source() if self.idle_source else None
+        if idle is None:
+            return
+        was_idle, self._was_idle = self._was_idle, idle >= INPUT_POLL * 2
+        if was_idle and not self._was_idle:
+            with self._lock:
+                if self.policy is not None and self.policy.input_resumed():
+                    self._pull_deadline_in()
+
+    def _loop(self):
+        while not self._closed.is_set():
+            with self._lock:
+                deadline, policy = self._next_deadline, self.policy
+            if deadline is None:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining > 0:
+                if policy.name == SCHEDULE_ADAPTIVE:
+                    remaining = min(remaining, INPUT_POLL)
+                self._wake.wait(remaining)
+                self._wake.clear()
+                if policy.name == SCHEDULE_ADAPTIVE:
+                    self._check_input()
+                continue
+
+            with self._lock:
+                if self.policy is None or self._next_deadline != deadline:
+                    continue
+                now = time.monotonic()
+                interval = self.policy.current_interval()
+                missed = int((now - deadline) // interval)
+                self._previous_deadline = deadline + missed * interval
+                self._next_deadline = self._previous_deadline + interval
+                self._stats['ticks'] += 1
+                self._stats['missed_deadlines'] += missed
+                self._stats['max_lateness_ms'] = max(self._stats['max_lateness_ms'], (now - deadline) * 1000)
+            if self.tick() is False:
+                with self._lock:
+                    self._stats['missed_deadlines'] += 1
@@ -0,0 +1,432 @@
+import os
+import sys
+import time
+import datetime
+import threading
+import itertools
+import subprocess
+from collections import OrderedDict, deque
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QListView, QComboBox, QLabel, QPushButton,
+                             QScrollArea, QMessageBox, QFileDialog, QProgressDialog)
+from PyQt5.QtCore import (Qt, QAbstractListModel, QModelIndex, QObject, QRunnable, QThreadPool, QSize, QTimer,
+                          pyqtSignal)
+from PyQt5.QtGui import QImage, QPixmap, QColor
+from catalog import Catalog, CATALOG_FILE
+from storage import SAME_AS_PREVIOUS
+from thumbnails import FrameLoader, ThumbnailStore, DEFAULT_THUMBNAIL_SIZE
+from similarity import SimilarityIndex, DEFAULT_MAX_DISTANCE
+
+# Defaults
+DEFAULT_PIXMAP_CACHE_MB = 128
+# Rows handed to the view at a time; the rest are added as the user scrolls
+FETCH_BATCH = 500
+# Thumbnail requests kept waiting; older ones belong to rows that were scrolled past and are dropped
+MAX_QUEUED_THUMBNAILS = 256
+
+
+def pil_to_qimage(image):
+    """Copy an RGB PIL image into a QImage (safe to create outside the GUI thread)."""
+    data = image.tobytes('raw', 'RGB')
+    return QImage(data, image.width, image.height, image.width * 3, QImage.Format_RGB888).copy()
+
+
+def open_in_file_explorer(folder):
+    """Open a folder in the system's file explorer; returns False if the OS is not supported."""
+    if os.name == 'nt':  # Windows
+        os.startfile(folder)
+    elif os.name == 'posix':  # macOS, Linux
+        subprocess.Popen(['open', folder] if sys.platform == 'darwin' else ['xdg-open', folder])
+    else:
+        return False
+    return True
+
+
+class PixmapCache:
+    """Least-recently-used QPixmap cache bounded by the memory the pixmaps use."""
+
+    def __init__(self, max_mb=DEFAULT_PIXMAP_CACHE_MB):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.used_bytes = 0
+        self._pixmaps = OrderedDict()
+
+    def get(self, key):
+        pixmap = self._pixmaps.get(key)
+        if pixmap is not None:
+            self._pixmaps.move_to_end(key)
+        return pixmap
+
+    def put(self, key, pixmap):
+        self.discard(key)
+        self._pixmaps[key] = pixmap
+        self.used_bytes += self.cost(pixmap)
+        while self.used_bytes > self.max_bytes and len(self._pixmaps) > 1:
+            _, oldest = self._pixmaps.popitem(last=False)
+            self.used_bytes -= self.cost(oldest)
+
+    def discard(self, key):
+        pixmap = self._pixmaps.pop(key, None)
+        if pixmap is not None:
+            self.used_bytes -= self.cost(pixmap)
+
+    def clear(self):
+        self._pixmaps.clear()
+        self.used_bytes = 0
+
+    @staticmethod
+    def cost(pixmap):
+        return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class ThumbnailSignals(QObject):
+    """Qt signals used to hand decoded thumbnails back to the GUI thread."""
+    loaded = pyqtSignal(object, QImage)
+    failed = pyqtSignal(object, str)
+
+
+class IndexingSignals(QObject):
+    """Qt signals used to report hash backfill and catalog rebuild progress back to the GUI thread."""
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal()
+
+
+def rebuild_catalog(catalog, tr, parent):
+    """Index an output folder that has no catalog yet, with a progress dialog; returns False if cancelled."""
+    progress = QProgressDialog(tr("cataloging_screenshots"), tr("cancel"), 0, 0, parent)
+    progress.setWindowModality(Qt.WindowModal)
+    progress.setMinimumDuration(0)
+    cancel = threading.Event()
+    signals = IndexingSignals()
+
+    def show_progress(done, total):
+        progress.setMaximum(total)
+        progress.setValue(done)
+
+    signals.progress.connect(show_progress)
+    signals.finished.connect(progress.accept)
+    progress.canceled.connect(cancel.set)
+
+    def run():
+        try:
+            catalog.rebuild(on_progress=signals.progress.emit, cancel=cancel)
+        finally:
+            catalog.close()
+            signals.finished.emit()
+
+    thread = threading.Thread(target=run, name="catalog-rebuild", daemon=True)
+    thread.start()
+    progress.exec_()
+    cancel.set()
+    thread.join()
+    return not progress.wasCanceled()
+
+
+class ThumbnailJob(QRunnable):
+    """Decode the most recently requested thumbnail that is still waiting."""
+
+    def __init__(self, queue, store, signals):
+        super().__init__()
+        self.queue = queue
+        self.store = store
+        self.signals = signals
+
+    def run(self):
+        try:
+            key = self.queue.pop()
+        except IndexError:
+            return
+        path, offset, image_format = key
+        try:
+            image = self.store.load(path, offset, image_format)
+            self.signals.loaded.emit(key, pil_to_qimage(image))
+        except Exception as e:
+            self.signals.failed.emit(key, str(e))
+
+
+class FrameListModel(QAbstractListModel):
+    """Catalog rows of an output folder, newest first, with lazily loaded thumbnails.
+
+    Only the rows the view paints ask for a thumbnail. Requests are served
+    newest first by a thread pool, and requests for rows that have long
+    scrolled out of view are dropped before they are decoded.
+    """
+
+    def __init__(self, store, cache, tr, parent=None):
+        super().__init__(parent)
+        self.store = store
+        self.cache = cache
+        self.tr = tr
+        self.rows = []
+        self.total = 0
+        self._more = iter(())
+        self._row_of = {}
+        self._queue = deque()
+        self._pending = set()
+        self._failed = set()
+        self.pool = QThreadPool(self)
+        self.signals = ThumbnailSignals()
+        self.signals.loaded.connect(self.on_thumbnail_loaded)
+        self.signals.failed.connect(self.on_thumbnail_failed)
+        self.placeholder = QPixmap(QSize(*store.size))
+        self.placeholder.fill(QColor(128, 128, 128))
+
+    def set_rows(self, rows, total=None):
+        """Replace the listed frames; rows are (timestamp, monitor, path, offset, format) tuples.
+
+        `rows` may be an iterator paging them in from the catalog, with
+        `total` their number; only the rows the view has scrolled to are
+        read and kept.
+        """
+        self.beginResetModel()
+        self.rows = []
+        self.total = len(rows) if total is None else total
+        self._more = iter(rows)
+        self._row_of = {}
+        self._queue.clear()
+        self._pending.clear()
+        self._failed.clear()
+        self._append(self._next_page())
+        self.endResetModel()
+
+    def _next_page(self):
+        page = list(itertools.islice(self._more, min(FETCH_BATCH, self.total - len(self.rows))))
+        if not page:
+            self.total = len(self.rows)  # frames were removed since they were counted
+        return page
+
+    def _append(self, page):
+        for n, (_, _, path, offset, image_format) in enumerate(page, start=len(self.rows)):
+            self._row_of[(path, offset, image_format)] = n
+        self.rows.extend(page)
+
+    @property
+    def visible_count(self):
+        return len(self.rows)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.visible_count
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.visible_count < self.total
+
+    def fetchMore(self, parent):
+        page = self._next_page()
+        if page:
+            self.beginInsertRows(QModelIndex(), self.visible_count, self.visible_count + len(page) - 1)
+            self._append(page)
+            self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.visible_count:
+            return None
+        timestamp, monitor, path, offset, image_format = self.rows[index.row()]
+        if role == Qt.DisplayRole:
+            when = datetime.datetime.fromtimestamp(timestamp)
+            return f"{when:%Y-%m-%d %H:%M:%S}\n{self.tr('monitor')} {monitor}"
+        if role == Qt.DecorationRole:
+            key = (path, offset, image_format)
+            pixmap = self.cache.get(key)
+            if pixmap is None:
+                self.request_thumbnail(key)
+                return self.placeholder
+            return pixmap
+        if role == Qt.ToolTipRole:
+            return path if offset is None else f"{path} @ {offset}"
+        return None
+
+    def frame(self, index):
+        """Return (path, offset, format) of the frame at a model index."""
+        _, _, path, offset, image_format = self.rows[index.row()]
+        return path, offset, image_format
+
+    def request_thumbnail(self, key):
+        if key in self._pending or key in self._failed:
+            return
+        self._pending.add(key)
+        self._queue.append(key)
+        if len(self._queue) > MAX_QUEUED_THUMBNAILS:
+            try:
+                self._pending.discard(self._queue.popleft())
+            except IndexError:
+                pass
+        self.pool.start(ThumbnailJob(self._queue, self.store, self.signals))
+
+    def on_thumbnail_loaded(self, key, image):
+        self._pending.discard(key)
+        self.cache.put(key, QPixmap.fromImage(image))
+        self._refresh(key)
+
+    def on_thumbnail_failed(self, key, message):
+        self._pending.discard(key)
+        self._failed.add(key)
+
+    def _refresh(self, key):
+        row = self._row_of.get(key)
+        if row is not None and row < self.visible_count:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def shutdown(self):
+        """Drop waiting thumbnail requests and wait for the running ones."""
+        self._queue.clear()
+        self.pool.clear()
+        self.pool.waitForDone()
+
+
+class ScreenshotBrowser(QDialog):
+    """In-app timeline of everything captured under an output folder."""
+
+    def __init__(self, root, tr, pixmap_cache_mb=DEFAULT_PIXMAP_CACHE_MB, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.tr = tr
+        self.loader = FrameLoader()
+        self.catalog = Catalog(root)
+        self.model = FrameListModel(ThumbnailStore(root, loader=self.loader), PixmapCache(pixmap_cache_mb), tr, self)
+        self.similarity = SimilarityIndex(self.catalog, self.loader)
+
+        self.setWindowTitle(self.tr("view_screenshots"))
+        self.resize(1100, 700)
+        layout = QVBoxLayout(self)
+
+        toolbar = QHBoxLayout()
+        self.dayComboBox = QComboBox()
+        self.dayComboBox.currentIndexChanged.connect(self.load_rows)
+        toolbar.addWidget(self.dayComboBox)
+        self.countLabel = QLabel()
+        toolbar.addWidget(self.countLabel)
+        toolbar.addStretch()
+        self.findSimilarButton = QPushButton(self.tr("find_similar"))
+        self.findSimilarButton.setToolTip(self.tr("find_similar_tooltip"))
+        self.findSimilarButton.clicked.connect(self.find_similar)
+        toolbar.addWidget(self.findSimilarButton)
+        self.openFolderButton = QPushButton(self.tr("open_folder"))
+        self.openFolderButton.clicked.connect(self.open_folder)
+        toolbar.addWidget(self.openFolderButton)
+        layout.addLayout(toolbar)
+
+        width, height = DEFAULT_THUMBNAIL_SIZE
+        self.listView = QListView()
+        self.listView.setViewMode(QListView.IconMode)
+        self.listView.setMovement(QListView.Static)
+        self.listView.setResizeMode(QListView.Adjust)
+        self.listView.setUniformItemSizes(True)
+        self.listView.setLayoutMode(QListView.Batched)
+        self.listView.setBatchSize(FETCH_BATCH)
+        self.listView.setIconSize(QSize(width, height))
+        self.listView.setGridSize(QSize(width + 16, height + 48))
+        self.listView.setModel(self.model)
+        self.listView.doubleClicked.connect(self.show_frame)
+        layout.addWidget(self.listView)
+
+        if os.path.exists(os.path.join(self.root, CATALOG_FILE)):
+            self.load_days()
+        else:
+            # Once the browser is shown, so that indexing the folder can show its progress over it.
+            QTimer.singleShot(0, self.load_days)
+
+    def load_days(self):
+        """Fill the day selector from the catalog, indexing the folder first if it has no catalog yet."""
+        if not os.path.exists(os.path.join(self.root, CATALOG_FILE)):
+            if not rebuild_catalog(self.catalog, self.tr, self):
+                self.reject()
+                return
+        self.dayComboBox.blockSignals(True)
+        self.dayComboBox.clear()
+        self.dayComboBox.addItem(self.tr("all_days"), None)
+        for day, _, _ in reversed(self.catalog.days()):
+            self.dayComboBox.addItem(day, day)
+        self.dayComboBox.blockSignals(False)
+        self.load_rows()
+
+    def load_rows(self):
+        """List the frames of the selected day (or of every day), newest first."""
+        day = self.dayComboBox.currentData()
+        start = end = None
+        if day:
+            start = datetime.datetime.strptime(day, "%Y-%m-%d")
+            end = start + datetime.timedelta(days=1)
+        total = self.catalog.count(start, end, skip_format=SAME_AS_PREVIOUS)
+        rows = ((row['timestamp'], row['monitor'], self.catalog.absolute_path(row['path']), row['offset'],
+                 row['format']) for row in self.catalog.newest_frames(start, end, SAME_AS_PREVIOUS, FETCH_BATCH))
+        self.model.set_rows(rows, total)
+        self.countLabel.setText(f"{self.tr('screenshot_count')}: {total}")
+
+    def find_similar(self):
+        """List every frame that looks like the selected one, or like an image file if none is selected."""
+        index = self.listView.currentIndex()
+        if index.isValid():
+            path, offset, image_format = self.model.frame(index)
+        else:
+            path, _ = QFileDialog.getOpenFileName(self, self.tr("find_similar"), self.root,
+                                                  "Images (*.png *.jpg *.jpeg *.webp)")
+            if not path:
+                return
+            offset = image_format = None
+        if not self.index_missing_hashes():
+            return
+        try:
+            sample = self.similarity.hash_of(path, offset, image_format)
+        except Exception as e:
+            QMessageBox.warning(self, self.tr("find_similar"), f"{path}: {e}")
+            return
+        start = time.perf_counter()
+        matches = self.similarity.search(sample, DEFAULT_MAX_DISTANCE)
+        elapsed = (time.perf_counter() - start) * 1000
+        rows = [(row['timestamp'], row['monitor'], self.catalog.absolute_path(row['path']), row['offset'], row['format'])
+                for _, row in matches]
+        self.model.set_rows(rows)
+        self.countLabel.setText(f"{self.tr('similar_screenshots')}: {len(rows)} ({elapsed:.0f} ms)")
+
+    def index_missing_hashes(self):
+        """Hash the frames saved before hashes were kept, with a progress dialog; returns False if cancelled."""
+        missing = self.similarity.missing()
+        if not missing:
+            return True
+        progress = QProgressDialog(self.tr("indexing_screenshots"), self.tr("cancel"), 0, missing, self)
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        cancel = threading.Event()
+        signals = IndexingSignals()
+        signals.progress.connect(lambda done, total: progress.setValue(min(done, missing)))
+        signals.finished.connect(progress.accept)
+        progress.canceled.connect(cancel.set)
+
+        def run():
+            try:
+                self.similarity.backfill(on_progress=signals.progress.emit, cancel=cancel)
+            finally:
+                signals.finished.emit()
+
+        thread = threading.Thread(target=run, name="similarity-index", daemon=True)
+        thread.start()
+        progress.exec_()
+        cancel.set()
+        thread.join()
+        return not progress.wasCanceled()
+
+    def show_frame(self, index):
+        """Show a frame at full size."""
+        path, offset, image_format = self.model.frame(index)
+        try:
+            image = self.loader.load(path, offset, image_format)
+        except Exception as e:
+            QMessageBox.warning(self, self.tr("view_screenshots"), f"{path}: {e}")
+            return
+        dialog = QDialog(self)
+        dialog.setWindowTitle(self.model.data(index).replace("\n", " - "))
+        dialog.resize(min(image.width + 40, 1600), min(image.height + 40, 1000))
+        label = QLabel()
+        label.setPixmap(QPixmap.fromImage(pil_to_qimage(image)))
+        scrollArea = QScrollArea()
+        scrollArea.setWidget(label)
+        QVBoxLayout(dialog).addWidget(scrollArea)
+        dialog.exec_()
+
+    def open_folder(self):
+        if not open_in_file_explorer(self.root):
+            QMessageBox.warning(self, self.tr("unsupported_os"), self.tr("file_explorer_not_supported"))
+
+    def done(self, result):
+        self.model.shutdown()
+        self.catalog.close()
+        super().done(result)
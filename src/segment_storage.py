@@ -0,0 +1,272 @@
+import os
+import io
+import sys
+import mmap
+import struct
+import argparse
+import datetime
+import threading
+from PIL import Image
+from storage import (FileStorage, SavedFrame, date_folder, parse_date_folder, screenshot_filename, TIMESTAMP_FORMAT,
+                     STORAGE_SEGMENTS)
+
+# Segment layout: records, then (once sealed) one INDEX_ENTRY per record and a FOOTER.
+SEGMENT_EXTENSION = 'seg'
+RECORD_MAGIC = b'STF1'
+INDEX_MAGIC = b'STX1'
+RECORD_HEADER = struct.Struct('<4sHdIIBI')  # magic, monitor, timestamp, width, height, format code, payload length
+INDEX_ENTRY = struct.Struct('<QdH')  # record offset, timestamp, monitor
+FOOTER = struct.Struct('<4sQI')  # magic, index offset, record count
+FORMAT_CODES = {'PNG': 1, 'JPEG': 2, 'WEBP': 3}
+FORMATS_BY_CODE = {code: name for name, code in FORMAT_CODES.items()}
+
+# Segments being appended to by a writer of this process; no other writer may seal them
+_open_segments = set()
+_open_segments_lock = threading.Lock()
+
+
+def day_segments(folder):
+    """Return the segment files in a day folder, oldest first."""
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                  if name.startswith('segment_') and name.endswith('.' + SEGMENT_EXTENSION))
+
+
+def segment_path(root, timestamp):
+    """Return the path of a new segment whose first frame is captured at `timestamp`."""
+    name = f"segment_{timestamp.strftime(TIMESTAMP_FORMAT)}-{timestamp.microsecond // 1000:03d}.{SEGMENT_EXTENSION}"
+    return os.path.join(date_folder(root, timestamp), name)
+
+
+def seal_segment(path):
+    """Append the offset index to a segment that was left open (e.g. by a crash); returns its record count."""
+    with SegmentReader(path) as reader:
+        if reader.sealed:
+            return len(reader)
+        entries, end = list(reader.entries), reader.records_end
+    with open(path, 'r+b') as f:
+        # Drop a record that was only partly written.
+        f.truncate(end)
+        f.seek(end)
+        f.write(b''.join(INDEX_ENTRY.pack(offset, timestamp, monitor) for offset, timestamp, monitor in entries))
+        f.write(FOOTER.pack(INDEX_MAGIC, end, len(entries)))
+    return len(entries)
+
+
+class _OpenSegment:
+    """The segment the writer is appending to for one output folder and day."""
+
+    __slots__ = ('path', 'file', 'day', 'entries')
+
+    def __init__(self, path, day):
+        self.path = path
+        self.day = day
+        self.file = open(path, 'ab')
+        self.entries = []
+        with _open_segments_lock:
+            _open_segments.add(path)
+
+    def append(self, record, timestamp, monitor):
+        offset = self.file.seek(0, os.SEEK_END)
+        self.file.write(record)
+        # Readers in other processes (the viewer) must see every frame that is in the catalog.
+        self.file.flush()
+        self.entries.append((offset, timestamp, monitor))
+        return offset
+
+    def seal(self):
+        if self.file.closed:
+            return
+        try:
+            end = self.file.seek(0, os.SEEK_END)
+            self.file.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in self.entries))
+            self.file.write(FOOTER.pack(INDEX_MAGIC, end, len(self.entries)))
+        finally:
+            self.file.close()
+            with _open_segments_lock:
+                _open_segments.discard(self.path)
+
+
+class SegmentStorage(FileStorage):
+    """Append every encoded frame of a day to one segment file instead of writing one file per screenshot.
+
+    Frames are encoded exactly as in files mode. Each record is a small
+    header (monitor, time, size, format) followed by the encoded image.
+    When the day ends or the storage closes, the segment is sealed with an
+    index of record offsets and a fixed-size footer, so a reader finds any
+    frame in O(1) from the end of the file; the catalog keeps each frame's
+    offset as well. A segment left open by a crash is still readable by
+    scanning its records, and is sealed when the next segment of that day
+    is started. Every session starts a new segment, so sealed segments are
+    never modified.
+    """
+
+    name = STORAGE_SEGMENTS
+
+    def __init__(self):
+        super().__init__()
+        self._segments = {}
+
+    def write(self, task):
+        job = task.job
+        segment = self._segment(job.output_folder, job.timestamp)
+        width, height = task.extra
+        timestamp = job.timestamp.timestamp()
+        record = b''.join([
+            RECORD_HEADER.pack(RECORD_MAGIC, task.monitor, timestamp, width, height,
+                               FORMAT_CODES[task.encoding.format], len(task.data)),
+            task.data,
+        ])
+        offset = segment.append(record, timestamp, task.monitor)
+        return [SavedFrame(job.timestamp, task.monitor, segment.path, len(record), task.encoding.format, width, height,
+                           offset=offset, content_hash=task.content_hash, perceptual_hash=task.perceptual_hash)]
+
+    def _segment(self, root, timestamp):
+        segment = self._segments.get(root)
+        if segment is not None and segment.day == timestamp.date() and os.path.exists(segment.path):
+            return segment
+        if segment is not None:
+            self._seal(segment)
+        folder = date_folder(root, timestamp)
+        os.makedirs(folder, exist_ok=True)
+        for path in day_segments(folder):
+            with _open_segments_lock:
+                if path in _open_segments:
+                    continue  # another storage of this process is still writing it
+            try:
+                seal_segment(path)
+            except (OSError, ValueError):
+                pass  # unreadable; left for the export tool to salvage what it can
+        segment = self._segments[root] = _OpenSegment(segment_path(root, timestamp), timestamp.date())
+        return segment
+
+    def _seal(self, segment):
+        try:
+            segment.seal()
+        except OSError:
+            pass  # e.g. its day folder was removed; the next reader scans the records instead
+
+    def close(self):
+        for segment in self._segments.values():
+            self._seal(segment)
+        self._segments = {}
+
+
+class SegmentReader:
+    """Random access to the frames of a segment through a memory map."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._map = None
+        self.sealed = False
+        self.entries = []
+        self.records_end = 0
+        self._offsets = {}
+        self._load()
+
+    def _load(self):
+        """Map the segment, reading its index, or (while it is open) the records appended since the last load."""
+        if self._map is not None:
+            self._map.close()
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if size >= FOOTER.size:
+            magic, index_offset, count = FOOTER.unpack_from(self._map, size - FOOTER.size)
+            if magic == INDEX_MAGIC and index_offset + count * INDEX_ENTRY.size + FOOTER.size == size:
+                self.sealed = True
+                self.records_end = index_offset
+                self.entries = list(INDEX_ENTRY.iter_unpack(self._map[index_offset:size - FOOTER.size]))
+                self._offsets = {entry[0]: n for n, entry in enumerate(self.entries)}
+                return
+        # The records already found do not move, so only what was appended after them is read.
+        entries, self.records_end = self._scan(self.records_end, size)
+        for entry in entries:
+            self._offsets[entry[0]] = len(self.entries)
+            self.entries.append(entry)
+
+    def _scan(self, offset, size):
+        """Find the records of a segment without an index from `offset` on, stopping at a partly written one."""
+        entries = []
+        while offset + RECORD_HEADER.size <= size:
+            magic, monitor, timestamp, _, _, _, length = RECORD_HEADER.unpack_from(self._map, offset)
+            if magic != RECORD_MAGIC or offset + RECORD_HEADER.size + length > size:
+                break
+            entries.append((offset, timestamp, monitor))
+            offset += RECORD_HEADER.size + length
+        return entries, offset
+
+    def __len__(self):
+        return len(self.entries)
+
+    def record(self, offset):
+        """Return (monitor, capture time, (width, height), format, encoded bytes as a memoryview) at an offset."""
+        if offset + RECORD_HEADER.size > len(self._map) and not self.sealed:
+            self._load()  # the segment grew since it was mapped
+        magic, monitor, timestamp, width, height, code, length = RECORD_HEADER.unpack_from(self._map, offset)
+        start = offset + RECORD_HEADER.size
+        if start + length > len(self._map) and not self.sealed:
+            self._load()  # the frame was still being written when the segment was mapped
+        if magic != RECORD_MAGIC or start + length > len(self._map):
+            raise ValueError(f"{self.path}: no frame at offset {offset}")
+        return (monitor, datetime.datetime.fromtimestamp(timestamp), (width, height), FORMATS_BY_CODE.get(code),
+                memoryview(self._map)[start:start + length])
+
+    def image(self, offset):
+        """Decode the frame at an offset."""
+        payload = self.record(offset)[4]
+        try:
+            return Image.open(io.BytesIO(payload))
+        finally:
+            payload.release()
+
+    def close(self):
+        if self._map:
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def export_segment(path, output):
+    """Write every frame of a segment to `output` as screen_{i}_{timestamp}.{ext}; returns the number written."""
+    with SegmentReader(path) as reader:
+        for offset, _, _ in reader.entries:
+            monitor, timestamp, _, image_format, payload = reader.record(offset)
+            folder = date_folder(output, timestamp)
+            os.makedirs(folder, exist_ok=True)
+            with open(os.path.join(folder, screenshot_filename(monitor, timestamp, image_format.lower())), 'wb') as f:
+                f.write(payload)
+            payload.release()
+        return len(reader)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Unpack Screen Tracker segments back into one file per screenshot")
+    parser.add_argument('source', help="a .seg file, a day folder or an output folder")
+    parser.add_argument('output', help="folder to write day folders with the screenshots into")
+    args = parser.parse_args(argv)
+
+    if os.path.isfile(args.source):
+        segments = [args.source]
+    elif parse_date_folder(os.path.basename(os.path.normpath(args.source))) is not None:
+        segments = day_segments(args.source)
+    else:
+        segments = [path for entry in sorted(os.scandir(args.source), key=lambda entry: entry.name)
+                    if entry.is_dir() and parse_date_folder(entry.name) is not None
+                    for path in day_segments(entry.path)]
+    total = 0
+    for path in segments:
+        try:
+            total += export_segment(path, args.output)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}", file=sys.stderr)
+    print(f"Exported {total} screenshots from {len(segments)} segments to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
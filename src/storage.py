@@ -0,0 +1,155 @@
+import os
+import datetime
+
+# Constants
+DATE_FOLDER_FORMAT = "%Y-%m-%d"
+TIMESTAMP_FORMAT = "%Y-%m-%d_%H-%M-%S"
+DUPLICATES_LOG = 'same_as_previous.jsonl'
+SAME_AS_PREVIOUS = 'SAME'
+
+# Storage modes
+STORAGE_FILES = 'files'
+STORAGE_DELTA = 'delta'
+STORAGE_SEGMENTS = 'segments'
+STORAGE_MODES = (STORAGE_FILES, STORAGE_DELTA, STORAGE_SEGMENTS)
+
+
+def date_folder(root, day):
+    """Return the folder that holds the screenshots taken on the given day."""
+    return os.path.join(root, day.strftime(DATE_FOLDER_FORMAT))
+
+
+def parse_date_folder(name):
+    """Return the date encoded in a day folder name, or None if it is not a day folder."""
+    try:
+        return datetime.datetime.strptime(name, DATE_FOLDER_FORMAT).date()
+    except ValueError:
+        return None
+
+
+def screenshot_filename(monitor, timestamp, extension):
+    """Return the file name used for a screenshot of a monitor; milliseconds keep sub-second captures apart."""
+    return f"screen_{monitor}_{timestamp.strftime(TIMESTAMP_FORMAT)}-{timestamp.microsecond // 1000:03d}.{extension}"
+
+
+class SavedFrame:
+    """A frame that has been written to disk."""
+
+    __slots__ = ('timestamp', 'monitor', 'path', 'size', 'format', 'width', 'height', 'offset', 'content_hash',
+                 'perceptual_hash')
+
+    def __init__(self, timestamp, monitor, path, size, format, width, height, offset=None, content_hash=None,
+                 perceptual_hash=None):
+        self.timestamp = timestamp
+        self.monitor = monitor
+        self.path = path
+        self.size = size
+        self.format = format
+        self.width = width
+        self.height = height
+        self.offset = offset
+        self.content_hash = content_hash
+        self.perceptual_hash = perceptual_hash
+
+
+class StorageTask:
+    """Work handed from the convert stage to an encode worker and then to the writer."""
+
+    __slots__ = ('storage', 'job', 'monitor', 'image', 'pooled', 'data', 'content_hash', 'perceptual_hash', 'extra',
+                 'encoding')
+
+    def __init__(self, storage, job, monitor, image, pooled=False, extra=None):
+        self.storage = storage
+        self.job = job
+        self.monitor = monitor
+        self.image = image
+        self.pooled = pooled
+        self.data = None
+        self.content_hash = None
+        self.perceptual_hash = None
+        self.extra = extra
+        self.encoding = None
+
+
+class FrameWriter:
+    """Write files under an output folder, creating day folders on demand."""
+
+    def __init__(self):
+        self._known_folders = set()
+
+    def write(self, path, data, mode='wb'):
+        """Write data to path; returns the number of bytes written."""
+        folder = os.path.dirname(path)
+        if folder not in self._known_folders:
+            os.makedirs(folder, exist_ok=True)
+            self._known_folders.add(folder)
+        try:
+            with open(path, mode) as f:
+                f.write(data)
+        except FileNotFoundError:
+            # The day folder was removed underneath us (e.g. by "Clean Folders").
+            os.makedirs(folder, exist_ok=True)
+            with open(path, mode) as f:
+                f.write(data)
+        return len(data)
+
+    def forget(self, folder):
+        """Stop assuming that a folder exists."""
+        self._known_folders.discard(folder)
+
+
+class FrameStorage:
+    """How captured frames are turned into files.
+
+    prepare() runs on the convert stage and encode() on an encode worker;
+    write() and discard() run on the writer thread, in capture order.
+    """
+
+    name = None
+
+    def prepare(self, job, frame, pool):
+        """Return a StorageTask for a frame, or None if no pooled buffer is free."""
+        raise NotImplementedError
+
+    def encode(self, task, backend):
+        """Fill task.data with the encoded bytes, running the image encoder on `backend`."""
+        raise NotImplementedError
+
+    def write(self, task):
+        """Write an encoded task and return the SavedFrame records it produced."""
+        raise NotImplementedError
+
+    def discard(self, task):
+        """Called instead of write() when encoding a task failed."""
+
+    def close(self):
+        """Flush and close any open files."""
+
+
+class FileStorage(FrameStorage):
+    """One image file per monitor per capture: screen_{i}_{timestamp}.{ext}, encoded as the job's encoder decides."""
+
+    name = STORAGE_FILES
+
+    def __init__(self):
+        self.writer = FrameWriter()
+
+    def prepare(self, job, frame, pool):
+        image = pool.decode(frame)
+        if image is None:
+            return None
+        return StorageTask(self, job, frame.monitor, image, pooled=True, extra=frame.size)
+
+    def encode(self, task, backend):
+        # extra becomes the stored size, which differs from the captured one when the encoder downscales.
+        task.data, task.extra, task.encoding = task.job.encoder.encode(task.image, task.job.timestamp.timestamp(),
+                                                                       backend)
+
+    def write(self, task):
+        job = task.job
+        filename = screenshot_filename(task.monitor, job.timestamp, task.encoding.extension)
+        path = os.path.join(date_folder(job.output_folder, job.timestamp), filename)
+        size = self.writer.write(path, task.data)
+        width, height = task.extra
+        return [SavedFrame(job.timestamp, task.monitor, path, size, task.encoding.format, width, height,
+                           content_hash=task.content_hash, perceptual_hash=task.perceptual_hash)]
@@ -0,0 +1,129 @@
+import shutil
+import threading
+from PyQt5.QtWidgets import (QDialog, QFormLayout, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QHeaderView,
+                             QProgressBar, QDialogButtonBox)
+from PyQt5.QtCore import Qt, QObject, pyqtSignal
+from storage_stats import StorageStats, days_until
+
+# Constants
+BYTES_PER_MB = 1024 ** 2
+BYTES_PER_GB = 1024 ** 3
+
+
+def format_bytes(size):
+    return f"{size / BYTES_PER_GB:.2f} GB" if size >= BYTES_PER_GB else f"{size / BYTES_PER_MB:.1f} MB"
+
+
+class StorageSignals(QObject):
+    """Qt signals used to report loading progress back to the GUI thread."""
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class StorageDialog(QDialog):
+    """Show how much space the captures use, per day and per monitor, how fast it grows and when the disk fills up."""
+
+    def __init__(self, root, tr, max_total_bytes=0, min_free_bytes=0, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.tr = tr
+        self.max_total_bytes = max_total_bytes
+        self.min_free_bytes = min_free_bytes
+        self.cancel = threading.Event()
+        self.signals = StorageSignals()
+        self.signals.progress.connect(self.on_progress)
+        self.signals.finished.connect(self.on_finished)
+        self.signals.failed.connect(self.on_failed)
+
+        self.setWindowTitle(self.tr("disk_space_info"))
+        self.resize(460, 560)
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+        total, used, free = shutil.disk_usage(root)
+        self.free = free
+        form.addRow(self.tr("total"), QLabel(format_bytes(total)))
+        form.addRow(self.tr("used"), QLabel(format_bytes(used)))
+        form.addRow(self.tr("free"), QLabel(format_bytes(free)))
+        self.trackerLabel = QLabel()
+        form.addRow(self.tr("tracker_usage"), self.trackerLabel)
+        self.growthLabel = QLabel()
+        form.addRow(self.tr("growth_rate"), self.growthLabel)
+        self.fullLabel = QLabel()
+        form.addRow(self.tr("days_until_full"), self.fullLabel)
+        self.quotaLabel = QLabel()
+        if max_total_bytes:
+            form.addRow(self.tr("days_until_quota"), self.quotaLabel)
+        layout.addLayout(form)
+
+        self.monitorTable = self.make_table([self.tr("monitor"), self.tr("frames"), self.tr("size")])
+        layout.addWidget(self.monitorTable)
+        self.dayTable = self.make_table([self.tr("day"), self.tr("frames"), self.tr("size")])
+        layout.addWidget(self.dayTable, 1)
+
+        self.progressBar = QProgressBar()
+        layout.addWidget(self.progressBar)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        # Only the folder totals are read; a day missing from them is read (or counted) once, in the background.
+        self.thread = threading.Thread(target=self.run_load, name="storage-stats", daemon=True)
+        self.thread.start()
+
+    def make_table(self, headers):
+        table = QTableWidget(0, len(headers))
+        table.setHorizontalHeaderLabels(headers)
+        table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        table.verticalHeader().setVisible(False)
+        table.setEditTriggers(QTableWidget.NoEditTriggers)
+        return table
+
+    def run_load(self):
+        try:
+            stats = StorageStats(self.root)
+            stats.load(on_progress=self.signals.progress.emit, cancel=self.cancel)
+            self.signals.finished.emit(stats)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+
+    def on_progress(self, days, total):
+        self.progressBar.setRange(0, total)
+        self.progressBar.setValue(days)
+
+    def on_finished(self, stats):
+        self.progressBar.hide()
+        totals = stats.totals()
+        rate = stats.growth_rate()
+        self.trackerLabel.setText(f"{format_bytes(totals['bytes'])} ({self.tr('frames')}: {totals['frames']})")
+        self.growthLabel.setText(f"{format_bytes(rate)} / {self.tr('day')}")
+        self.fullLabel.setText(self.format_days(days_until(self.free - self.min_free_bytes, rate)))
+        if self.max_total_bytes:
+            self.quotaLabel.setText(self.format_days(days_until(self.max_total_bytes - totals['bytes'], rate)))
+        self.fill_table(self.monitorTable, [(f"{self.tr('monitor')} {monitor}", per_monitor)
+                                            for monitor, per_monitor in sorted(totals['monitors'].items(),
+                                                                               key=lambda item: int(item[0]))])
+        self.fill_table(self.dayTable, reversed(stats.days()))
+
+    def fill_table(self, table, rows):
+        rows = list(rows)
+        table.setRowCount(len(rows))
+        for row, (name, totals) in enumerate(rows):
+            for column, text in enumerate((name, str(totals['frames']), format_bytes(totals['bytes']))):
+                item = QTableWidgetItem(text)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                table.setItem(row, column, item)
+
+    def format_days(self, days):
+        return self.tr("not_growing") if days is None else f"{days:.0f} {self.tr('days')}"
+
+    def on_failed(self, message):
+        self.progressBar.hide()
+        self.trackerLabel.setText(message)
+
+    def done(self, result):
+        # Closing the dialog stops a count in progress; the days counted so far keep their sidecars.
+        self.cancel.set()
+        self.thread.join()
+        super().done(result)
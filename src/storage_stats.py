@@ -0,0 +1,335 @@
+import os
+import json
+import time
+import datetime
+import threading
+from storage import DATE_FOLDER_FORMAT, SAME_AS_PREVIOUS, parse_date_folder
+
+# Constants
+STATS_FILE = 'storage_stats.json'
+# Running totals of the whole output folder, with the totals of each day, kept in the folder itself
+FOLDER_STATS_FILE = 'storage_totals.json'
+SECONDS_PER_DAY = 86400
+# A rate measured over less than this is not extrapolated to a whole day
+MIN_GROWTH_SECONDS = 3600
+
+# Defaults
+DEFAULT_FLUSH_INTERVAL = 5.0
+DEFAULT_GROWTH_DAYS = 7
+
+
+def empty_totals():
+    return {'frames': 0, 'bytes': 0, 'first': None, 'last': None, 'monitors': {}}
+
+
+def empty_folder_totals():
+    return {'frames': 0, 'bytes': 0, 'monitors': {}, 'days': {}}
+
+
+def _count(totals, monitor, size, timestamp):
+    totals['frames'] += 1
+    totals['bytes'] += size or 0
+    per_monitor = totals['monitors'].setdefault(str(monitor), {'frames': 0, 'bytes': 0})
+    per_monitor['frames'] += 1
+    per_monitor['bytes'] += size or 0
+    if timestamp is not None:
+        totals['first'] = timestamp if totals['first'] is None else min(totals['first'], timestamp)
+        totals['last'] = timestamp if totals['last'] is None else max(totals['last'], timestamp)
+
+
+def _merge(totals, other, sign=1):
+    """Add (or with sign -1, subtract) the frame and byte counts of `other` to `totals`."""
+    totals['frames'] += sign * other['frames']
+    totals['bytes'] += sign * other['bytes']
+    for monitor, per_monitor in other['monitors'].items():
+        merged = totals['monitors'].setdefault(monitor, {'frames': 0, 'bytes': 0})
+        merged['frames'] += sign * per_monitor['frames']
+        merged['bytes'] += sign * per_monitor['bytes']
+        if merged['frames'] <= 0:
+            del totals['monitors'][monitor]
+    for key, pick in (('first', min), ('last', max)):
+        if sign > 0 and other.get(key) is not None and key in totals:
+            totals[key] = other[key] if totals[key] is None else pick(totals[key], other[key])
+
+
+def count_rows(rows, skip=()):
+    """Total catalog rows, leaving out markers and the frames whose (path, offset) is in `skip`."""
+    totals = empty_totals()
+    for row in rows:
+        if row[6] != SAME_AS_PREVIOUS and (row[3], row[4]) not in skip:
+            _count(totals, row[2], row[5], row[0])
+    return totals
+
+
+def count_day_folder(folder):
+    """Measure what is stored in a day folder by scanning it; only needed once for a day saved without a sidecar."""
+    # Imported on first use: days written by this version never need it.
+    from catalog import scan_day_folder
+    return count_rows(scan_day_folder(folder))
+
+
+def read_day_stats(folder):
+    """Return the totals kept in a day folder's sidecar, or None if it has none (or a damaged one)."""
+    try:
+        with open(os.path.join(folder, STATS_FILE), encoding='utf-8') as f:
+            totals = json.load(f)
+        return totals if {'frames', 'bytes', 'monitors'} <= totals.keys() else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def write_day_stats(folder, totals, name=STATS_FILE):
+    """Replace a day folder's sidecar; a folder that was deleted meanwhile is not recreated."""
+    if not os.path.isdir(folder):
+        return
+    path = os.path.join(folder, name)
+    # The window and the capture daemon may both write the folder totals.
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(totals, f)
+    os.replace(temporary, path)
+
+
+def read_folder_stats(root):
+    """Return the running totals kept at the top of an output folder, or None if it has none."""
+    try:
+        with open(os.path.join(root, FOLDER_STATS_FILE), encoding='utf-8') as f:
+            totals = json.load(f)
+        return totals if {'frames', 'bytes', 'monitors', 'days'} <= totals.keys() else None
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+_folder_stats_lock = threading.Lock()
+
+
+def update_folder_stats(root, changed=(), removed=()):
+    """Replace the entries of the changed (day, totals) and drop the removed days in the folder totals.
+
+    Each day's entry is set whole rather than adjusted, so a day the window
+    or an unclean exit left out of date is put right by its next write.
+    Returns the new folder totals.
+    """
+    with _folder_stats_lock:
+        folder = read_folder_stats(root) or empty_folder_totals()
+        for day in removed:
+            previous = folder['days'].pop(day, None)
+            if previous is not None:
+                _merge(folder, previous, -1)
+        for day, totals in changed:
+            previous = folder['days'].get(day)
+            if previous is not None:
+                _merge(folder, previous, -1)
+            folder['days'][day] = totals
+            _merge(folder, totals)
+        write_day_stats(root, folder, FOLDER_STATS_FILE)
+    return folder
+
+
+class StorageStats:
+    """Running frame and byte totals of an output folder, per day and per monitor.
+
+    Each day folder keeps its own totals in a small sidecar, updated as
+    frames are written, so nothing has to walk the archive to know its
+    size. The folder-wide totals, with a copy of each day's, are kept in
+    one file at the top of the folder and written alongside, so loading
+    them reads a single file and the growth rate only looks at the last
+    few days. A sidecar marked open was being written when its writer
+    stopped without closing it; that day is counted again from disk on a
+    background thread while the writer carries on from the sidecar.
+    """
+
+    def __init__(self, root, flush_interval=DEFAULT_FLUSH_INTERVAL):
+        self.root = root
+        self.flush_interval = flush_interval
+        self._days = {}
+        self._dirty = set()
+        self._totals = empty_totals()
+        # Days being counted again from disk, with the frames added to each since its count started
+        self._recounting = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    def load(self, on_progress=None, cancel=None):
+        """Read the folder totals, reading the sidecar (or counting the files) only of days missing from them.
+
+        Returns the number of days.
+        """
+        try:
+            with os.scandir(self.root) as entries:
+                days = sorted(entry.name for entry in entries if entry.is_dir() and parse_date_folder(entry.name))
+        except FileNotFoundError:
+            days = []
+        folder = read_folder_stats(self.root) or empty_folder_totals()
+        today = datetime.date.today().strftime(DATE_FOLDER_FORMAT)
+        changed = []
+        for number, day in enumerate(days, start=1):
+            if cancel is not None and cancel.is_set():
+                return number - 1
+            totals = folder['days'].get(day)
+            if totals is None or (totals.get('open') and day != today):
+                totals = read_day_stats(os.path.join(self.root, day))
+                if totals is None or (totals.get('open') and day != today):
+                    # A past day left open was being written when its writer stopped; its files are the truth.
+                    totals = count_day_folder(os.path.join(self.root, day))
+                    if day != today:
+                        # Nothing is written to a past day any more; today's sidecar belongs to the capture writer.
+                        write_day_stats(os.path.join(self.root, day), totals)
+                changed.append((day, totals))
+            if on_progress:
+                on_progress(number, len(days))
+        removed = set(folder['days']) - set(days)
+        if changed or removed:
+            folder = update_folder_stats(self.root, changed, removed)
+        with self._lock:
+            self._days = dict(folder['days'])
+            self._totals = {**empty_totals(), 'frames': folder['frames'], 'bytes': folder['bytes'],
+                            'monitors': folder['monitors']}
+        return len(days)
+
+    def add(self, record):
+        """Count a SavedFrame in its day and write the sidecars if the last write is old enough."""
+        if record.format == SAME_AS_PREVIOUS:
+            return  # a marker pointing at the previous frame's file, which is counted already
+        day = record.timestamp.strftime(DATE_FOLDER_FORMAT)
+        timestamp = record.timestamp.timestamp()
+        with self._lock:
+            if day not in self._days:
+                totals = read_day_stats(os.path.join(self.root, day))
+                if totals is None or totals.get('open'):
+                    # Counting the files would stall the writer; the sidecar stands in until the count is done.
+                    self._recounting[day] = {}
+                    threading.Thread(target=self._recount, args=(day,), name="storage-recount", daemon=True).start()
+                    totals = totals or empty_totals()
+                self._set_day(day, totals)
+            _count(self._days[day], record.monitor, record.size, timestamp)
+            _count(self._totals, record.monitor, record.size, None)
+            if day in self._recounting:
+                self._recounting[day][(record.path, record.offset)] = (record.monitor, record.size, timestamp)
+            self._dirty.add(day)
+        if time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def remove_day(self, day):
+        """Drop a deleted day folder from the totals."""
+        with self._lock:
+            self._dirty.discard(day)
+            self._recounting.pop(day, None)
+            totals = self._days.pop(day, None)
+            if totals is not None:
+                _merge(self._totals, totals, -1)
+        update_folder_stats(self.root, removed=[day])
+
+    def flush(self, closing=False):
+        """Write the sidecars of the days that changed; they stay marked open until the writer closes them.
+
+        A day still being counted again stays open even when closing, so
+        that the next writer counts it again.
+        """
+        with self._lock:
+            changed = [(day, {**self._days[day], 'open': not closing or day in self._recounting})
+                       for day in sorted(self._dirty)]
+            self._dirty.clear()
+            self._last_flush = time.monotonic()
+        for day, totals in changed:
+            write_day_stats(os.path.join(self.root, day), totals)
+        if changed:
+            update_folder_stats(self.root, changed)
+
+    def close(self):
+        with self._lock:
+            self._dirty.update(self._days)
+        self.flush(closing=True)
+
+    def days(self):
+        """Return (day, totals) for every known day, oldest first."""
+        with self._lock:
+            return [(day, dict(self._days[day])) for day in sorted(self._days)]
+
+    def totals(self):
+        """Return the frame and byte totals of the whole folder, with a breakdown per monitor."""
+        with self._lock:
+            return {'frames': self._totals['frames'], 'bytes': self._totals['bytes'], 'days': len(self._days),
+                    'monitors': {monitor: dict(per_monitor) for monitor, per_monitor in self._totals['monitors'].items()}}
+
+    def growth_rate(self, now=None, growth_days=DEFAULT_GROWTH_DAYS):
+        """Bytes stored per day over the last growth_days days, today included."""
+        now = time.time() if now is None else now
+        today = datetime.date.fromtimestamp(now)
+        stored = 0
+        first = None
+        with self._lock:
+            for back in range(growth_days):
+                totals = self._days.get((today - datetime.timedelta(days=back)).strftime(DATE_FOLDER_FORMAT))
+                if totals and totals['frames']:
+                    stored += totals['bytes']
+                    if totals.get('first') is not None:
+                        first = totals['first'] if first is None else min(first, totals['first'])
+        if not stored or first is None:
+            return 0.0
+        return stored * SECONDS_PER_DAY / max(now - first, MIN_GROWTH_SECONDS)
+
+    def _recount(self, day):
+        """Count a day's files and replace its totals with them and the frames added that the count missed."""
+        from catalog import scan_day_folder
+        try:
+            rows = scan_day_folder(os.path.join(self.root, day))
+        except Exception:
+            rows = None  # e.g. a stream still being written could not be read; the sidecar's totals stay
+        with self._lock:
+            added = self._recounting.pop(day, None)
+            if added is None or day not in self._days:
+                return  # the day was removed meanwhile
+            if rows is not None:
+                # Frames added while the files were scanned may or may not have been found on disk.
+                counted = count_rows(rows, skip=added)
+                for monitor, size, timestamp in added.values():
+                    _count(counted, monitor, size, timestamp)
+                _merge(self._totals, self._days[day], -1)
+                self._set_day(day, counted)
+            self._dirty.add(day)
+
+    def _set_day(self, day, totals):
+        self._days[day] = totals
+        _merge(self._totals, totals)
+
+
+def days_until(free_bytes, rate):
+    """Days until free_bytes are used up at rate bytes per day, or None if nothing is growing."""
+    if rate <= 0:
+        return None
+    return max(free_bytes, 0) / rate
+
+
+class StorageStatsSink:
+    """Capture-engine sink that keeps the storage totals of every output folder it writes to."""
+
+    def __init__(self, **stats_options):
+        self.stats_options = stats_options
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def stats(self, root):
+        """Return the storage totals of an output folder."""
+        with self._lock:
+            if root not in self._stats:
+                self._stats[root] = StorageStats(root, **self.stats_options)
+            return self._stats[root]
+
+    def add(self, job, record):
+        self.stats(job.output_folder).add(record)
+
+    def remove_day(self, root, day):
+        """Called by the retention engine once a day folder has been deleted."""
+        with self._lock:
+            stats = self._stats.get(root)
+        if stats is not None:
+            stats.remove_day(day)
+
+    def flush(self):
+        for stats in list(self._stats.values()):
+            stats.flush()
+
+    def close(self):
+        for stats in list(self._stats.values()):
+            stats.close()
@@ -0,0 +1,116 @@
+import os
+import bisect
+import shutil
+import hashlib
+import threading
+from PIL import Image
+from delta_storage import DeltaStreamReader, FORMAT_NAMES
+from segment_storage import SegmentReader, SEGMENT_EXTENSION
+
+# Constants
+THUMBNAIL_FOLDER = '.thumbnails'
+DEFAULT_THUMBNAIL_SIZE = (240, 135)
+DEFAULT_THUMBNAIL_QUALITY = 80
+DELTA_FORMATS = set(FORMAT_NAMES.values())
+# Open delta stream and segment readers kept per thread; a delta reader caches its last reconstructed frame
+MAX_OPEN_READERS = 8
+
+
+class FrameLoader:
+    """Load any stored frame (image file, segment record or delta stream record) as an RGB image.
+
+    Delta stream readers are kept open per thread, so walking a stream in
+    order only applies one delta per frame instead of replaying the chain
+    from its keyframe every time.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _reader(self, path):
+        readers = getattr(self._local, 'readers', None)
+        if readers is None:
+            readers = self._local.readers = {}
+        reader = readers.pop(path, None)
+        if reader is None:
+            if len(readers) >= MAX_OPEN_READERS:
+                oldest = next(iter(readers))
+                readers.pop(oldest).close()
+            reader = (SegmentReader if path.endswith('.' + SEGMENT_EXTENSION) else DeltaStreamReader)(path)
+        readers[path] = reader
+        return reader
+
+    def load(self, path, offset=None, image_format=None, size=None):
+        """Return the frame as an RGB image; with `size`, a thumbnail that fits in it."""
+        if image_format in DELTA_FORMATS:
+            return self._load_record(path, offset, size)
+        # A frame packed into a segment is read from the segment's memory map; nothing is extracted to disk.
+        opened = self._reader(path).image(offset) if offset is not None else Image.open(path)
+        with opened as image:
+            if size:
+                # JPEG can decode straight at 1/2, 1/4 or 1/8 scale.
+                image.draft('RGB', size)
+            image = image.convert('RGB')
+        if size:
+            # reducing_gap makes Pillow box-reduce by an integer factor before resampling.
+            image.thumbnail(size, Image.BILINEAR, reducing_gap=2.0)
+        return image
+
+    def _load_record(self, path, offset, size):
+        reader = self._reader(path)
+        position = bisect.bisect_left(reader.offsets, offset)
+        if position == len(reader.offsets) or reader.offsets[position] != offset:
+            # The stream grew since the reader was opened; only the records added since are read.
+            reader.refresh()
+            position = bisect.bisect_left(reader.offsets, offset)
+            if position == len(reader.offsets) or reader.offsets[position] != offset:
+                raise ValueError(f"{path}: no record at offset {offset}")
+        image = reader.frame(position)
+        if size:
+            image.thumbnail(size, Image.BILINEAR, reducing_gap=2.0)
+        return image
+
+
+class ThumbnailStore:
+    """Thumbnails of stored frames, kept as small JPEGs in .thumbnails/<day>/ under the output folder.
+
+    Stored frames never change, so a thumbnail is decoded once and then read
+    back from disk on every later visit.
+    """
+
+    def __init__(self, root, size=DEFAULT_THUMBNAIL_SIZE, quality=DEFAULT_THUMBNAIL_QUALITY, loader=None):
+        self.root = root
+        self.size = size
+        self.quality = quality
+        self.loader = loader or FrameLoader()
+
+    def thumbnail_path(self, path, offset=None):
+        """Return where the thumbnail of a frame is kept."""
+        try:
+            relative = os.path.relpath(path, self.root)
+        except ValueError:
+            relative = path
+        key = f"{relative}:{offset}:{self.size[0]}x{self.size[1]}".replace(os.sep, '/')
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()
+        day = os.path.basename(os.path.dirname(path))
+        return os.path.join(self.root, THUMBNAIL_FOLDER, day, digest + '.jpg')
+
+    def load(self, path, offset=None, image_format=None):
+        """Return the thumbnail of a frame, decoding and saving it on first use."""
+        thumbnail_path = self.thumbnail_path(path, offset)
+        try:
+            with Image.open(thumbnail_path) as image:
+                return image.convert('RGB')
+        except OSError:
+            pass
+        image = self.loader.load(path, offset, image_format, self.size)
+        os.makedirs(os.path.dirname(thumbnail_path), exist_ok=True)
+        temporary_path = f"{thumbnail_path}.{threading.get_ident()}.tmp"
+        image.save(temporary_path, format='JPEG', quality=self.quality)
+        os.replace(temporary_path, thumbnail_path)
+        return image
+
+
+def remove_day_thumbnails(root, day):
+    """Delete the cached thumbnails of a day folder name."""
+    shutil.rmtree(os.path.join(root, THUMBNAIL_FOLDER, day), ignore_errors=True)
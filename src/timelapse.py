@@ -0,0 +1,318 @@
+import io
+import os
+import sys
+import time
+import struct
+import argparse
+import datetime
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from catalog import Catalog, CATALOG_FILE
+from storage import SAME_AS_PREVIOUS
+from thumbnails import FrameLoader
+
+# Timelapse formats, chosen by the output file's extension
+TIMELAPSE_AVI = 'avi'
+TIMELAPSE_WEBP = 'webp'
+TIMELAPSE_FORMATS = (TIMELAPSE_AVI, TIMELAPSE_WEBP)
+
+# Defaults
+DEFAULT_FPS = 10
+DEFAULT_WIDTH = 1280
+DEFAULT_QUALITY = 80
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+# Frames decoded ahead of the writer per worker; memory use depends on this, not on the length of the range
+READ_AHEAD_PER_WORKER = 2
+# Both containers are RIFF files, whose sizes are 32-bit
+MAX_RIFF_BYTES = 2 ** 32 - 1
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+AVI_HEADER_SIZE = 224  # RIFF, hdrl list (avih, strl with strh and strf) and the movi list header
+AVI_INDEX_ENTRY = struct.Struct('<4sIII')  # chunk id, flags, offset from the movi list, size
+WEBP_FRAME_CHUNKS = (b'ALPH', b'VP8 ', b'VP8L')
+ANMF_NO_BLEND = 0x02
+
+
+def _chunk(fourcc, data):
+    """A RIFF chunk; odd-sized data is padded to an even length."""
+    return fourcc + struct.pack('<I', len(data)) + data + b'\0' * (len(data) & 1)
+
+
+def _uint24(value):
+    return struct.pack('<I', value)[:3]
+
+
+class MjpegAviWriter:
+    """Stream JPEG frames into a Motion-JPEG AVI.
+
+    Frames go straight to the file; only the 16-byte index entry of each
+    frame is set aside, in a temporary file, and appended on close, when
+    the header is rewritten with the final frame count and sizes.
+    """
+
+    def __init__(self, path, size, fps, quality=DEFAULT_QUALITY):
+        self.size = size
+        self.fps = fps
+        self.quality = quality
+        self.frames = 0
+        self._largest = 0
+        self._file = open(path, 'wb')
+        self._index = tempfile.TemporaryFile()
+        self._file.write(self._header())
+
+    def encode(self, image):
+        """Compress a frame for this container; called from the decode workers."""
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=self.quality)
+        return output.getvalue()
+
+    def write(self, frame):
+        chunk = _chunk(b'00dc', frame)
+        position = self._file.tell()
+        if position + len(chunk) + (self.frames + 1) * AVI_INDEX_ENTRY.size + 8 > MAX_RIFF_BYTES:
+            raise ValueError("the timelapse would exceed 4 GB; export a shorter range or a smaller size")
+        self._file.write(chunk)
+        # Offsets count from the 'movi' fourcc, which is 4 bytes before the first frame.
+        self._index.write(AVI_INDEX_ENTRY.pack(b'00dc', AVIIF_KEYFRAME, position - AVI_HEADER_SIZE + 4, len(frame)))
+        self._largest = max(self._largest, len(frame))
+        self.frames += 1
+
+    def close(self):
+        movi_size = self._file.tell() - AVI_HEADER_SIZE + 4
+        self._file.write(b'idx1' + struct.pack('<I', self.frames * AVI_INDEX_ENTRY.size))
+        self._index.seek(0)
+        while True:
+            block = self._index.read(1 << 20)
+            if not block:
+                break
+            self._file.write(block)
+        riff_size = self._file.tell() - 8
+        self._file.seek(0)
+        self._file.write(self._header(riff_size, movi_size))
+        self._index.close()
+        self._file.close()
+
+    def abort(self):
+        self._index.close()
+        self._file.close()
+
+    def _header(self, riff_size=0, movi_size=4):
+        width, height = self.size
+        rate = round(self.fps * 1000)
+        avih = struct.pack('<14I', round(1000000 / self.fps), self._largest * rate // 1000, 0, AVIF_HASINDEX,
+                           self.frames, 0, 1, self._largest, width, height, 0, 0, 0, 0)
+        strh = struct.pack('<4s4sIHHIIIIIIII4h', b'vids', b'MJPG', 0, 0, 0, 0, 1000, rate, 0, self.frames,
+                           self._largest, 0xFFFFFFFF, 0, 0, 0, width, height)
+        strf = struct.pack('<IiiHH4sIiiII', 40, width, height, 1, 24, b'MJPG', width * height * 3, 0, 0, 0, 0)
+        strl = b'strl' + _chunk(b'strh', strh) + _chunk(b'strf', strf)
+        hdrl = b'hdrl' + _chunk(b'avih', avih) + _chunk(b'LIST', strl)
+        # The movi list is left open: its frames follow the header.
+        return (b'RIFF' + struct.pack('<I', riff_size) + b'AVI ' + _chunk(b'LIST', hdrl)
+                + b'LIST' + struct.pack('<I', movi_size) + b'movi')
+
+
+class AnimatedWebPWriter:
+    """Stream frames into an animated WebP.
+
+    Each frame is compressed as a still WebP by the decode workers and its
+    bitstream is wrapped in an ANMF chunk as it arrives, so no frame is
+    held once written. The RIFF size is filled in on close.
+    """
+
+    def __init__(self, path, size, fps, quality=DEFAULT_QUALITY):
+        self.size = size
+        self.fps = fps
+        self.quality = quality
+        self.frames = 0
+        self._file = open(path, 'wb')
+        width, height = size
+        self._file.write(b'RIFF\0\0\0\0WEBP')
+        self._file.write(_chunk(b'VP8X', bytes([0x02, 0, 0, 0]) + _uint24(width - 1) + _uint24(height - 1)))
+        self._file.write(_chunk(b'ANIM', struct.pack('<IH', 0xFF000000, 0)))  # opaque black background, loop forever
+
+    def encode(self, image):
+        """Compress a frame and return its bitstream chunks; called from the decode workers."""
+        output = io.BytesIO()
+        image.save(output, format='WEBP', quality=self.quality)
+        data = output.getvalue()
+        chunks, position = [], 12
+        while position + 8 <= len(data):
+            fourcc, length = data[position:position + 4], struct.unpack_from('<I', data, position + 4)[0]
+            end = position + 8 + length + (length & 1)
+            if fourcc in WEBP_FRAME_CHUNKS:
+                chunks.append(data[position:end])
+            position = end
+        return b''.join(chunks)
+
+    def write(self, frame):
+        width, height = self.size
+        # Rounded so that fractional frame durations do not add up to drift.
+        duration = round((self.frames + 1) * 1000 / self.fps) - round(self.frames * 1000 / self.fps)
+        anmf = _chunk(b'ANMF', _uint24(0) + _uint24(0) + _uint24(width - 1) + _uint24(height - 1)
+                      + _uint24(duration) + bytes([ANMF_NO_BLEND]) + frame)
+        if self._file.tell() + len(anmf) > MAX_RIFF_BYTES:
+            raise ValueError("the timelapse would exceed 4 GB; export a shorter range or a smaller size")
+        self._file.write(anmf)
+        self.frames += 1
+
+    def close(self):
+        size = self._file.tell()
+        self._file.seek(4)
+        self._file.write(struct.pack('<I', size - 8))
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+
+
+WRITERS = {TIMELAPSE_AVI: MjpegAviWriter, TIMELAPSE_WEBP: AnimatedWebPWriter}
+
+
+def timelapse_format(path):
+    """Return the timelapse format for an output path, from its extension."""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension not in TIMELAPSE_FORMATS:
+        raise ValueError(f"unsupported timelapse format '{extension}', use .avi or .webp")
+    return extension
+
+
+def timelapse_frames(catalog, monitor, start=None, end=None):
+    """Yield (path, offset, format) for every capture of a monitor in [start, end), or None for an unchanged one."""
+    for row in catalog.frames(start, end, monitor):
+        if row['format'] == SAME_AS_PREVIOUS:
+            yield None
+        else:
+            yield catalog.absolute_path(row['path']), row['offset'], row['format']
+
+
+def video_size(width, height, max_width):
+    """Scale a capture down to at most max_width, keeping even dimensions as video decoders expect."""
+    scale = min(1.0, max_width / width)
+    return max(2, round(width * scale / 2) * 2), max(2, round(height * scale / 2) * 2)
+
+
+def read_ahead(function, items, workers, ahead):
+    """Like Executor.map, in order, but with at most `ahead` items in flight."""
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='timelapse') as executor:
+        pending = deque()
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def export_timelapse(root, output, monitor, start=None, end=None, fps=DEFAULT_FPS, width=DEFAULT_WIDTH,
+                     quality=DEFAULT_QUALITY, workers=DEFAULT_WORKERS, on_progress=None, cancel=None):
+    """Stream a monitor's captures in [start, end) from an output folder into a timelapse; returns the frame count.
+
+    Frames are decoded, scaled and compressed by `workers` threads a few
+    frames ahead of the writer, one video frame per capture; an unchanged
+    capture repeats the previous frame. Memory use does not depend on the
+    number of frames. The output is written next to `output` and only
+    renamed into place once complete. on_progress(frames written) is
+    called after every frame; if the `cancel` event is set, the partial
+    output is removed and None is returned.
+    """
+    writer_class = WRITERS[timelapse_format(output)]
+    catalog = Catalog(root)
+    try:
+        if not os.path.exists(os.path.join(root, CATALOG_FILE)):
+            catalog.rebuild()
+        first = next((row for row in catalog.frames(start, end, monitor) if row['format'] != SAME_AS_PREVIOUS), None)
+        if first is None:
+            return 0
+        loader = FrameLoader()
+        path, offset, image_format = catalog.absolute_path(first['path']), first['offset'], first['format']
+        if first['width'] and first['height']:
+            capture_size = first['width'], first['height']
+        else:
+            capture_size = loader.load(path, offset, image_format).size
+        size = video_size(*capture_size, width)
+        partial = f"{output}.{threading.get_ident()}.part"
+        writer = writer_class(partial, size, fps, quality)
+
+        def render(frame):
+            if frame is None:
+                return None
+            image = loader.load(*frame, size=size)
+            if abs(image.width - size[0]) <= 2 and abs(image.height - size[1]) <= 2:
+                if image.size != size:
+                    image = image.resize(size, Image.BILINEAR)  # off by the rounding to even dimensions
+            else:
+                # A capture of another shape (e.g. after a resolution change) is letterboxed.
+                canvas = Image.new('RGB', size)
+                image.thumbnail(size, Image.BILINEAR)
+                canvas.paste(image, ((size[0] - image.width) // 2, (size[1] - image.height) // 2))
+                image = canvas
+            return writer.encode(image)
+
+        try:
+            previous = None
+            frames = read_ahead(render, timelapse_frames(catalog, monitor, start, end), workers,
+                                workers * READ_AHEAD_PER_WORKER)
+            for encoded in frames:
+                if cancel is not None and cancel.is_set():
+                    frames.close()
+                    writer.abort()
+                    os.remove(partial)
+                    return None
+                previous = encoded if encoded is not None else previous
+                if previous is None:
+                    continue  # an unchanged capture before any frame of the range
+                writer.write(previous)
+                if on_progress:
+                    on_progress(writer.frames)
+            writer.close()
+        except BaseException:
+            writer.abort()
+            os.remove(partial)
+            raise
+        os.replace(partial, output)
+        return writer.frames
+    finally:
+        catalog.close()
+
+
+def parse_time(text):
+    """Parse YYYY-MM-DD[ HH:MM[:SS]]."""
+    return datetime.datetime.fromisoformat(text)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export Screen Tracker captures as a timelapse video (.avi or .webp)")
+    parser.add_argument('folder', help="the output folder the screenshots were saved to")
+    parser.add_argument('output', help="the video to write; .avi for Motion JPEG, .webp for animated WebP")
+    parser.add_argument('--monitor', type=int, default=1)
+    parser.add_argument('--day', type=parse_time, help="YYYY-MM-DD; the whole day")
+    parser.add_argument('--from', dest='start', type=parse_time, help="YYYY-MM-DD[ HH:MM[:SS]]")
+    parser.add_argument('--to', dest='end', type=parse_time, help="YYYY-MM-DD[ HH:MM[:SS]], exclusive")
+    parser.add_argument('--fps', type=float, default=DEFAULT_FPS)
+    parser.add_argument('--width', type=int, default=DEFAULT_WIDTH, help="maximum video width")
+    parser.add_argument('--quality', type=int, default=DEFAULT_QUALITY)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args(argv)
+    if args.day:
+        args.start, args.end = args.day, args.day + datetime.timedelta(days=1)
+
+    started = time.perf_counter()
+    try:
+        count = export_timelapse(args.folder, args.output, args.monitor, args.start, args.end, args.fps, args.width,
+                                 args.quality, args.workers)
+    except (OSError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    if not count:
+        print("Nothing was captured on that monitor in that time range.")
+        return 1
+    print(f"Wrote {count} frames to {args.output} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
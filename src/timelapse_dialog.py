@@ -0,0 +1,157 @@
+import os
+import datetime
+import threading
+from PyQt5.QtWidgets import (QDialog, QFormLayout, QVBoxLayout, QComboBox, QDateTimeEdit, QSpinBox,
+                             QProgressBar, QDialogButtonBox, QPushButton, QFileDialog, QMessageBox)
+from PyQt5.QtCore import QObject, QDateTime, QTimer, pyqtSignal
+from catalog import Catalog, CATALOG_FILE
+from screenshot_browser import rebuild_catalog
+from encoders import webp_supported
+from timelapse import export_timelapse, TIMELAPSE_FORMATS, TIMELAPSE_WEBP, DEFAULT_FPS, DEFAULT_WIDTH
+
+
+class TimelapseSignals(QObject):
+    """Qt signals used to report export progress back to the GUI thread."""
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+
+class TimelapseDialog(QDialog):
+    """Export one monitor's captures over a time range as a timelapse video, in the background."""
+
+    def __init__(self, root, tr, parent=None):
+        super().__init__(parent)
+        self.root = root
+        self.tr = tr
+        self.thread = None
+        self.cancel = threading.Event()
+        self.signals = TimelapseSignals()
+        self.signals.progress.connect(self.on_progress)
+        self.signals.finished.connect(self.on_finished)
+        self.signals.failed.connect(self.on_failed)
+
+        self.setWindowTitle(self.tr("export_timelapse"))
+        layout = QVBoxLayout(self)
+        form = QFormLayout()
+        self.monitorComboBox = QComboBox()
+        form.addRow(self.tr("monitor"), self.monitorComboBox)
+        self.fromEdit = QDateTimeEdit()
+        self.fromEdit.setCalendarPopup(True)
+        form.addRow(self.tr("timelapse_from"), self.fromEdit)
+        self.toEdit = QDateTimeEdit()
+        self.toEdit.setCalendarPopup(True)
+        form.addRow(self.tr("timelapse_to"), self.toEdit)
+        self.fpsSpinBox = QSpinBox()
+        self.fpsSpinBox.setRange(1, 60)
+        self.fpsSpinBox.setValue(DEFAULT_FPS)
+        form.addRow(self.tr("timelapse_fps"), self.fpsSpinBox)
+        self.widthSpinBox = QSpinBox()
+        self.widthSpinBox.setRange(320, 3840)
+        self.widthSpinBox.setSingleStep(160)
+        self.widthSpinBox.setValue(DEFAULT_WIDTH)
+        form.addRow(self.tr("timelapse_width"), self.widthSpinBox)
+        self.formatComboBox = QComboBox()
+        for timelapse_format in TIMELAPSE_FORMATS:
+            if timelapse_format == TIMELAPSE_WEBP and not webp_supported():
+                continue
+            self.formatComboBox.addItem(self.tr(f"timelapse_format_{timelapse_format}"), timelapse_format)
+        form.addRow(self.tr("timelapse_format"), self.formatComboBox)
+        layout.addLayout(form)
+
+        self.progressBar = QProgressBar()
+        layout.addWidget(self.progressBar)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        self.exportButton = QPushButton(self.tr("export_timelapse"))
+        self.exportButton.clicked.connect(self.export)
+        buttons.addButton(self.exportButton, QDialogButtonBox.ActionRole)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+        if os.path.exists(os.path.join(self.root, CATALOG_FILE)):
+            self.load_range()
+        else:
+            # Once the dialog is shown, so that indexing the folder can show its progress over it.
+            QTimer.singleShot(0, self.load_range)
+
+    def load_range(self):
+        """List the captured monitors and preselect the most recent day."""
+        catalog = Catalog(self.root)
+        try:
+            if not os.path.exists(os.path.join(self.root, CATALOG_FILE)):
+                if not rebuild_catalog(catalog, self.tr, self):
+                    self.reject()
+                    return
+            for monitor in catalog.monitors():
+                self.monitorComboBox.addItem(f"{self.tr('monitor')} {monitor}", monitor)
+            days = catalog.days()
+        finally:
+            catalog.close()
+        day = datetime.datetime.strptime(days[-1][0], "%Y-%m-%d") if days else datetime.datetime.combine(
+            datetime.date.today(), datetime.time())
+        self.fromEdit.setDateTime(QDateTime(day))
+        self.toEdit.setDateTime(QDateTime(day + datetime.timedelta(days=1)))
+
+    def export(self):
+        """Ask where to save the video and export it on a background thread."""
+        monitor = self.monitorComboBox.currentData()
+        start = self.fromEdit.dateTime().toPyDateTime()
+        end = self.toEdit.dateTime().toPyDateTime()
+        if monitor is None or end <= start:
+            QMessageBox.warning(self, self.tr("export_timelapse"), self.tr("no_frames_in_range"))
+            return
+        timelapse_format = self.formatComboBox.currentData()
+        suggested = os.path.join(self.root, f"timelapse_{monitor}_{start:%Y-%m-%d_%H-%M}.{timelapse_format}")
+        output, _ = QFileDialog.getSaveFileName(self, self.tr("export_timelapse"), suggested,
+                                                f"{self.formatComboBox.currentText()} (*.{timelapse_format})")
+        if not output:
+            return
+        if not output.lower().endswith('.' + timelapse_format):
+            output += '.' + timelapse_format
+        catalog = Catalog(self.root)
+        try:
+            total = catalog.count(start, end, monitor)
+        finally:
+            catalog.close()
+        self.progressBar.setRange(0, max(total, 1))
+        self.progressBar.setValue(0)
+        self.exportButton.setEnabled(False)
+        self.cancel.clear()
+        self.thread = threading.Thread(target=self.run_export, name="timelapse", daemon=True,
+                                       args=(output, monitor, start, end, self.fpsSpinBox.value(),
+                                             self.widthSpinBox.value()))
+        self.thread.start()
+
+    def run_export(self, output, monitor, start, end, fps, width):
+        try:
+            frames = export_timelapse(self.root, output, monitor, start, end, fps, width,
+                                      on_progress=self.signals.progress.emit, cancel=self.cancel)
+            self.signals.finished.emit((output, frames))
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+
+    def on_progress(self, frames):
+        self.progressBar.setValue(frames)
+
+    def on_finished(self, result):
+        output, frames = result
+        self.exportButton.setEnabled(True)
+        if frames is None:
+            return  # cancelled
+        if not frames:
+            QMessageBox.warning(self, self.tr("export_timelapse"), self.tr("no_frames_in_range"))
+            return
+        self.progressBar.setValue(self.progressBar.maximum())
+        QMessageBox.information(self, self.tr("export_timelapse"),
+                                f"{self.tr('timelapse_exported')}: {frames}\n{output}")
+
+    def on_failed(self, message):
+        self.exportButton.setEnabled(True)
+        QMessageBox.warning(self, self.tr("export_timelapse"), message)
+
+    def done(self, result):
+        # Closing the dialog cancels an export in progress; its partial file is removed.
+        self.cancel.set()
+        if self.thread is not None:
+            self.thread.join()
+        super().done(result)
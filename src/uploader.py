@@ -0,0 +1,532 @@
+import os
+import json
+import time
+import socket
+import zipfile
+import threading
+import http.client
+import urllib.parse
+from storage import SAME_AS_PREVIOUS, DATE_FOLDER_FORMAT
+from metrics import Metrics
+
+# Constants
+OUTBOX_FOLDER = 'outbox'
+JOURNAL_FILE = 'pending.jsonl'
+BATCH_EXTENSION = '.jsonl'
+BUNDLE_EXTENSION = '.zip'
+MANIFEST_NAME = 'manifest.json'
+HOST_HEADER = 'X-ScreenTracker-Host'
+FRAMES_HEADER = 'X-ScreenTracker-Frames'
+BUNDLE_PATH = '/bundles/'
+# Frames in these formats are compressed already and are stored in a bundle as they are; anything else is deflated
+COMPRESSED_FORMATS = ('PNG', 'JPEG', 'WEBP')
+SEND_CHUNK = 64 * 1024
+BYTES_PER_MB = 1024 ** 2
+BYTES_PER_KB = 1024
+
+# Defaults
+DEFAULT_BUNDLE_FRAMES = 100
+DEFAULT_BUNDLE_MB = 16
+DEFAULT_BUNDLE_SECONDS = 60
+DEFAULT_CONCURRENCY = 2
+MAX_CONCURRENCY = 16
+# 0 means unlimited
+DEFAULT_RATE_LIMIT_KBPS = 0
+DEFAULT_MAX_OUTBOX_MB = 1024
+DEFAULT_TIMEOUT = 30.0
+# How often the bundler looks for frames that are due, and idle senders for bundles
+CHECK_INTERVAL = 1.0
+# Seconds a sender waits after consecutive failures
+RETRY_DELAYS = (1, 2, 5, 15, 30, 60)
+
+
+def bundle_id():
+    """A new bundle name: sorts by creation time and does not repeat after a restart."""
+    return f"{time.time_ns() // 1000000:013d}-{os.urandom(4).hex()}"
+
+
+class RateLimiter:
+    """Token bucket shared by the upload threads, in bytes per second; a rate of 0 means unlimited."""
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def configure(self, rate):
+        with self._lock:
+            self.rate = rate
+
+    def acquire(self, amount):
+        """Take `amount` bytes from the bucket, sleeping until the rate allows them."""
+        with self._lock:
+            if not self.rate:
+                return
+            now = time.monotonic()
+            # At most a second's worth of bytes builds up while nothing is sent.
+            self._tokens = min(max(self.rate, SEND_CHUNK), self._tokens + (now - self._last) * self.rate) - amount
+            self._last = now
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class ConnectionPool:
+    """Keep-alive connections to the collector, reused from one bundle to the next by the upload threads."""
+
+    def __init__(self, url, size=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT):
+        parts = urllib.parse.urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError(f"not an http(s) URL: {url}")
+        self.url = url
+        self.https = parts.scheme == 'https'
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path.rstrip('/')
+        self.size = size
+        self.timeout = timeout
+        self.opened = 0
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Return an idle connection, or a new one if all of them are in use."""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+            self.opened += 1
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def put(self, connection, reusable=True):
+        """Hand a connection back; one the server is closing, or one too many, is closed."""
+        with self._lock:
+            if reusable and len(self._idle) < self.size:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+
+class Outbox:
+    """Frames of one output folder waiting to be uploaded, kept on disk so that uploading resumes after a restart.
+
+    The writer appends each saved frame to a journal. When the batch is
+    due, the journal is renamed to a batch of its own, which is then
+    packed into a zip bundle of the frames' bytes and a manifest of their
+    metadata. Bundles are deleted once the collector accepted them.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.folder = os.path.join(root, OUTBOX_FOLDER)
+        self.journal = os.path.join(self.folder, JOURNAL_FILE)
+        self._frames = 0
+        self._bytes = 0
+        self._first = None
+        self._lock = threading.Lock()
+        # Frames journaled before a restart go out with the next batch.
+        try:
+            with open(self.journal, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        self._frames += 1
+                        try:
+                            self._bytes += json.loads(line).get('size') or 0
+                        except ValueError:
+                            pass  # a line cut short by a crash; packing skips it
+        except FileNotFoundError:
+            pass
+        if self._frames:
+            self._first = time.monotonic()
+
+    def add(self, record):
+        """Journal a SavedFrame (writer thread)."""
+        line = json.dumps({'timestamp': record.timestamp.isoformat(), 'day': record.timestamp.strftime(DATE_FOLDER_FORMAT),
+                           'monitor': record.monitor, 'path': os.path.relpath(record.path, self.root).replace(os.sep, '/'),
+                           'offset': record.offset, 'size': record.size, 'format': record.format,
+                           'width': record.width, 'height': record.height, 'content_hash': record.content_hash,
+                           'perceptual_hash': record.perceptual_hash}) + '\n'
+        with self._lock:
+            if self._first is None:
+                os.makedirs(self.folder, exist_ok=True)
+                self._first = time.monotonic()
+            with open(self.journal, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self._frames += 1
+            self._bytes += record.size or 0
+
+    def due(self, frames, size, seconds):
+        """Whether the journal holds enough frames or bytes, or its oldest frame waited long enough."""
+        with self._lock:
+            return bool(self._frames) and (self._frames >= frames or self._bytes >= size
+                                           or time.monotonic() - self._first >= seconds)
+
+    def seal(self):
+        """Close the journal as a batch of its own; later frames start a new one."""
+        with self._lock:
+            if not self._frames:
+                return
+            os.replace(self.journal, os.path.join(self.folder, bundle_id() + BATCH_EXTENSION))
+            self._frames = self._bytes = 0
+            self._first = None
+
+    def pack(self, host):
+        """Write a bundle for every sealed batch, yielding (frames, bytes) as each one is written."""
+        try:
+            names = sorted(os.listdir(self.folder))
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.endswith(BATCH_EXTENSION) and name != JOURNAL_FILE:
+                yield self._pack_batch(name[:-len(BATCH_EXTENSION)], host)
+
+    def _pack_batch(self, name, host):
+        batch = os.path.join(self.folder, name + BATCH_EXTENSION)
+        path = os.path.join(self.folder, name + BUNDLE_EXTENSION)
+        frames = []
+        with open(batch, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    frames.append(json.loads(line))
+                except ValueError:
+                    continue
+        temporary = path + '.tmp'
+        with zipfile.ZipFile(temporary, 'w') as bundle:
+            for number, frame in enumerate(frames):
+                data = self._read(frame)
+                frame['entry'] = None
+                if data is not None:
+                    frame['entry'] = f"frames/{number:05d}.{frame['format'].lower()}"
+                    compression = zipfile.ZIP_STORED if frame['format'] in COMPRESSED_FORMATS else zipfile.ZIP_DEFLATED
+                    bundle.writestr(frame['entry'], data, compression)
+            bundle.writestr(MANIFEST_NAME, json.dumps({'id': name, 'host': host, 'frames': frames}),
+                            zipfile.ZIP_DEFLATED)
+        # If a crash leaves both behind, the batch is packed again into the same bundle.
+        os.replace(temporary, path)
+        os.remove(batch)
+        return len(frames), os.path.getsize(path)
+
+    def _read(self, frame):
+        """The stored bytes of a frame; None for a duplicate entry or a file deleted in the meantime."""
+        if frame['format'] == SAME_AS_PREVIOUS or not frame['size']:
+            return None
+        try:
+            with open(os.path.join(self.root, frame['path']), 'rb') as f:
+                f.seek(frame['offset'] or 0)
+                return f.read(frame['size'])
+        except FileNotFoundError:
+            frame['missing'] = True
+            return None
+
+    def bundles(self):
+        """Paths of the bundles waiting to be sent, oldest first."""
+        try:
+            return [os.path.join(self.folder, name) for name in sorted(os.listdir(self.folder))
+                    if name.endswith(BUNDLE_EXTENSION)]
+        except FileNotFoundError:
+            return []
+
+    def trim(self, max_bytes, keep=()):
+        """Delete the oldest bundles while the outbox is larger than max_bytes; returns how many were deleted."""
+        bundles = []
+        for path in self.bundles():
+            try:
+                bundles.append((path, os.path.getsize(path)))
+            except FileNotFoundError:
+                pass  # uploaded meanwhile
+        total = sum(size for _, size in bundles)
+        deleted = 0
+        for path, size in bundles:
+            if total <= max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+                deleted += 1
+            except FileNotFoundError:
+                pass
+            total -= size
+        return deleted
+
+    def pending(self):
+        """Frames in the journal, bundles waiting and their bytes."""
+        bundles = self.bundles()
+        with self._lock:
+            frames = self._frames
+        return {'frames': frames, 'bundles': len(bundles), 'bytes': sum(map(os.path.getsize, bundles))}
+
+
+class Uploader:
+    """Capture-engine sink that uploads every written frame to a collector, for fleets of workstations.
+
+    Frames are journaled per output folder (see Outbox) and bundled on a
+    background thread once `bundle_frames` frames or `bundle_mb` MB are
+    waiting, or the oldest has waited `bundle_seconds`. Up to `concurrency`
+    threads PUT the bundles, oldest first, to <url>/bundles/<id> over
+    keep-alive connections, within `rate_limit_kbps` together. A bundle is
+    deleted once the collector accepted it and retried with a growing delay
+    otherwise; as the id is part of the URL, sending it twice is harmless.
+    The outbox is capped at `max_outbox_mb` by dropping the oldest bundles.
+    """
+
+    def __init__(self, metrics=None, on_error=None):
+        self.metrics = metrics or Metrics()
+        self.on_error = on_error
+        self.url = None
+        self.token = None
+        self.host = socket.gethostname()
+        self.bundle_frames = DEFAULT_BUNDLE_FRAMES
+        self.bundle_bytes = DEFAULT_BUNDLE_MB * BYTES_PER_MB
+        self.bundle_seconds = DEFAULT_BUNDLE_SECONDS
+        self.concurrency = DEFAULT_CONCURRENCY
+        self.max_outbox_bytes = DEFAULT_MAX_OUTBOX_MB * BYTES_PER_MB
+        self.limiter = RateLimiter()
+        self.pool = None
+        self.last_error = None
+        self._outboxes = {}
+        self._claimed = set()
+        self._senders = []
+        self._in_flight = 0
+        self._busy_since = None
+        self._totals = {'frames': 0, 'bytes': 0, 'seconds': 0.0}
+        self._lock = threading.Lock()
+        # Idle senders wait on it for the next bundle.
+        self._bundled = threading.Condition(self._lock)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._bundler = None
+
+    def configure(self, settings, output_folder=None):
+        """Apply the 'upload' settings; without a url nothing is queued. Raises ValueError for an invalid url."""
+        url = settings.get('url') or None
+        with self._lock:
+            self.token = settings.get('token') or None
+            self.host = settings.get('host') or socket.gethostname()
+            self.bundle_frames = max(1, int(settings.get('bundle_frames', DEFAULT_BUNDLE_FRAMES)))
+            self.bundle_bytes = float(settings.get('bundle_mb', DEFAULT_BUNDLE_MB)) * BYTES_PER_MB
+            self.bundle_seconds = float(settings.get('bundle_seconds', DEFAULT_BUNDLE_SECONDS))
+            self.concurrency = min(MAX_CONCURRENCY, max(1, int(settings.get('concurrency', DEFAULT_CONCURRENCY))))
+            self.max_outbox_bytes = float(settings.get('max_outbox_mb', DEFAULT_MAX_OUTBOX_MB)) * BYTES_PER_MB
+            self.limiter.configure(float(settings.get('rate_limit_kbps', DEFAULT_RATE_LIMIT_KBPS)) * BYTES_PER_KB)
+            if url != self.url or (self.pool and self.pool.size != self.concurrency):
+                previous, self.pool, self.url = self.pool, None, None
+                if previous:
+                    previous.close()
+                if url:
+                    self.pool = ConnectionPool(url, self.concurrency)
+                    self.url = url
+        if self.url and output_folder:
+            # Bundles left over from an earlier run are sent as well.
+            self.outbox(output_folder)
+        if self._bundler is not None:
+            self._start_senders()
+
+    def outbox(self, root):
+        """Return the outbox of an output folder."""
+        with self._lock:
+            if root not in self._outboxes:
+                self._outboxes[root] = Outbox(root)
+            return self._outboxes[root]
+
+    def start(self):
+        if self._bundler is None:
+            self._stop.clear()
+            self._bundler = threading.Thread(target=self._bundle_loop, name="upload-bundler", daemon=True)
+            self._bundler.start()
+            self._start_senders()
+
+    def stop(self, timeout=5.0):
+        """Stop the threads; whatever was not sent yet stays in the outboxes."""
+        self._stop.set()
+        self._wake.set()
+        with self._lock:
+            self._bundled.notify_all()
+        threads = [self._bundler] + self._senders if self._bundler else []
+        for thread in threads:
+            thread.join(timeout)
+        self._bundler = None
+        self._senders = []
+        if self.pool:
+            self.pool.close()
+
+    def add(self, job, record):
+        if self.url:
+            self.outbox(job.output_folder).add(record)
+
+    def flush(self):
+        pass  # the bundler decides when a batch is due
+
+    def close(self):
+        # The writer stops: bundle what it wrote without waiting for the batch to fill up.
+        self._wake.set()
+
+    def status(self):
+        """Return what is waiting and what was sent, as a JSON-serializable dict."""
+        with self._lock:
+            outboxes = list(self._outboxes.values())
+            totals = dict(self._totals)
+            if self._busy_since is not None:
+                totals['seconds'] += time.monotonic() - self._busy_since
+        pending = [outbox.pending() for outbox in outboxes]
+        return {
+            'enabled': bool(self.url),
+            'pending_frames': sum(p['frames'] for p in pending),
+            'pending_bundles': sum(p['bundles'] for p in pending),
+            'outbox_bytes': sum(p['bytes'] for p in pending),
+            'uploaded_frames': totals['frames'],
+            'uploaded_bytes': totals['bytes'],
+            # Throughput while at least one bundle was being sent
+            'frames_per_second': totals['frames'] / totals['seconds'] if totals['seconds'] else None,
+            'bytes_per_frame': totals['bytes'] / totals['frames'] if totals['frames'] else None,
+            'connections_opened': self.pool.opened if self.pool else 0,
+            'last_error': self.last_error,
+        }
+
+    def _report(self, message):
+        self.last_error = message
+        if self.on_error:
+            self.on_error(message)
+
+    def _bundle_loop(self):
+        while not self._stop.is_set():
+            forced = self._wake.wait(CHECK_INTERVAL)
+            self._wake.clear()
+            with self._lock:
+                outboxes = list(self._outboxes.values())
+                limits = (self.bundle_frames, self.bundle_bytes, self.bundle_seconds)
+                host, max_outbox_bytes = self.host, self.max_outbox_bytes
+            for outbox in outboxes:
+                try:
+                    if forced or outbox.due(*limits):
+                        outbox.seal()
+                    started = time.perf_counter()
+                    for frames, size in outbox.pack(host):
+                        self.metrics.observe('bundle', time.perf_counter() - started)
+                        self.metrics.add('bundled_frames', frames)
+                        with self._lock:
+                            self._bundled.notify()
+                        started = time.perf_counter()
+                    with self._lock:
+                        # Held while trimming, so that no sender claims a bundle that is being deleted.
+                        dropped = outbox.trim(max_outbox_bytes, self._claimed)
+                    if dropped:
+                        self._report(f"upload: outbox of {outbox.root} is full, dropped the {dropped} oldest bundles")
+                except Exception as e:
+                    # One outbox that cannot be bundled must not stop the others.
+                    self._report(f"upload: {e}")
+
+    def _start_senders(self):
+        with self._lock:
+            self._senders = [thread for thread in self._senders if thread.is_alive()]
+            for index in range(len(self._senders), self.concurrency):
+                thread = threading.Thread(target=self._send_loop, args=(index,), name=f"upload-{index}", daemon=True)
+                self._senders.append(thread)
+                thread.start()
+
+    def _claim(self):
+        # Called with the lock held.
+        for outbox in self._outboxes.values():
+            for path in outbox.bundles():
+                if path not in self._claimed:
+                    self._claimed.add(path)
+                    return path
+        return None
+
+    def _send_loop(self, index):
+        failures = 0
+        while not self._stop.is_set():
+            with self._lock:
+                if index >= self.concurrency:
+                    return  # concurrency was lowered
+                pool = self.pool
+                path = self._claim() if pool else None
+                if path is None:
+                    self._bundled.wait(CHECK_INTERVAL)
+                    continue
+            try:
+                self._upload(pool, path)
+                failures = 0
+            except Exception as e:
+                # Reported and retried: a sender thread that died would stop the uploads until the next configure.
+                self._report(f"upload: {e}")
+                failures += 1
+            finally:
+                with self._lock:
+                    self._claimed.discard(path)
+            if failures:
+                self._stop.wait(RETRY_DELAYS[min(failures, len(RETRY_DELAYS)) - 1])
+
+    def _upload(self, pool, path):
+        try:
+            with zipfile.ZipFile(path) as bundle:
+                frames = len(json.loads(bundle.read(MANIFEST_NAME))['frames'])
+        except FileNotFoundError:
+            return  # already gone, e.g. dropped from a full outbox
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile) as e:
+            # Nothing will make a damaged bundle readable; it is dropped.
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            raise RuntimeError(f"dropped unreadable bundle {os.path.basename(path)}: {e}")
+        size = os.path.getsize(path)
+        with self._lock:
+            self._in_flight += 1
+            if self._busy_since is None:
+                self._busy_since = time.monotonic()
+        started = time.perf_counter()
+        try:
+            self._put(pool, os.path.basename(path)[:-len(BUNDLE_EXTENSION)], path, size, frames)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                if not self._in_flight:
+                    self._totals['seconds'] += time.monotonic() - self._busy_since
+                    self._busy_since = None
+        self.metrics.observe('upload', time.perf_counter() - started)
+        self.metrics.add('uploaded_frames', frames)
+        self.metrics.add('uploaded_bytes', size)
+        with self._lock:
+            self._totals['frames'] += frames
+            self._totals['bytes'] += size
+        self.last_error = None
+
+    def _put(self, pool, name, path, size, frames):
+        """Send one bundle; raises ConnectionError if the collector cannot be reached, RuntimeError if it refuses."""
+        connection = pool.get()
+        reusable = False
+        try:
+            connection.putrequest('PUT', f"{pool.path}{BUNDLE_PATH}{name}")
+            connection.putheader('Content-Type', 'application/zip')
+            connection.putheader('Content-Length', str(size))
+            connection.putheader(HOST_HEADER, self.host)
+            connection.putheader(FRAMES_HEADER, str(frames))
+            if self.token:
+                connection.putheader('Authorization', f"Bearer {self.token}")
+            connection.endheaders()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(SEND_CHUNK), b''):
+                    self.limiter.acquire(len(chunk))
+                    connection.send(chunk)
+            response = connection.getresponse()
+            body = response.read()
+            reusable = not response.will_close
+        except (OSError, http.client.HTTPException) as e:
+            raise ConnectionError(f"cannot reach {pool.url}: {e}") from e
+        finally:
+            pool.put(connection, reusable)
+        if not 200 <= response.status < 300:
+            raise RuntimeError(f"{pool.url} refused bundle {name}: {response.status} "
+                               f"{body.decode('utf-8', 'replace').strip()[:200]}")